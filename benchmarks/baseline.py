@@ -0,0 +1,115 @@
+# Runs the time_ benchmarks without asv and compares them with the stored baseline.json, so a
+# regression shows up as a failing run (and a baseline diff) in review:
+#   python -m benchmarks.baseline            # compare, exit 1 if anything is factor x slower
+#   python -m benchmarks.baseline --update   # re-record the baseline on this machine
+# Timings depend on the machine; the baseline records where it was taken and a comparison
+# on another machine only warns.
+import argparse
+import importlib
+import inspect
+import itertools
+import json
+import os
+import platform
+import sys
+import timeit
+import numpy as np
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+MODULES = ("functions", "polarized_sources")
+
+
+def machine() -> dict:
+    return {
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "python": platform.python_version(),
+        "numpy": np.__version__
+    }
+
+
+def _parameter_sets(benchmark_class) -> list:
+    params = getattr(benchmark_class, "params", None)
+    if params is None:
+        return [()]
+    # asv takes a single list for one parameter and a tuple of lists for several
+    if not isinstance(params, tuple):
+        params = (params, )
+    return list(itertools.product(*params))
+
+
+def benchmarks(name_filter: str = "") -> list:
+    found = []
+    for module_name in MODULES:
+        module = importlib.import_module("benchmarks." + module_name)
+        for class_name, benchmark_class in inspect.getmembers(module, inspect.isclass):
+            if benchmark_class.__module__ != module.__name__:
+                continue
+            for method_name in sorted(vars(benchmark_class)):
+                if not method_name.startswith("time_"):
+                    continue
+                for params in _parameter_sets(benchmark_class):
+                    name = "{0}.{1}.{2}({3})".format(
+                        module_name, class_name, method_name, ", ".join(str(p) for p in params)
+                    )
+                    if name_filter in name:
+                        found.append((name, benchmark_class, method_name, params))
+    return found
+
+
+def run_benchmark(benchmark_class, method_name: str, params: tuple, repeat: int = 5) -> float:
+    # Best time per call, as asv reports it
+    instance = benchmark_class()
+    if hasattr(instance, "setup"):
+        instance.setup(*params)
+    method = getattr(instance, method_name)
+    timer = timeit.Timer(lambda: method(*params))
+    try:
+        number, _ = timer.autorange()
+        return min(timer.repeat(repeat=repeat, number=number)) / number
+    finally:
+        if hasattr(instance, "teardown"):
+            instance.teardown(*params)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the benchmarks against the baseline")
+    parser.add_argument("--update", action="store_true", help="Record a new baseline")
+    parser.add_argument("--factor", type=float, default=2.0, help="Slowdown counted as regression")
+    parser.add_argument("--filter", default="", help="Only benchmarks whose name contains this")
+    arguments = parser.parse_args(argv)
+
+    baseline = {"machine": {}, "results": {}}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as baseline_file:
+            baseline = json.load(baseline_file)
+    same_machine = baseline["machine"] == machine()
+
+    results = {}
+    regressions = []
+    for name, benchmark_class, method_name, params in benchmarks(arguments.filter):
+        results[name] = run_benchmark(benchmark_class, method_name, params)
+        reference = baseline["results"].get(name)
+        ratio = results[name] / reference if reference else float("nan")
+        flag = ""
+        if ratio > arguments.factor:
+            flag = "REGRESSION"
+            regressions.append(name)
+        print("{0:<90} {1:>12.3e} s {2:>8.2f}x {3}".format(name, results[name], ratio, flag))
+
+    if arguments.update:
+        baseline["machine"] = machine()
+        baseline["results"].update(results)
+        with open(BASELINE_FILE, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print("Baseline written to " + BASELINE_FILE)
+        return 0
+    if regressions and not same_machine:
+        print("The baseline was recorded on another machine; not failing on regressions")
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+# Stand-in for casaplotms: plotms checks its input and writes an empty placeholder file, so
+# plotting steps cost next to nothing in the benchmarks
+import os
+from casatools import read_info
+
+
+def plotms(vis="", plotfile="", overwrite=False, **kwargs):
+    read_info(vis)
+    if plotfile:
+        if os.path.exists(plotfile) and not overwrite:
+            raise RuntimeError("Plot file " + plotfile + " exists")
+        with open(plotfile, "wb"):
+            pass
+    return True
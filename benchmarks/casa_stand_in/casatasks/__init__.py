@@ -0,0 +1,709 @@
+# Pure-numpy stand-in for the casatasks ocarina calls, working on the tables of the casatools
+# stand-in. The solvers use a first-order model of circular feeds (RR, RL, LR, LL) without
+# parallactic angle rotation:
+#   RL_ij = exp(i phi) [(Q + iU) + I (dR_i + conj(dL_j))]
+#   LR_ij = exp(-i phi) [(Q - iU) + I (dL_i + conj(dR_j))]
+# with phi = 2 pi tau nu + X, which is what the synthetic MS of the benchmarks contains. They
+# do the same kind of work as CASA (read the selected rows, average, solve per channel, write a
+# caltable) so timings scale with the MS, but they are not meant to match CASA numerically.
+import os
+import re
+import shutil
+import numpy as np
+from casatools import create_table, read_column, read_info, write_column
+
+CORRELATIONS = ("RR", "RL", "LR", "LL")
+# CORR_TYPE values of RR, RL, LR and LL
+CORR_TYPES = (5, 6, 7, 8)
+DATA_COLUMNS = ("DATA", "MODEL_DATA", "CORRECTED_DATA")
+CALTABLE_SUBTABLES = ("SPECTRAL_WINDOW", "ANTENNA", "FIELD")
+FREQUENCY_UNITS = {"Hz": 1.0, "kHz": 1e3, "MHz": 1e6, "GHz": 1e9}
+TIME_UNITS = {"": 1.0, "s": 1.0, "min": 60.0, "h": 3600.0}
+
+
+def _quantity(value, units: dict) -> float:
+    if not isinstance(value, str):
+        return float(value)
+    match = re.fullmatch(r"\s*([-+0-9.eE]+)\s*([a-zA-Z]*)\s*", value)
+    if match is None or match.group(2) not in units:
+        raise ValueError("Cannot parse quantity " + value)
+    return float(match.group(1)) * units[match.group(2)]
+
+
+def manual_model(
+    frequencies: np.ndarray,
+    fluxdensity: list,
+    spix: list = (),
+    reffreq=1e9,
+    polindex: list = (),
+    polangle: list = ()
+) -> tuple:
+    # Stokes I and Q + iU of setjy(standard='manual'): a curved power law in log10(nu/nu_0),
+    # and polarization fraction and angle (radians) polynomials in (nu - nu_0) / nu_0
+    reffreq = _quantity(reffreq, FREQUENCY_UNITS)
+    log_nu = np.log10(frequencies / reffreq)
+    exponent = np.zeros_like(frequencies, dtype=np.float64)
+    for i, coefficient in enumerate(spix):
+        exponent += coefficient * log_nu**i
+    intensity = fluxdensity[0] * 10.0**(exponent * log_nu)
+    x = (frequencies - reffreq) / reffreq
+    pol_fraction = np.polynomial.polynomial.polyval(x, polindex) if len(polindex) else 0.0 * x
+    pol_angle = np.polynomial.polynomial.polyval(x, polangle) if len(polangle) else 0.0 * x
+    return intensity, pol_fraction * intensity * np.exp(2j * pol_angle)
+
+
+def _names(vis: str, subtable: str) -> np.ndarray:
+    return np.asarray(read_column(os.path.join(vis, subtable), "NAME"))
+
+
+def _selection_ids(selection, names: np.ndarray) -> np.ndarray:
+    # Comma separated names or ids; an empty selection selects everything
+    if selection in ("", None):
+        return np.arange(len(names))
+    ids = []
+    for token in str(selection).split(","):
+        token = token.strip()
+        if token in names:
+            ids.append(int(np.flatnonzero(names == token)[0]))
+        elif token.isdigit():
+            ids.append(int(token))
+        else:
+            raise RuntimeError("Selection " + token + " does not match anything")
+    return np.array(ids)
+
+
+def _spw_ids(spw, n_spw: int) -> np.ndarray:
+    # "0~3", "0,2", "0~3:5~60" or ""; channel selections are ignored by the stand-in
+    if spw in ("", None):
+        return np.arange(n_spw)
+    ids = []
+    for token in str(spw).split(","):
+        token = token.split(":")[0].strip()
+        if "~" in token:
+            first, last = token.split("~")
+            ids.extend(range(int(first), int(last) + 1))
+        elif token:
+            ids.append(int(token))
+    return np.array(ids)
+
+
+def _chan_freqs(vis: str) -> list:
+    return read_column(os.path.join(vis, "SPECTRAL_WINDOW"), "CHAN_FREQ")
+
+
+def _antenna_id(vis: str, refant: str) -> int:
+    if refant == "":
+        return 0
+    return int(_selection_ids(refant.split(",")[0], _names(vis, "ANTENNA"))[0])
+
+
+def _selected_rows(vis: str, field="", spw="") -> np.ndarray:
+    field_ids = _selection_ids(field, _names(vis, "FIELD"))
+    spw_ids = _spw_ids(spw, len(_chan_freqs(vis)))
+    # The stand-in MS has one data description per spw
+    mask = np.isin(read_column(vis, "FIELD_ID"), field_ids)
+    mask &= np.isin(read_column(vis, "DATA_DESC_ID"), spw_ids)
+    return np.flatnonzero(mask)
+
+
+def _read_rows(vis: str, rows: np.ndarray, columns: tuple) -> dict:
+    return {column: np.array(read_column(vis, column)[..., rows]) for column in columns}
+
+
+def _write_rows(vis: str, column: str, rows: np.ndarray, values: np.ndarray):
+    if column in read_info(vis)["columns"]:
+        column_values = np.array(read_column(vis, column, mmap=False))
+    else:
+        column_values = np.array(read_column(vis, "DATA", mmap=False))
+    column_values[..., rows] = values
+    write_column(vis, column, column_values)
+
+
+def _baseline_average(values: np.ndarray, weights: np.ndarray, baselines: np.ndarray, n: int):
+    # Weighted average over rows (last axis) of each baseline; returns (..., n) and weights
+    flat_values = np.moveaxis(values * weights, -1, 0)
+    flat_weights = np.moveaxis(weights, -1, 0).astype(np.float64)
+    sums = np.zeros((n, ) + flat_values.shape[1:], dtype=flat_values.dtype)
+    totals = np.zeros((n, ) + flat_weights.shape[1:])
+    np.add.at(sums, baselines, flat_values)
+    np.add.at(totals, baselines, flat_weights)
+    average = np.where(totals > 0, sums / np.maximum(totals, 1e-30), 0.0)
+    return np.moveaxis(average, 0, -1), np.moveaxis(totals, 0, -1)
+
+
+def _baselines(antenna1: np.ndarray, antenna2: np.ndarray, n_antennas: int) -> tuple:
+    index = antenna1 * n_antennas + antenna2
+    pairs, inverse = np.unique(index, return_inverse=True)
+    return pairs // n_antennas, pairs % n_antennas, inverse
+
+
+def _read_caltable(caltable: str) -> tuple:
+    # Solutions keyed by (spw, antenna), the channel frequencies and the type of the table
+    info = read_info(caltable)
+    param_column = "CPARAM" if "CPARAM" in info["columns"] else "FPARAM"
+    params = read_column(caltable, param_column)
+    flags = read_column(caltable, "FLAG")
+    spw_ids = read_column(caltable, "SPECTRAL_WINDOW_ID")
+    antennas = read_column(caltable, "ANTENNA1")
+    solutions = {}
+    for row in range(info["nrows"]):
+        param = np.where(flags[row], 0.0, params[row]) if param_column == "CPARAM" else params[row]
+        solutions[(int(spw_ids[row]), int(antennas[row]))] = param
+    return solutions, _chan_freqs(caltable), info["keywords"].get("VisCal", "")
+
+
+def _interpolated(
+    solutions: dict, sol_freqs: list, sol_spw: int, frequencies: np.ndarray, n_antennas: int
+) -> np.ndarray:
+    # (antenna, correlation, channel) solutions of one spw on the channels of the data
+    result = None
+    for antenna in range(n_antennas):
+        param = solutions.get((sol_spw, antenna))
+        if param is None:
+            continue
+        if param.shape[-1] == 1:
+            param = np.repeat(param, len(frequencies), axis=-1)
+        elif param.shape[-1] != len(frequencies):
+            # Solved on a pre-averaged MS: interpolated onto the channels of the data
+            param = np.array(
+                [
+                    np.interp(frequencies, sol_freqs[sol_spw], p.real) +
+                    1j * np.interp(frequencies, sol_freqs[sol_spw], p.imag) for p in param
+                ]
+            )
+        if result is None:
+            result = np.zeros((n_antennas, param.shape[0], len(frequencies)), dtype=param.dtype)
+        result[antenna] = param
+    return result
+
+
+def _apply_tables(
+    data: np.ndarray, antenna1: np.ndarray, antenna2: np.ndarray, spw: int, frequencies: np.ndarray,
+    n_antennas: int, gaintable: list, spwmap: list
+) -> np.ndarray:
+    # Corrects (correlation, channel, row) data of one spw with the listed tables, in order
+    data = data.astype(np.complex128)
+    for i, caltable in enumerate(gaintable):
+        if not caltable:
+            continue
+        solutions, sol_freqs, vis_cal = _read_caltable(caltable)
+        sol_spw = spw
+        if i < len(spwmap) and len(spwmap[i]) > spw:
+            sol_spw = spwmap[i][spw]
+        spw_flags = read_column(os.path.join(caltable, "SPECTRAL_WINDOW"), "FLAG_ROW")
+        if spw_flags[sol_spw]:
+            raise RuntimeError(caltable + " has no solutions for spw " + str(sol_spw))
+        sol = _interpolated(solutions, sol_freqs, sol_spw, frequencies, n_antennas)
+        if sol is None:
+            continue
+        if vis_cal == "KCross Jones":
+            # Delays in ns, the same for every antenna
+            phase = np.exp(2j * np.pi * sol[0, 0, 0] * 1e-9 * frequencies)[:, np.newaxis]
+            data[1] /= phase
+            data[2] *= phase
+        elif vis_cal == "D Jones":
+            d_r = sol[:, 0, :]
+            d_l = sol[:, 1, :]
+            intensity = (data[0] + data[3]) / 2.0
+            data[1] -= intensity * (d_r[antenna1] + np.conj(d_l[antenna2])).T
+            data[2] -= intensity * (d_l[antenna1] + np.conj(d_r[antenna2])).T
+        elif vis_cal == "X Jones":
+            x = sol[0, 0, :][:, np.newaxis]
+            data[1] *= np.conj(x)
+            data[2] *= x
+        elif vis_cal == "G Jones":
+            gains = sol[:, :, 0]
+            data[0] /= gains[antenna1, 0] * np.conj(gains[antenna2, 0])
+            data[3] /= gains[antenna1, 1] * np.conj(gains[antenna2, 1])
+            data[1] /= gains[antenna1, 0] * np.conj(gains[antenna2, 1])
+            data[2] /= gains[antenna1, 1] * np.conj(gains[antenna2, 0])
+        else:
+            raise RuntimeError("The stand-in cannot apply " + caltable)
+    return data
+
+
+def _prepared(vis: str, field, spw, gaintable: list, spwmap: list) -> list:
+    # Calibrated data, model, weights and baselines of the selected rows, one entry per spw
+    rows = _selected_rows(vis, field, spw)
+    columns = _read_rows(
+        vis, rows, ("DATA", "MODEL_DATA", "FLAG", "ANTENNA1", "ANTENNA2", "DATA_DESC_ID")
+    )
+    n_antennas = len(_names(vis, "ANTENNA"))
+    chan_freqs = _chan_freqs(vis)
+    prepared = []
+    for spw_id in np.unique(columns["DATA_DESC_ID"]):
+        in_spw = columns["DATA_DESC_ID"] == spw_id
+        antenna1 = columns["ANTENNA1"][in_spw]
+        antenna2 = columns["ANTENNA2"][in_spw]
+        data = _apply_tables(
+            columns["DATA"][..., in_spw], antenna1, antenna2, spw_id, chan_freqs[spw_id],
+            n_antennas, gaintable or [], spwmap or []
+        )
+        prepared.append(
+            {
+                "spw": int(spw_id),
+                "frequencies": chan_freqs[spw_id],
+                "data": data,
+                "model": columns["MODEL_DATA"][..., in_spw],
+                "weights": (~columns["FLAG"][..., in_spw]).astype(np.float64),
+                "antenna1": antenna1,
+                "antenna2": antenna2,
+                "n_antennas": n_antennas
+            }
+        )
+    return prepared
+
+
+def _write_caltable(
+    caltable: str, vis: str, vis_cal: str, param_column: str, solutions: list, time: float
+):
+    # solutions: (field, spw, antenna, refant, param, snr, flag) per row
+    if os.path.exists(caltable):
+        shutil.rmtree(caltable)
+    create_table(
+        caltable,
+        columns={
+            "TIME": np.full(len(solutions), time),
+            "FIELD_ID": np.array([row[0] for row in solutions], dtype=np.int32),
+            "SPECTRAL_WINDOW_ID": np.array([row[1] for row in solutions], dtype=np.int32),
+            "ANTENNA1": np.array([row[2] for row in solutions], dtype=np.int32),
+            "ANTENNA2": np.array([row[3] for row in solutions], dtype=np.int32),
+            "SCAN_NUMBER": np.zeros(len(solutions), dtype=np.int32)
+        },
+        var_columns={
+            param_column: [row[4] for row in solutions],
+            "SNR": [row[5] for row in solutions],
+            "FLAG": [row[6] for row in solutions]
+        },
+        keywords={
+            "VisCal": vis_cal,
+            "MSName": os.path.abspath(vis)
+        }
+    )
+    for subtable in CALTABLE_SUBTABLES:
+        shutil.copytree(os.path.join(vis, subtable), os.path.join(caltable, subtable))
+    # As in CASA, spws without solutions are flagged in the SPECTRAL_WINDOW subtable
+    spectral_window = os.path.join(caltable, "SPECTRAL_WINDOW")
+    solved = np.isin(np.arange(len(_chan_freqs(vis))), [row[1] for row in solutions])
+    write_column(spectral_window, "FLAG_ROW", ~solved)
+
+
+def setjy(
+    vis="",
+    field="",
+    spw="",
+    standard="manual",
+    fluxdensity=(1, 0, 0, 0),
+    spix=(),
+    reffreq="1GHz",
+    polindex=(),
+    polangle=(),
+    **kwargs
+):
+    if standard != "manual":
+        raise RuntimeError("The stand-in only supports standard='manual'")
+    rows = _selected_rows(vis, field, spw)
+    spw_of_row = read_column(vis, "DATA_DESC_ID")[rows]
+    field_of_row = read_column(vis, "FIELD_ID")[rows]
+    chan_freqs = _chan_freqs(vis)
+    model = np.zeros(read_column(vis, "DATA").shape[:2] + (len(rows), ), dtype=np.complex64)
+    result = {}
+    for spw_id in np.unique(spw_of_row):
+        intensity, linear = manual_model(
+            chan_freqs[spw_id], fluxdensity, spix, reffreq, polindex, polangle
+        )
+        in_spw = spw_of_row == spw_id
+        visibilities = np.array([intensity, linear, np.conj(linear), intensity])
+        model[..., in_spw] = visibilities[..., np.newaxis]
+        centre = len(intensity) // 2
+        for field_id in np.unique(field_of_row[in_spw]):
+            result.setdefault(str(field_id), {})[str(spw_id)] = {
+                "fluxd": [intensity[centre], linear[centre].real, linear[centre].imag, 0.0]
+            }
+    _write_rows(vis, "MODEL_DATA", rows, model)
+    result["format"] = "{field Id: {spw Id: {fluxd: [I,Q,U,V] in Jy}}}"
+    return result
+
+
+def _solve_gains(
+    average: np.ndarray,
+    weights: np.ndarray,
+    antenna1,
+    antenna2,
+    n_antennas: int,
+    refant: int,
+    iterations: int = 50
+) -> tuple:
+    # Rank-one solve of one hand, (baseline,) averages of data / model; returns gains and SNR
+    matrix = np.zeros((n_antennas, n_antennas), dtype=np.complex128)
+    matrix[antenna1, antenna2] = average * (weights > 0)
+    matrix[antenna2, antenna1] = np.conj(average) * (weights > 0)
+    gains = np.ones(n_antennas, dtype=np.complex128)
+    for _ in range(iterations):
+        estimate = matrix @ gains / np.maximum(np.sum(np.abs(gains)**2) - np.abs(gains)**2, 1e-30)
+        gains = (gains + estimate) / 2.0
+    if np.abs(gains[refant]) > 0:
+        gains *= np.conj(gains[refant]) / np.abs(gains[refant])
+    residual = matrix - np.outer(gains, np.conj(gains))
+    np.fill_diagonal(residual, 0.0)
+    rms = np.sqrt(np.mean(np.abs(residual[matrix != 0])**2)) if np.any(matrix != 0) else np.inf
+    return gains, np.abs(gains) * np.sqrt(max(n_antennas - 1, 1)) / max(rms, 1e-12)
+
+
+def _solve_delay(prepared: list) -> float:
+    # Cross-hand delay (ns) from the phase slope of RL conj(M_RL) over every selected channel
+    frequencies = []
+    products = []
+    for entry in prepared:
+        weights = entry["weights"][1] * entry["weights"][2]
+        product = entry["data"][1] * np.conj(entry["model"][1])
+        product += np.conj(entry["data"][2]) * entry["model"][2]
+        frequencies.append(entry["frequencies"])
+        products.append(np.sum(product * weights, axis=-1))
+    frequencies = np.concatenate(frequencies)
+    products = np.concatenate(products)
+    order = np.argsort(frequencies)
+    phase = np.unwrap(np.angle(products[order]))
+    slope, _ = np.polyfit(frequencies[order], phase, 1)
+    return slope / (2.0 * np.pi) * 1e9
+
+
+def gaincal(
+    vis="",
+    caltable="",
+    field="",
+    spw="",
+    refant="",
+    gaintype="G",
+    solint="inf",
+    combine="",
+    gaintable=(),
+    spwmap=(),
+    minsnr=3.0,
+    append=False,
+    **kwargs
+):
+    if gaintype not in ("G", "KCROSS"):
+        raise RuntimeError("The stand-in only solves gaintype G and KCROSS")
+    prepared = _prepared(vis, field, spw, gaintable, spwmap)
+    if not prepared:
+        raise RuntimeError("No data selected for " + vis)
+    refant_id = _antenna_id(vis, refant)
+    time = float(np.mean(read_column(vis, "TIME")))
+    field_ids = _selection_ids(field, _names(vis, "FIELD"))
+    solutions = []
+    if gaintype == "KCROSS":
+        delay = _solve_delay(prepared)
+        print("Cross-hand delay: {0:.4f} ns".format(delay))
+        for entry in prepared:
+            for antenna in range(entry["n_antennas"]):
+                solutions.append(
+                    (
+                        field_ids[0], entry["spw"], antenna, refant_id, np.full((2, 1), delay),
+                        np.full((2, 1), 100.0), np.zeros((2, 1), dtype=bool)
+                    )
+                )
+        _write_caltable(caltable, vis, "KCross Jones", "FPARAM", solutions, time)
+        return {}
+
+    for field_id in field_ids:
+        for entry in _prepared(vis, str(field_id), spw, gaintable, spwmap):
+            # Per field and spw: channel and time averaged data / model on each hand
+            ratio = entry["data"] / np.where(entry["model"] != 0, entry["model"], 1.0)
+            antenna1, antenna2, baselines = _baselines(
+                entry["antenna1"], entry["antenna2"], entry["n_antennas"]
+            )
+            average, weights = _baseline_average(ratio, entry["weights"], baselines, len(antenna1))
+            param = np.ones((entry["n_antennas"], 2, 1), dtype=np.complex128)
+            snr = np.zeros((entry["n_antennas"], 2, 1))
+            for hand, correlation in enumerate((0, 3)):
+                gains, hand_snr = _solve_gains(
+                    np.average(average[correlation], axis=0, weights=weights[correlation] + 1e-30),
+                    np.sum(weights[correlation], axis=0), antenna1, antenna2, entry["n_antennas"],
+                    refant_id
+                )
+                param[:, hand, 0] = gains
+                snr[:, hand, 0] = hand_snr
+            for antenna in range(entry["n_antennas"]):
+                solutions.append(
+                    (
+                        field_id, entry["spw"], antenna, refant_id, param[antenna], snr[antenna],
+                        snr[antenna] < minsnr
+                    )
+                )
+    _write_caltable(caltable, vis, "G Jones", "CPARAM", solutions, time)
+    return {}
+
+
+def _solve_leakage(entry: dict, refant: int) -> tuple:
+    # Least squares for dR_i and conj(dL_j) per channel from the time averaged RL and conj(LR)
+    # of every baseline, with the R leakage of the reference antenna fixed to zero. Leakages
+    # absorb any remaining cross-hand phase, which the X solve takes out afterwards.
+    n_antennas = entry["n_antennas"]
+    antenna1, antenna2, baselines = _baselines(entry["antenna1"], entry["antenna2"], n_antennas)
+    data = entry["data"]
+    model = entry["model"]
+    intensity = (model[0] + model[3]) / 2.0
+    intensity = np.where(np.abs(intensity) > 0, intensity, 1.0)
+    right = (data[1] - model[1]) / intensity
+    left = np.conj((data[2] - model[2]) / intensity)
+    weights = entry["weights"][1] * entry["weights"][2]
+    right, _ = _baseline_average(right, weights, baselines, len(antenna1))
+    left, _ = _baseline_average(left, weights, baselines, len(antenna1))
+
+    n_baselines = len(antenna1)
+    design = np.zeros((2 * n_baselines + 1, 2 * n_antennas))
+    equations = np.arange(n_baselines)
+    design[equations, antenna1] = 1.0
+    design[equations, n_antennas + antenna2] = 1.0
+    design[n_baselines + equations, n_antennas + antenna1] = 1.0
+    design[n_baselines + equations, antenna2] = 1.0
+    design[-1, refant] = 1.0
+    measured = np.concatenate([right.T, left.T, np.zeros((1, right.shape[0]))])
+    solution, _, _, _ = np.linalg.lstsq(design, measured, rcond=None)
+    residual = design @ solution - measured
+    rms = np.sqrt(np.mean(np.abs(residual[:-1])**2, axis=0))
+    leakage = np.stack([solution[:n_antennas], np.conj(solution[n_antennas:])], axis=1)
+    snr = np.sqrt(max(n_antennas - 1, 1)) / np.maximum(rms, 1e-12)
+    used = np.zeros(n_antennas, dtype=bool)
+    used[antenna1] = True
+    used[antenna2] = True
+    return leakage, np.broadcast_to(snr, leakage.shape), used
+
+
+def _solve_cross_hand_phase(entry: dict) -> np.ndarray:
+    # Per channel cross-hand phase of the data against the polarized model
+    weights = entry["weights"][1] * entry["weights"][2]
+    product = entry["data"][1] * np.conj(entry["model"][1])
+    product += np.conj(entry["data"][2]) * entry["model"][2]
+    return np.angle(np.sum(product * weights, axis=-1))
+
+
+def polcal(
+    vis="",
+    caltable="",
+    field="",
+    spw="",
+    refant="",
+    poltype="Df",
+    solint="inf",
+    combine="",
+    gaintable=(),
+    spwmap=(),
+    minsnr=3.0,
+    **kwargs
+):
+    if poltype not in ("Df", "Dflls", "Xf"):
+        raise RuntimeError("The stand-in only solves poltype Df, Dflls and Xf")
+    prepared = _prepared(vis, field, spw, gaintable, spwmap)
+    if not prepared:
+        raise RuntimeError("No data selected for " + vis)
+    refant_id = _antenna_id(vis, refant)
+    field_id = _selection_ids(field, _names(vis, "FIELD"))[0]
+    solutions = []
+    for entry in prepared:
+        n_chan = len(entry["frequencies"])
+        if poltype == "Xf":
+            phase = _solve_cross_hand_phase(entry)
+            param = np.exp(1j * phase)[np.newaxis, :]
+            for antenna in range(entry["n_antennas"]):
+                solutions.append(
+                    (
+                        field_id, entry["spw"], antenna, refant_id, param,
+                        np.full((1, n_chan), 100.0), np.zeros((1, n_chan), dtype=bool)
+                    )
+                )
+            continue
+        leakage, snr, used = _solve_leakage(entry, refant_id)
+        for antenna in range(entry["n_antennas"]):
+            solutions.append(
+                (
+                    field_id, entry["spw"], antenna, refant_id, leakage[antenna],
+                    np.array(snr[antenna]), (snr[antenna] < minsnr) | ~used[antenna]
+                )
+            )
+    vis_cal = "X Jones" if poltype == "Xf" else "D Jones"
+    _write_caltable(
+        caltable, vis, vis_cal, "CPARAM", solutions, float(np.mean(read_column(vis, "TIME")))
+    )
+    return {}
+
+
+def fluxscale(vis="", fluxtable="", caltable="", reference="", transfer="", fitorder=1, **kwargs):
+    # Transfer fluxes per spw from the mean gain power against the reference fields (which
+    # have a model), then a polynomial fit of log10 S against log10(nu / fitRefFreq)
+    solutions = read_column(caltable, "CPARAM")
+    flags = read_column(caltable, "FLAG")
+    field_of_row = read_column(caltable, "FIELD_ID")
+    spw_of_row = read_column(caltable, "SPECTRAL_WINDOW_ID")
+    names = _names(vis, "FIELD")
+    reference_ids = _selection_ids(reference, names)
+    spw_ids = np.unique(spw_of_row)
+    frequencies = np.array([np.mean(freqs) for freqs in _chan_freqs(caltable)])[spw_ids]
+    power = np.array(
+        [
+            np.mean(np.abs(param[~flag])**2) if np.any(~flag) else np.nan
+            for param, flag in zip(solutions, flags)
+        ]
+    )
+
+    def mean_power(field_ids):
+        return np.array(
+            [
+                np.nanmean(power[np.isin(field_of_row, field_ids) & (spw_of_row == spw_id)])
+                for spw_id in spw_ids
+            ]
+        )
+
+    reference_power = mean_power(reference_ids)
+    scaled = [np.array(param) for param in solutions]
+    result = {"freq": frequencies, "spwID": spw_ids, "spwName": spw_ids.astype(str)}
+    for field_id in _selection_ids(transfer, names):
+        flux = mean_power([field_id]) / reference_power
+        fit_ref_freq = 10.0**np.mean(np.log10(frequencies))
+        valid = np.isfinite(flux) & (flux > 0)
+        order = min(fitorder, max(int(np.sum(valid)) - 1, 0))
+        spidx = np.polyfit(
+            np.log10(frequencies[valid] / fit_ref_freq), np.log10(flux[valid]), order
+        )[::-1]
+        print(
+            "Flux density for " + names[field_id] + ": " +
+            ", ".join("{0:.4f}".format(value) for value in flux)
+        )
+        for row in np.flatnonzero(field_of_row == field_id):
+            scaled[row] = scaled[row] / np.sqrt(flux[np.searchsorted(spw_ids, spw_of_row[row])])
+        result[str(field_id)] = {
+            "fieldName": names[field_id],
+            "fluxd": np.stack([flux, 0 * flux, 0 * flux, 0 * flux], axis=-1),
+            "spidx": spidx,
+            "spidxerr": np.zeros_like(spidx),
+            "fitRefFreq": fit_ref_freq
+        }
+    if os.path.exists(fluxtable):
+        shutil.rmtree(fluxtable)
+    shutil.copytree(caltable, fluxtable)
+    write_column(fluxtable, "CPARAM", scaled, var=True)
+    return result
+
+
+def applycal(vis="", field="", spw="", gaintable=(), spwmap=(), calwt=(), **kwargs):
+    prepared = _prepared(vis, field, spw, gaintable, spwmap)
+    rows = _selected_rows(vis, field, spw)
+    spw_of_row = read_column(vis, "DATA_DESC_ID")[rows]
+    corrected = np.zeros(read_column(vis, "DATA").shape[:2] + (len(rows), ), dtype=np.complex64)
+    for entry in prepared:
+        corrected[..., spw_of_row == entry["spw"]] = entry["data"]
+    _write_rows(vis, "CORRECTED_DATA", rows, corrected)
+    return {}
+
+
+def _average_rows(values: np.ndarray, weights: np.ndarray, groups: np.ndarray, n: int):
+    average, totals = _baseline_average(values, weights, groups, n)
+    return average, totals == 0
+
+
+def _average_channels(values: np.ndarray, weights: np.ndarray, chanbin: int) -> tuple:
+    starts = np.arange(0, values.shape[1], chanbin)
+    sums = np.add.reduceat(values * weights, starts, axis=1)
+    totals = np.add.reduceat(weights, starts, axis=1)
+    return np.where(totals > 0, sums / np.maximum(totals, 1e-30), 0.0), totals == 0
+
+
+def mstransform(
+    vis="",
+    outputvis="",
+    field="",
+    spw="",
+    datacolumn="all",
+    timeaverage=False,
+    timebin="0s",
+    chanaverage=False,
+    chanbin=1,
+    **kwargs
+):
+    # Field and spw ids are kept (reindex=False); only fixed channel counts are supported
+    if os.path.exists(outputvis):
+        raise RuntimeError("Output MS " + outputvis + " already exists")
+    rows = _selected_rows(vis, field, spw)
+    info = read_info(vis)
+    os.makedirs(outputvis)
+    for entry in os.listdir(vis):
+        if os.path.isdir(os.path.join(vis, entry)):
+            shutil.copytree(os.path.join(vis, entry), os.path.join(outputvis, entry))
+    data_columns = [column for column in DATA_COLUMNS if column in info["columns"]]
+    if datacolumn != "all":
+        data_columns = ["DATA"]
+    other_columns = [
+        column for column in info["columns"] if column not in DATA_COLUMNS and column != "FLAG"
+    ]
+    columns = _read_rows(vis, rows, tuple(data_columns) + ("FLAG", ) + tuple(other_columns))
+    weights = (~columns["FLAG"]).astype(np.float64)
+
+    if chanaverage and chanbin > 1:
+        for column in data_columns:
+            columns[column], flag = _average_channels(columns[column], weights, chanbin)
+        weights = (~flag).astype(np.float64)
+        columns["FLAG"] = flag
+        spectral_window = os.path.join(outputvis, "SPECTRAL_WINDOW")
+        chan_freqs = [
+            np.add.reduceat(freqs, np.arange(0, len(freqs), chanbin)) /
+            np.diff(np.append(np.arange(0, len(freqs), chanbin), len(freqs)))
+            for freqs in read_column(spectral_window, "CHAN_FREQ")
+        ]
+        write_column(spectral_window, "CHAN_FREQ", chan_freqs, var=True)
+        write_column(spectral_window, "NUM_CHAN", np.array([len(freqs) for freqs in chan_freqs]))
+
+    timebin = _quantity(timebin, TIME_UNITS)
+    if timeaverage and timebin > 0:
+        time = columns["TIME"]
+        keys = np.stack(
+            [
+                columns["FIELD_ID"], columns["DATA_DESC_ID"], columns["SCAN_NUMBER"],
+                columns["ANTENNA1"], columns["ANTENNA2"],
+                np.floor((time - np.min(time)) / timebin).astype(np.int64)
+            ]
+        )
+        unique_keys, groups = np.unique(keys, axis=1, return_inverse=True)
+        groups = groups.ravel()
+        n_groups = unique_keys.shape[1]
+        for column in data_columns:
+            columns[column], flag = _average_rows(columns[column], weights, groups, n_groups)
+        columns["FLAG"] = flag
+        counts = np.bincount(groups, minlength=n_groups)
+        first_rows = np.unique(groups, return_index=True)[1]
+        for column in other_columns:
+            columns[column] = columns[column][..., first_rows]
+        columns["TIME"] = np.bincount(groups, weights=time, minlength=n_groups) / counts
+
+    for column in data_columns:
+        columns[column] = columns[column].astype(np.complex64)
+    create_table(outputvis, columns=columns, keywords=info["keywords"])
+    return True
+
+
+def flagdata(vis="", mode="manual", clipminmax=(), datacolumn="DATA", clipoutside=True, **kwargs):
+    # Clip flagging of caltable parameters, the only mode ocarina uses
+    if mode != "clip":
+        raise RuntimeError("The stand-in only supports clip flagging")
+    params = read_column(vis, datacolumn)
+    flags = read_column(vis, "FLAG")
+    clipped = []
+    for param, flag in zip(params, flags):
+        amplitude = np.abs(param)
+        outside = (amplitude < clipminmax[0]) | (amplitude > clipminmax[1])
+        clipped.append(flag | (outside if clipoutside else ~outside))
+    write_column(vis, "FLAG", clipped, var=True)
+    return {}
+
+
+def flagmanager(vis="", mode="list", **kwargs):
+    return {}
+
+
+def rmtables(tablenames=""):
+    if isinstance(tablenames, str):
+        tablenames = [tablenames]
+    for table_name in tablenames:
+        if os.path.exists(table_name):
+            shutil.rmtree(table_name)
+    return True
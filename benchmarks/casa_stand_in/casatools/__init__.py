@@ -0,0 +1,259 @@
+# Pure-numpy stand-in for the parts of casatools ocarina uses (table and ctsys), so the
+# calibration code can be benchmarked without CASA. A table is a directory holding table.dat
+# (JSON: row count, column kinds, keywords) and one file per column: <COLUMN>.npy for
+# fixed-shape columns, with rows on the last axis as getcol returns them, or <COLUMN>.npz
+# (one array per row) for columns whose cell shape changes between rows. Subtables are
+# subdirectories. table.dat is rewritten on every change, so its modification time tracks the
+# table as casacore's does.
+import json
+import os
+import re
+import numpy as np
+
+TABLE_INFO = "table.dat"
+# Where ctsys.resolve finds data such as nrao/VLA/standards/
+DATA_DIR_VARIABLE = "CASA_STAND_IN_DATA"
+
+
+def _info_file(table_name: str) -> str:
+    return os.path.join(table_name, TABLE_INFO)
+
+
+def read_info(table_name: str) -> dict:
+    with open(_info_file(table_name)) as info_file:
+        return json.load(info_file)
+
+
+def write_info(table_name: str, info: dict):
+    temporary_file = _info_file(table_name) + ".{0}.tmp".format(os.getpid())
+    with open(temporary_file, "w") as info_file:
+        json.dump(info, info_file)
+    os.replace(temporary_file, _info_file(table_name))
+
+
+def _column_file(table_name: str, column: str, kind: str) -> str:
+    return os.path.join(table_name, column + (".npz" if kind == "var" else ".npy"))
+
+
+def _save_column(table_name: str, column: str, values, kind: str) -> int:
+    # Whole columns are replaced rather than rewritten, since stored caltables are hardlinked
+    column_file = _column_file(table_name, column, kind)
+    temporary_file = column_file + ".{0}.tmp".format(os.getpid())
+    with open(temporary_file, "wb") as output:
+        if kind == "var":
+            np.savez(
+                output, **{"r" + str(row): np.asarray(value)
+                           for row, value in enumerate(values)}
+            )
+        else:
+            np.save(output, np.asarray(values))
+    os.replace(temporary_file, column_file)
+    return len(values) if kind == "var" else np.shape(values)[-1]
+
+
+def write_column(table_name: str, column: str, values, var: bool = False):
+    # Writes (or replaces) a whole column; var columns take a list with one array per row
+    info = read_info(table_name)
+    kind = "var" if var else "fixed"
+    nrows = _save_column(table_name, column, values, kind)
+    if info["columns"] and nrows != info["nrows"]:
+        raise RuntimeError("Column " + column + " does not have " + str(info["nrows"]) + " rows")
+    info["nrows"] = nrows
+    info["columns"][column] = kind
+    write_info(table_name, info)
+
+
+def read_column(table_name: str, column: str, mmap: bool = True):
+    kind = read_info(table_name)["columns"].get(column)
+    if kind is None:
+        raise RuntimeError("Column " + column + " does not exist in " + table_name)
+    if kind == "var":
+        with np.load(_column_file(table_name, column, kind)) as data:
+            return [data["r" + str(row)] for row in range(len(data.files))]
+    return np.load(_column_file(table_name, column, kind), mmap_mode="r" if mmap else None)
+
+
+def create_table(table_name: str, columns: dict = None, var_columns: dict = None, keywords=None):
+    os.makedirs(table_name, exist_ok=True)
+    write_info(table_name, {"nrows": 0, "columns": {}, "keywords": keywords or {}})
+    for column, values in (columns or {}).items():
+        write_column(table_name, column, values)
+    for column, values in (var_columns or {}).items():
+        write_column(table_name, column, values, var=True)
+
+
+class table:
+
+    def __init__(self):
+        self._name = None
+        self._info = None
+        self._rows = None
+        self._readonly = True
+
+    def open(self, tablename: str = "", nomodify: bool = True, **kwargs):
+        if not os.path.exists(_info_file(tablename)):
+            raise RuntimeError("Table " + tablename + " does not exist")
+        self._name = tablename
+        self._info = read_info(tablename)
+        self._rows = None
+        self._readonly = nomodify
+        return True
+
+    def _check_open(self):
+        if self._name is None:
+            raise RuntimeError("table is not open")
+
+    def name(self) -> str:
+        return self._name
+
+    def nrows(self) -> int:
+        self._check_open()
+        return self._info["nrows"] if self._rows is None else len(self._rows)
+
+    def colnames(self) -> list:
+        self._check_open()
+        return list(self._info["columns"].keys())
+
+    def getkeywords(self) -> dict:
+        self._check_open()
+        return dict(self._info["keywords"])
+
+    def _selected_rows(self, startrow: int, nrow: int) -> np.ndarray:
+        rows = np.arange(self._info["nrows"]) if self._rows is None else self._rows
+        return rows[startrow:] if nrow < 0 else rows[startrow:startrow + nrow]
+
+    def getcol(self, columnname: str, startrow: int = 0, nrow: int = -1) -> np.ndarray:
+        self._check_open()
+        if self._info["columns"].get(columnname) == "var":
+            shapes = {value.shape for value in read_column(self._name, columnname)}
+            if len(shapes) > 1:
+                raise RuntimeError("Column " + columnname + " has rows of different shapes")
+            values = np.stack(read_column(self._name, columnname), axis=-1)
+        else:
+            values = read_column(self._name, columnname)
+        return np.array(values[..., self._selected_rows(startrow, nrow)])
+
+    def getvarcol(self, columnname: str, startrow: int = 0, nrow: int = -1) -> dict:
+        # Cells keyed r1, r2, ... with a trailing row axis of length one, as casatools does
+        self._check_open()
+        rows = self._selected_rows(startrow, nrow)
+        if self._info["columns"].get(columnname) == "var":
+            values = read_column(self._name, columnname)
+            cells = [values[row] for row in rows]
+        else:
+            values = read_column(self._name, columnname)
+            cells = [np.array(values[..., row]) for row in rows]
+        return {"r" + str(i + 1): cell[..., np.newaxis] for i, cell in enumerate(cells)}
+
+    def putcol(self, columnname: str, value, startrow: int = 0, nrow: int = -1):
+        self._check_open()
+        if self._readonly:
+            raise RuntimeError("Table " + self._name + " is not writable")
+        rows = self._selected_rows(startrow, nrow)
+        if self._put_in_place(columnname, value, rows):
+            return True
+        if columnname in self._info["columns"]:
+            values = np.array(read_column(self._name, columnname, mmap=False))
+            values[..., rows] = value
+        else:
+            values = np.asarray(value)
+        write_column(self._name, columnname, values)
+        self._info = read_info(self._name)
+        return True
+
+    def putvarcol(self, columnname: str, value: dict, startrow: int = 0, nrow: int = -1):
+        # Cells keyed r1, r2, ... with a trailing row axis of length one, as getvarcol returns
+        self._check_open()
+        if self._readonly:
+            raise RuntimeError("Table " + self._name + " is not writable")
+        rows = self._selected_rows(startrow, nrow)
+        if self._info["columns"].get(columnname) != "var":
+            values = np.array(read_column(self._name, columnname, mmap=False))
+            for i, row in enumerate(rows):
+                values[..., row] = value["r" + str(i + 1)][..., 0]
+            write_column(self._name, columnname, values)
+        else:
+            values = read_column(self._name, columnname)
+            for i, row in enumerate(rows):
+                values[row] = value["r" + str(i + 1)][..., 0]
+            write_column(self._name, columnname, values, var=True)
+        self._info = read_info(self._name)
+        return True
+
+    def _put_in_place(self, columnname: str, value, rows: np.ndarray) -> bool:
+        # Rows of a fixed column that no caltable store links to are written in place, so
+        # processes writing separate rows do not overwrite each other
+        column_file = _column_file(self._name, columnname, "fixed")
+        if self._info["columns"].get(columnname) != "fixed" or os.stat(column_file).st_nlink > 1:
+            return False
+        values = np.load(column_file, mmap_mode="r+")
+        shape = values.shape[:-1] + (len(rows), )
+        if np.shape(value) != shape or np.asarray(value).dtype != values.dtype:
+            return False
+        values[..., rows] = value
+        values.flush()
+        del values
+        write_info(self._name, read_info(self._name))
+        self._info = read_info(self._name)
+        return True
+
+    def taql(self, query: str):
+        # Only the selections ocarina issues: select * from <table> [where <COLUMN>=<value>]
+        match = re.fullmatch(
+            r"\s*select\s+\*\s+from\s+(\S+)(?:\s+where\s+(\w+)\s*=\s*(\S+))?\s*", query, re.I
+        )
+        if match is None:
+            raise RuntimeError("Unsupported TaQL query: " + query)
+        result = table()
+        result.open(match.group(1))
+        if match.group(2) is not None:
+            column = result.getcol(match.group(2))
+            value = np.asarray(match.group(3).strip("'\"")).astype(column.dtype)
+            result._rows = np.flatnonzero(column == value)
+        return result
+
+    def copyrows(self, outtable: str, startrowin: int = 0, startrowout: int = -1, nrow: int = -1):
+        # Appends the selected rows to outtable, which must have the same columns
+        self._check_open()
+        if startrowout != -1:
+            raise RuntimeError("The stand-in only appends rows (startrowout=-1)")
+        rows = self._selected_rows(startrowin, nrow)
+        info = read_info(outtable)
+        for column, kind in self._info["columns"].items():
+            existing = read_column(outtable, column, mmap=False)
+            added = read_column(self._name, column, mmap=False)
+            if kind == "var":
+                values = list(existing) + [added[row] for row in rows]
+            else:
+                values = np.concatenate([existing, added[..., rows]], axis=-1)
+            info["nrows"] = _save_column(outtable, column, values, kind)
+        write_info(outtable, info)
+        return True
+
+    def rownumbers(self) -> np.ndarray:
+        self._check_open()
+        return self._selected_rows(0, -1)
+
+    def flush(self):
+        return True
+
+    def close(self):
+        self._name = None
+        self._info = None
+        self._rows = None
+        return True
+
+    def done(self):
+        return self.close()
+
+
+class _CtSys:
+
+    def resolve(self, path: str = "") -> str:
+        data_dir = os.environ.get(
+            DATA_DIR_VARIABLE, os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+        )
+        return os.path.join(data_dir, path)
+
+
+ctsys = _CtSys()
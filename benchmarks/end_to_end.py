@@ -0,0 +1,260 @@
+# Full calibration of a synthetic MS on the numpy CASA stand-in: known model of the polarized
+# calibrator, gains and flux transfer for the leakage calibrator, [pre-average,] cross-hand
+# delay, leakage, angle, apply and final plots. Steps are timed by the calibrator tracer:
+#   python -m benchmarks.end_to_end --antennas 27 --spws 16 --channels 64 --times 60
+# The stand-in tasks solve a simplified model, so step times follow the table I/O and the
+# array work of the MS size rather than the cost of CASA itself; plotting is not drawn.
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+import astropy.units as un
+from ocarina.polarization_calibration import PolarizationCalibrator, polcalibration
+from ocarina.polarized_sources import CoefficientCache, PolarizedSource, polarizedsource
+from ocarina.utils import Tracer, table_pool
+from .synthetic_ms import SyntheticMS, write_standards
+from casatools import read_column
+
+PRE_AVERAGE = {"time_bin": "30s", "chan_bin": 4}
+
+
+def pol_angle_model(source: PolarizedSource, nu_0: un.Quantity) -> dict:
+    # The setjy arguments set_known_model derives for the source, to simulate matching data
+    intensity, spec_idx, _ = source.get_known_source_information(nu_0=nu_0)
+    pol_angle, _, pol_fraction, _ = source.get_source_polarization_information(
+        n_terms_angle=3,
+        n_terms_frac=3,
+        nu_0=nu_0,
+        nu_min_frac=0.0 * un.Hz,
+        nu_max_frac=np.inf * un.Hz,
+        nu_min_angle=0.0 * un.Hz,
+        nu_max_angle=np.inf * un.Hz
+    )
+    return {
+        "fluxdensity": [intensity, 0, 0, 0],
+        "spix": list(spec_idx),
+        "reffreq": str(nu_0).replace(" ", ""),
+        "polindex": pol_fraction,
+        "polangle": pol_angle
+    }
+
+
+def prepare(directory: str, synthetic_ms: SyntheticMS) -> str:
+    # Standards table, coefficient cache and MS in directory; returns the MS name
+    write_standards(os.path.join(directory, "data"))
+    polarizedsource.coefficient_cache = CoefficientCache(cache_dir=os.path.join(directory, "cache"))
+    frequencies = synthetic_ms.frequencies()
+    # The calibrator picks the middle of the band as nu_0
+    nu_0 = (np.max(frequencies) + np.min(frequencies)) / 2.0 * un.Hz
+    model = pol_angle_model(PolarizedSource(source=synthetic_ms.pol_angle_field), nu_0)
+    return synthetic_ms.write(os.path.join(directory, "synthetic.ms"), model)
+
+
+def solve_gains(calibrator: PolarizationCalibrator) -> str:
+    # Gains of both calibrators against their models, for the flux transfer. The leakage
+    # calibrator is reset to 1 Jy first, so its gains carry its flux also on a repeated run.
+    gain_table = calibrator.vis_name[:-3] + ".G0"
+    polcalibration.setjy(
+        vis=calibrator.vis_name,
+        field=calibrator.leakage_field,
+        standard='manual',
+        fluxdensity=[1.0, 0, 0, 0]
+    )
+    polcalibration.gaincal(
+        vis=calibrator.vis_name,
+        caltable=gain_table,
+        field=calibrator.pol_angle_field + "," + calibrator.leakage_field,
+        refant=calibrator.ref_ant,
+        gaintype="G",
+        solint="inf",
+        combine="scan"
+    )
+    return gain_table
+
+
+def calibrate(
+    vis_name: str,
+    synthetic_ms: SyntheticMS,
+    pre_average: dict = None,
+    tracer: Tracer = None,
+    **kwargs
+) -> PolarizationCalibrator:
+    calibrator = PolarizationCalibrator(
+        vis_name=vis_name,
+        pol_angle_field=synthetic_ms.pol_angle_field,
+        leakage_field=synthetic_ms.leakage_field,
+        ref_ant=synthetic_ms.antenna_names()[0],
+        k_cross_ref_ant=synthetic_ms.antenna_names()[0],
+        tracer=tracer,
+        **kwargs
+    )
+    calibrator.set_known_model(
+        PolarizedSource(source=synthetic_ms.pol_angle_field), field=synthetic_ms.pol_angle_field
+    )
+    if tracer is None:
+        gain_table = solve_gains(calibrator)
+    else:
+        with tracer.activate(), tracer.span("solve_gains", vis=vis_name):
+            gain_table = solve_gains(calibrator)
+    calibrator.set_unknown_model(
+        PolarizedSource(source=synthetic_ms.leakage_field),
+        field=synthetic_ms.leakage_field,
+        gain_table=gain_table,
+        reference_field=synthetic_ms.pol_angle_field,
+        transfer_field=synthetic_ms.leakage_field
+    )
+    if pre_average is not None:
+        calibrator.pre_average(**pre_average)
+    calibrator.solve_cross_hands_delay()
+    calibrator.calibrate_leakage()
+    calibrator.calibrate_pol_angle()
+    calibrator.apply_solutions()
+    calibrator.final_plots()
+    calibrator.wait_for_plots()
+    return calibrator
+
+
+def solution_errors(calibrator: PolarizationCalibrator, synthetic_ms: SyntheticMS) -> dict:
+    # Largest differences between the solutions and what was put into the MS
+    d_r, d_l = synthetic_ms.leakages()
+    rotation = np.exp(1j * synthetic_ms.cross_hand_phase)
+    leakage = read_column(calibrator.leakage_table, "CPARAM")
+    antennas = read_column(calibrator.leakage_table, "ANTENNA1")
+    leakage_error = max(
+        max(
+            np.max(np.abs(param[0] - rotation * d_r[antenna])),
+            np.max(np.abs(param[1] - np.conj(rotation) * d_l[antenna]))
+        ) for param, antenna in zip(leakage, antennas)
+    )
+    delay = read_column(calibrator.k_cross_table, "FPARAM")[0][0, 0]
+    phases = np.concatenate(
+        [param[0] for param in read_column(calibrator.pol_angle_table, "CPARAM")]
+    )
+    return {
+        "delay_ns": abs(delay - synthetic_ms.cross_hand_delay),
+        "leakage": leakage_error,
+        "cross_hand_phase_rad": np.max(np.abs(np.angle(phases * np.conj(rotation))))
+    }
+
+
+class EndToEnd:
+    params = ([False, True], )
+    param_names = ["pre_average"]
+    timeout = 600
+
+    def setup(self, pre_average):
+        self.cwd = os.getcwd()
+        self.cache = polarizedsource.coefficient_cache
+        self.directory = tempfile.mkdtemp(prefix="ocarina-end-to-end-")
+        self.synthetic_ms = SyntheticMS()
+        self.vis_name = prepare(self.directory, self.synthetic_ms)
+        # Plots are written to the working directory
+        os.chdir(self.directory)
+
+    def teardown(self, pre_average):
+        os.chdir(self.cwd)
+        table_pool.close_all()
+        polarizedsource.coefficient_cache = self.cache
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_calibrate(self, pre_average):
+        calibrate(
+            self.vis_name, self.synthetic_ms, pre_average=PRE_AVERAGE if pre_average else None
+        )
+
+
+class ModelWrite:
+    # MODEL_DATA of the polarized calibrator, written by setjy or by ocarina's model writer
+    params = (["setjy", "native"], )
+    param_names = ["model_backend"]
+    timeout = 300
+
+    def setup(self, model_backend):
+        self.cache = polarizedsource.coefficient_cache
+        self.directory = tempfile.mkdtemp(prefix="ocarina-model-write-")
+        self.synthetic_ms = SyntheticMS(n_channels=256)
+        self.vis_name = prepare(self.directory, self.synthetic_ms)
+        self.calibrator = PolarizationCalibrator(
+            vis_name=self.vis_name, model_backend=model_backend, plot_mode="deferred"
+        )
+
+    def teardown(self, model_backend):
+        table_pool.close_all()
+        polarizedsource.coefficient_cache = self.cache
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_set_known_model(self, model_backend):
+        self.calibrator.set_known_model(
+            PolarizedSource(source=self.synthetic_ms.pol_angle_field),
+            field=self.synthetic_ms.pol_angle_field
+        )
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Calibrate a synthetic MS on the CASA stand-in")
+    parser.add_argument("--antennas", type=int, default=10)
+    parser.add_argument("--spws", type=int, default=4)
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--times", type=int, default=20, help="Integrations per field")
+    parser.add_argument("--noise", type=float, default=0.01, help="Noise per visibility (Jy)")
+    parser.add_argument("--time-bin", default="", help="Pre-average in time, e.g. 30s")
+    parser.add_argument("--chan-bin", type=int, default=1, help="Pre-average channels")
+    parser.add_argument("--polcal-workers", type=int, default=1)
+    parser.add_argument("--plot-backend", default="plotms", choices=("plotms", "native"))
+    parser.add_argument("--model-backend", default="setjy", choices=("setjy", "native"))
+    parser.add_argument("--model-workers", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="Keep the MS and the trace")
+    arguments = parser.parse_args(argv)
+
+    synthetic_ms = SyntheticMS(
+        n_antennas=arguments.antennas,
+        n_spws=arguments.spws,
+        n_channels=arguments.channels,
+        n_times=arguments.times,
+        noise=arguments.noise
+    )
+    pre_average = None
+    if arguments.time_bin or arguments.chan_bin > 1:
+        pre_average = {"time_bin": arguments.time_bin, "chan_bin": arguments.chan_bin}
+
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="ocarina-end-to-end-")
+    try:
+        vis_name = prepare(directory, synthetic_ms)
+        print(
+            "Synthetic MS: {0} rows, {1} antennas, {2} spws x {3} channels".format(
+                synthetic_ms.n_rows, synthetic_ms.n_antennas, synthetic_ms.n_spws,
+                synthetic_ms.n_channels
+            )
+        )
+        os.chdir(directory)
+        tracer = Tracer(trace_file=os.path.join(directory, "trace.jsonl"))
+        calibrator = calibrate(
+            vis_name,
+            synthetic_ms,
+            pre_average=pre_average,
+            tracer=tracer,
+            polcal_workers=arguments.polcal_workers,
+            plot_backend=arguments.plot_backend,
+            model_backend=arguments.model_backend,
+            model_workers=arguments.model_workers
+        )
+        print()
+        tracer.print_summary()
+        print()
+        for name, error in solution_errors(calibrator, synthetic_ms).items():
+            print("Largest {0} error: {1:.3e}".format(name, error))
+    finally:
+        os.chdir(cwd)
+        table_pool.close_all()
+        if arguments.keep:
+            print("Kept " + directory)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
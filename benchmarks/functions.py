@@ -0,0 +1,137 @@
+# Evaluation and fitting of the spectral models on seeded synthetic spectra, from the 24
+# points of a catalog source up to a wideband MS with 10^5 channels
+import numpy as np
+import astropy.units as un
+from ocarina.functions import (
+    FluxFunction, PolFunction, StokesModel, fit_flux_functions, fit_pol_functions,
+    monte_carlo_stokes
+)
+
+SEED = 20240601
+CHANNELS = [24, 1000, 100000]
+
+
+def synthetic_spectrum(n_channels: int, noise: float = 0.01):
+    # A 3C286-like source between 1 and 50 GHz: curved power law, slowly rotating angle
+    rng = np.random.default_rng(SEED)
+    nu = np.geomspace(1.0, 50.0, n_channels) * un.GHz
+    nu_0 = 3.0 * un.GHz
+    nu_div = (nu / nu_0).value
+    flux = 15.0 * nu_div**(-0.46 - 0.17 * np.log10(nu_div))
+    flux *= 1.0 + noise * rng.standard_normal(n_channels)
+    x = ((nu - nu_0) / nu_0).value
+    pol_fraction = 0.1 + 0.02 * x - 0.001 * x**2 + noise * 0.1 * rng.standard_normal(n_channels)
+    pol_angle = 0.58 + 0.01 * x + noise * 0.1 * rng.standard_normal(n_channels)
+    return nu, nu_0, flux, pol_fraction, pol_angle
+
+
+class FluxFunctionEval:
+    params = CHANNELS
+    param_names = ["channels"]
+
+    def setup(self, n_channels):
+        self.nu, nu_0, _, _, _ = synthetic_spectrum(n_channels)
+        self.function = FluxFunction(x_0=nu_0, flux_0=15.0)
+        self.coefficients = np.array([-0.46, -0.17])
+
+    def time_f_eval(self, n_channels):
+        self.function.f_eval(self.nu, self.coefficients)
+
+
+class PolFunctionEval:
+    params = CHANNELS
+    param_names = ["channels"]
+
+    def setup(self, n_channels):
+        self.nu, nu_0, _, _, _ = synthetic_spectrum(n_channels)
+        self.function = PolFunction(x_0=nu_0, n_terms=3)
+        self.coefficients = np.array([0.1, 0.02, -0.001])
+
+    def time_f_eval(self, n_channels):
+        self.function.f_eval(self.nu, self.coefficients)
+
+
+class StokesModelEval:
+    params = CHANNELS
+    param_names = ["channels"]
+
+    def setup(self, n_channels):
+        self.nu, nu_0, _, _, _ = synthetic_spectrum(n_channels)
+        self.model = StokesModel(
+            nu_0=nu_0,
+            intensity=15.0,
+            spectral_index=[-0.46, -0.17],
+            pol_fraction=[0.1, 0.02, -0.001],
+            pol_angle=[0.58, 0.01]
+        )
+        # The same source with 100 perturbed coefficient sets, as a batch
+        rng = np.random.default_rng(SEED)
+        self.batch = StokesModel(
+            nu_0=nu_0,
+            intensity=15.0 + 0.1 * rng.standard_normal(100),
+            spectral_index=[-0.46, -0.17] + 0.01 * rng.standard_normal((100, 2)),
+            pol_fraction=[0.1, 0.02, -0.001] + 0.001 * rng.standard_normal((100, 3)),
+            pol_angle=[0.58, 0.01] + 0.01 * rng.standard_normal((100, 2))
+        )
+
+    def time_evaluate(self, n_channels):
+        self.model.evaluate(self.nu)
+
+    def time_evaluate_batch(self, n_channels):
+        self.batch.evaluate(self.nu)
+
+
+class MonteCarloStokes:
+    # 4000 realizations, as PolarizedSource.get_model_uncertainty draws by default
+    params = CHANNELS[:2]
+    param_names = ["channels"]
+
+    def setup(self, n_channels):
+        self.nu, nu_0, _, _, _ = synthetic_spectrum(n_channels)
+        self.model = StokesModel(
+            nu_0=nu_0,
+            intensity=15.0,
+            spectral_index=[-0.46, -0.17],
+            pol_fraction=[0.1, 0.02, -0.001],
+            pol_angle=[0.58, 0.01]
+        )
+        self.spectral_covariance = np.diag([1e-4, 1e-4, 1e-5])
+        self.pol_covariance = np.diag([1e-6, 1e-7, 1e-8])
+
+    def time_monte_carlo_stokes(self, n_channels):
+        monte_carlo_stokes(
+            self.model,
+            self.nu,
+            spectral_covariance=self.spectral_covariance,
+            pol_fraction_covariance=self.pol_covariance,
+            pol_angle_covariance=self.pol_covariance[:2, :2],
+            seed=SEED
+        )
+
+
+class FunctionFit:
+    params = CHANNELS
+    param_names = ["channels"]
+
+    def setup(self, n_channels):
+        self.nu, self.nu_0, self.flux, self.pol_fraction, _ = synthetic_spectrum(n_channels)
+
+    def time_flux_curve_fit(self, n_channels):
+        function = FluxFunction(x_0=self.nu_0, flux_0=15.0)
+        function.fit(self.nu.value, self.flux)
+
+    def time_pol_linear_fit(self, n_channels):
+        function = PolFunction(x_0=self.nu_0.value, n_terms=3)
+        function.fit(self.nu.value, self.pol_fraction)
+
+    def time_pol_curve_fit(self, n_channels):
+        function = PolFunction(x_0=self.nu_0.value, n_terms=3)
+        function.fit(
+            self.nu.value, self.pol_fraction, initial_coefficients=np.zeros(3), method="curve_fit"
+        )
+
+    def time_fit_flux_functions(self, n_channels):
+        fit_flux_functions(self.nu, self.flux, self.nu_0, 15.0)
+
+    def time_fit_pol_functions(self, n_channels):
+        fit_pol_functions(self.nu, self.pol_fraction, self.nu_0, n_terms=3)
@@ -0,0 +1,36 @@
+# Import-time benchmarks. Each timeraw_ benchmark runs in a fresh interpreter, so the numbers
+# include everything pulled in at import. CASA modules must stay out of these paths: the
+# functions and sources layers should import without loading casatools, casatasks or
+# casaplotms, and the calibration layer should only load them on first use.
+
+_NO_CASA_CHECK = """
+import sys
+loaded = [name for name in ("casatools", "casatasks", "casaplotms") if name in sys.modules]
+assert not loaded, "CASA modules imported eagerly: " + ", ".join(loaded)
+"""
+
+
+def timeraw_import_functions():
+    return "import ocarina.functions" + _NO_CASA_CHECK
+
+
+def timeraw_import_polarized_sources():
+    return "import ocarina.polarized_sources" + _NO_CASA_CHECK
+
+
+def timeraw_import_utils():
+    return "import ocarina.utils" + _NO_CASA_CHECK
+
+
+def timeraw_import_polarization_calibration():
+    return "import ocarina.polarization_calibration" + _NO_CASA_CHECK
+
+
+def timeraw_polarized_source_model():
+    # Model fitting without touching CASA
+    return """
+import numpy as np
+from ocarina.polarized_sources import PolarizedSource
+source = PolarizedSource(source="3C286_2019")
+source.get_source_polarization_information(nu_0=source.nu[len(source.nu) // 2])
+""" + _NO_CASA_CHECK
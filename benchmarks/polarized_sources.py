@@ -0,0 +1,72 @@
+# PolarizedSource paths used while setting calibrator models. Standards tables come from the
+# stand-in in standards.py, so nothing here needs CASA.
+import shutil
+import tempfile
+import numpy as np
+import astropy.units as un
+from ocarina.polarized_sources import PolarizedSource, calibrator_catalog, polarizedsource
+from .functions import CHANNELS, SEED
+from .standards import install_standards_stand_in
+
+SOURCES = calibrator_catalog.names()
+
+
+class SourceConstruction:
+    params = SOURCES
+    param_names = ["source"]
+
+    def time_construct(self, source):
+        PolarizedSource(source=source)
+
+
+class FluxGivingCoefficients:
+    params = CHANNELS
+    param_names = ["channels"]
+
+    def setup(self, n_channels):
+        self.nu = np.geomspace(1.0, 50.0, n_channels) * un.GHz
+        rng = np.random.default_rng(SEED)
+        self.coefficients = np.array([1.25, -0.46, -0.17, 0.04]) + rng.normal(0.0, 0.02, 4)
+
+    def time_flux_giving_coefficients(self, n_channels):
+        PolarizedSource.flux_giving_coefficients(self.nu, self.coefficients)
+
+
+class SourcePolarizationInformation:
+    params = SOURCES
+    param_names = ["source"]
+
+    def setup(self, source):
+        self.source = PolarizedSource(source=source)
+        self.nu_0 = np.median(self.source.nu)
+
+    def time_get_source_polarization_information(self, source):
+        self.source.get_source_polarization_information(nu_0=self.nu_0)
+
+    def time_restricted_band(self, source):
+        self.source.get_source_polarization_information(
+            nu_0=self.nu_0,
+            nu_min_frac=1.0 * un.GHz,
+            nu_max_frac=12.0 * un.GHz,
+            nu_min_angle=1.0 * un.GHz,
+            nu_max_angle=12.0 * un.GHz
+        )
+
+
+class KnownSourceInformation:
+    params = ([True, False], )
+    param_names = ["analytic"]
+
+    def setup(self, analytic):
+        self.directory = tempfile.mkdtemp(prefix="ocarina-standards-")
+        self.cache = polarizedsource.coefficient_cache
+        install_standards_stand_in(self.directory)
+        self.source = PolarizedSource(source="3C286")
+        self.nu_0 = 3.0 * un.GHz
+
+    def teardown(self, analytic):
+        polarizedsource.coefficient_cache = self.cache
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_get_known_source_information(self, analytic):
+        self.source.get_known_source_information(nu_0=self.nu_0, analytic=analytic)
@@ -0,0 +1,46 @@
+# Stand-in for the CASA flux-density standards tables, so the source benchmarks run without
+# CASA. The coefficient cache only opens a standards table on a miss, so a fake table
+# directory (for its modification stamp) plus a pre-filled cache file is all it needs.
+import os
+import tempfile
+import numpy as np
+from ocarina.polarized_sources import CoefficientCache, calibrator_catalog
+from ocarina.polarized_sources import polarizedsource
+from ocarina.polarized_sources.coefficientcache import STANDARD_TABLES
+
+SEED = 20240601
+EPOCH = "2017"
+# Typical Perley-Butler 2017 coefficients (log10 S in Jy against log10 nu in GHz)
+TYPICAL_COEFFICIENTS = np.array([1.25, -0.46, -0.17, 0.04])
+
+
+def standards_stand_in(directory: str = None, standard: str = "Perley-Butler 2017"):
+    # Returns a CoefficientCache serving seeded coefficients for every catalog source
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="ocarina-standards-")
+    standards_dir = os.path.join(directory, "standards")
+    table_dir = os.path.join(standards_dir, STANDARD_TABLES[standard])
+    os.makedirs(table_dir, exist_ok=True)
+    with open(os.path.join(table_dir, "table.dat"), "wb") as table_file:
+        table_file.write(b"stand-in")
+
+    cache = CoefficientCache(
+        cache_dir=os.path.join(directory, "cache"), standards_dir=standards_dir
+    )
+    rng = np.random.default_rng(SEED)
+    columns = {}
+    for name in calibrator_catalog.names():
+        # Catalog entries carry an epoch suffix; the standards tables use the bare name
+        source = name.split("_")[0]
+        coefficients = TYPICAL_COEFFICIENTS + rng.normal(0.0, 0.02, TYPICAL_COEFFICIENTS.size)
+        columns[source] = (coefficients, np.abs(rng.normal(0.0, 0.005, coefficients.size)))
+    stamp = cache.get_table_stamp(table_dir)
+    cache._write_disk(standard, EPOCH, stamp, columns)
+    return cache
+
+
+def install_standards_stand_in(directory: str = None) -> CoefficientCache:
+    # PolarizedSource reads coefficients through the module-level cache
+    cache = standards_stand_in(directory)
+    polarizedsource.coefficient_cache = cache
+    return cache
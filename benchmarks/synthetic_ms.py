@@ -0,0 +1,191 @@
+# Synthetic measurement sets in the table layout of the numpy CASA stand-in (casa_stand_in/).
+# Importing this module puts the stand-in first on sys.path, which spawned workers inherit,
+# so ocarina's LazyObject imports of casatools, casatasks and casaplotms resolve to it.
+import os
+import sys
+import numpy as np
+from dataclasses import dataclass
+from ocarina.polarized_sources import calibrator_catalog
+from ocarina.polarized_sources.coefficientcache import STANDARD_TABLES
+from .standards import EPOCH, SEED, TYPICAL_COEFFICIENTS
+
+STAND_IN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "casa_stand_in")
+if STAND_IN_DIR not in sys.path:
+    sys.path.insert(0, STAND_IN_DIR)
+
+from casatools import DATA_DIR_VARIABLE, create_table  # noqa: E402
+from casatasks import CORR_TYPES, manual_model  # noqa: E402
+
+
+def write_standards(data_dir: str, standard: str = "Perley-Butler 2017") -> str:
+    # Flux-density standards table under <data_dir>/nrao/VLA/standards/, with seeded
+    # coefficients for every catalog source, and points ctsys.resolve at data_dir
+    table_name = os.path.join(data_dir, "nrao", "VLA", "standards", STANDARD_TABLES[standard])
+    rng = np.random.default_rng(SEED)
+    columns = {"Epoch": np.array([float(EPOCH)])}
+    for name in calibrator_catalog.names():
+        source = name.split("_")[0]
+        coefficients = TYPICAL_COEFFICIENTS + rng.normal(0.0, 0.02, TYPICAL_COEFFICIENTS.size)
+        columns[source + "_coeffs"] = coefficients[:, np.newaxis]
+        columns[source + "_coefferrs"] = np.abs(rng.normal(0.0, 0.005, (coefficients.size, 1)))
+    create_table(table_name, columns=columns)
+    os.environ[DATA_DIR_VARIABLE] = data_dir
+    return table_name
+
+
+@dataclass(init=True, repr=True)
+class SyntheticMS:
+    # Two calibrators observed in alternating rows: a polarized one for the angle and an
+    # unpolarized one for the leakage. Cross hands carry a cross-hand delay (ns) and phase
+    # (rad) and antenna leakages; the reference antenna has no R leakage, so the leakage
+    # solutions are exactly exp(i cross_hand_phase) dR and exp(-i cross_hand_phase) dL.
+    n_antennas: int = 10
+    n_spws: int = 4
+    n_channels: int = 64
+    n_times: int = 20
+    first_frequency: float = 2.0e9
+    spw_bandwidth: float = 128.0e6
+    integration: float = 10.0
+    scan_length: int = 5
+    noise: float = 0.01
+    cross_hand_delay: float = 2.5
+    cross_hand_phase: float = 0.6
+    leakage_amplitude: float = 0.05
+    pol_angle_field: str = "3C286"
+    leakage_field: str = "3C147"
+    leakage_flux: float = 20.0
+    leakage_spectral_index: float = -0.7
+    seed: int = SEED
+
+    @property
+    def n_baselines(self) -> int:
+        return self.n_antennas * (self.n_antennas - 1) // 2
+
+    @property
+    def n_rows(self) -> int:
+        return self.n_times * 2 * self.n_spws * self.n_baselines
+
+    def antenna_names(self) -> list:
+        return ["ea{0:02d}".format(antenna + 1) for antenna in range(self.n_antennas)]
+
+    def frequencies(self) -> np.ndarray:
+        # (spw, channel) channel centres of contiguous spws
+        width = self.spw_bandwidth / self.n_channels
+        channels = (np.arange(self.n_channels) + 0.5) * width
+        starts = self.first_frequency + np.arange(self.n_spws) * self.spw_bandwidth
+        return starts[:, np.newaxis] + channels
+
+    def leakages(self) -> tuple:
+        # Complex dR and dL per antenna, with dR of the reference antenna (0) set to zero
+        rng = np.random.default_rng(self.seed)
+        d_r, d_l = self.leakage_amplitude * (
+            rng.standard_normal((2, self.n_antennas)) +
+            1j * rng.standard_normal((2, self.n_antennas))
+        ) / np.sqrt(2.0)
+        d_r[0] = 0.0
+        return d_r, d_l
+
+    def _visibilities(self, frequencies, intensity, linear, antenna1, antenna2, rng):
+        # (correlation, channel, row) visibilities of one field and spw
+        d_r, d_l = self.leakages()
+        phase = np.exp(
+            1j * (2.0 * np.pi * self.cross_hand_delay * 1e-9 * frequencies + self.cross_hand_phase)
+        )[:, np.newaxis]
+        intensity = intensity[:, np.newaxis]
+        linear = linear[:, np.newaxis]
+        right = phase * (linear + intensity * (d_r[antenna1] + np.conj(d_l[antenna2])))
+        leakage = intensity * (d_l[antenna1] + np.conj(d_r[antenna2]))
+        left = np.conj(phase) * (np.conj(linear) + leakage)
+        parallel = np.broadcast_to(intensity, right.shape)
+        visibilities = np.array([parallel, right, left, parallel])
+        noise = rng.standard_normal(visibilities.shape + (2, )) @ np.array([1.0, 1j])
+        return (visibilities + self.noise * noise / np.sqrt(2.0)).astype(np.complex64)
+
+    def write(self, vis_name: str, pol_angle_model: dict) -> str:
+        # pol_angle_model holds the setjy(standard='manual') arguments of the polarized
+        # calibrator (fluxdensity, spix, reffreq, polindex, polangle), so the model ocarina
+        # sets for it matches the data
+        rng = np.random.default_rng(self.seed + 1)
+        frequencies = self.frequencies()
+        antenna1, antenna2 = np.triu_indices(self.n_antennas, k=1)
+
+        # Rows ordered by time, field, spw and baseline
+        times, fields, spws, baselines = np.meshgrid(
+            np.arange(self.n_times),
+            np.arange(2),
+            np.arange(self.n_spws),
+            np.arange(self.n_baselines),
+            indexing="ij"
+        )
+        times, fields, spws, baselines = (axis.ravel() for axis in (times, fields, spws, baselines))
+        data = np.zeros((len(CORR_TYPES), self.n_channels, self.n_rows), dtype=np.complex64)
+        for field_id in range(2):
+            for spw in range(self.n_spws):
+                if field_id == 0:
+                    intensity, linear = manual_model(frequencies[spw], **pol_angle_model)
+                else:
+                    intensity = self.leakage_flux * (
+                        frequencies[spw] / self.first_frequency
+                    )**self.leakage_spectral_index
+                    linear = np.zeros_like(intensity, dtype=np.complex128)
+                rows = np.flatnonzero((fields == field_id) & (spws == spw))
+                data[..., rows] = self._visibilities(
+                    frequencies[spw], intensity, linear, antenna1[baselines[rows]],
+                    antenna2[baselines[rows]], rng
+                )
+
+        # Scratch columns as CASA initializes them: a 1 Jy unpolarized model
+        model = np.zeros_like(data)
+        model[0] = 1.0
+        model[3] = 1.0
+        time = 5.0e9 + (times + fields / 2.0) * self.integration
+        create_table(
+            vis_name,
+            columns={
+                "ANTENNA1": antenna1[baselines].astype(np.int32),
+                "ANTENNA2": antenna2[baselines].astype(np.int32),
+                "FIELD_ID": fields.astype(np.int32),
+                "DATA_DESC_ID": spws.astype(np.int32),
+                "SCAN_NUMBER": (1 + fields + 2 * (times // self.scan_length)).astype(np.int32),
+                "TIME": time,
+                "DATA": data,
+                "MODEL_DATA": model,
+                "CORRECTED_DATA": data,
+                "FLAG": np.zeros(data.shape, dtype=bool),
+                "FLAG_ROW": np.zeros(self.n_rows, dtype=bool)
+            }
+        )
+        create_table(
+            os.path.join(vis_name, "SPECTRAL_WINDOW"),
+            columns={
+                "NAME": np.array(["SPW" + str(spw) for spw in range(self.n_spws)]),
+                "NUM_CHAN": np.full(self.n_spws, self.n_channels, dtype=np.int32),
+                "REF_FREQUENCY": frequencies[:, 0],
+                "FLAG_ROW": np.zeros(self.n_spws, dtype=bool)
+            },
+            var_columns={"CHAN_FREQ": list(frequencies)}
+        )
+        create_table(
+            os.path.join(vis_name, "FIELD"),
+            columns={"NAME": np.array([self.pol_angle_field, self.leakage_field])}
+        )
+        create_table(
+            os.path.join(vis_name, "ANTENNA"), columns={"NAME": np.array(self.antenna_names())}
+        )
+        create_table(
+            os.path.join(vis_name, "POLARIZATION"),
+            columns={"NUM_CORR": np.array([len(CORR_TYPES)], dtype=np.int32)},
+            var_columns={"CORR_TYPE": [np.array(CORR_TYPES, dtype=np.int32)]}
+        )
+        create_table(
+            os.path.join(vis_name, "DATA_DESCRIPTION"),
+            columns={
+                "SPECTRAL_WINDOW_ID": np.arange(self.n_spws, dtype=np.int32),
+                "POLARIZATION_ID": np.zeros(self.n_spws, dtype=np.int32)
+            }
+        )
+        create_table(
+            os.path.join(vis_name, "OBSERVATION"),
+            columns={"TIME_RANGE": np.array([[np.min(time)], [np.max(time)]])}
+        )
+        return vis_name
@@ -1,3 +1,8 @@
+from .batchfit import fit_flux_functions, fit_pol_functions
 from .fluxfunction import FluxFunction
-from .function import Function
+from .function import Function, horner
 from .polfunction import PolFunction
+from .stokesmodel import StokesModel
+from .uncertainty import (
+    PERCENTILES, StokesUncertainty, draw_coefficients, monte_carlo_flux, monte_carlo_stokes
+)
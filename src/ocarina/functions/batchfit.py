@@ -0,0 +1,173 @@
+import numpy as np
+from astropy.units import Quantity
+from typing import Union, Tuple
+from ..utils.tracing import traced
+from .function import _weighted_least_squares
+from .fluxfunction import log_linear_coefficients
+
+
+def _prepare_batch(
+    xdata: Union[np.ndarray, Quantity],
+    data: Union[np.ndarray, Quantity],
+    x_0: Union[float, np.ndarray, Quantity],
+    mask: np.ndarray = None,
+    sigma: np.ndarray = None
+):
+    # Brings every input to plain float64 arrays of shape (n_spectra, n_freq), x_0 to
+    # (n_spectra, 1) in the units of xdata, and turns mask and sigma into row weights.
+    if isinstance(xdata, Quantity):
+        if isinstance(x_0, Quantity):
+            x_0 = x_0.to(xdata.unit)
+        xdata = xdata.value
+    if isinstance(x_0, Quantity):
+        x_0 = x_0.value
+    if isinstance(data, Quantity):
+        data = data.value
+
+    data = np.asarray(data, dtype=np.float64)
+    single = data.ndim == 1
+    data = np.atleast_2d(data)
+    xdata = np.broadcast_to(np.asarray(xdata, dtype=np.float64), data.shape)
+    x_0 = np.broadcast_to(np.asarray(x_0, dtype=np.float64).reshape(-1, 1), (data.shape[0], 1))
+
+    if mask is None:
+        mask = np.ones(data.shape, dtype=bool)
+    else:
+        mask = np.broadcast_to(np.asarray(mask, dtype=bool), data.shape)
+    mask = mask & np.isfinite(data) & np.isfinite(xdata)
+
+    if sigma is None:
+        weights = np.ones(data.shape)
+    else:
+        weights = 1.0 / np.broadcast_to(np.asarray(sigma, dtype=np.float64), data.shape)
+    weights = np.where(mask, weights, 0.0)
+
+    # Masked entries are zero-weighted; replace them so they cannot leak NaNs into the solve
+    xdata = np.where(mask, xdata, x_0)
+    data = np.where(mask, data, 0.0)
+    return xdata, data, x_0, weights, single
+
+
+def _condition_invalid_rows(design, weights, n_terms):
+    # Rows without enough valid points are solved against an identity design so the batched
+    # factorization stays regular; their results are discarded afterwards
+    if design.shape[-2] < n_terms:
+        raise ValueError("The number of data points cannot be smaller than the number of terms")
+    valid_rows = np.count_nonzero(weights, axis=-1) >= n_terms
+    design[~valid_rows] = np.eye(design.shape[-2], n_terms)
+    weights[~valid_rows] = 1.0
+    return valid_rows
+
+
+def _finish_batch(coefficients, covariance, valid_rows, single, return_covariance):
+    coefficients[~valid_rows] = np.nan
+    covariance[~valid_rows] = np.nan
+    errors = np.sqrt(np.diagonal(covariance, axis1=-2, axis2=-1))
+    if single:
+        coefficients, errors, covariance = coefficients[0], errors[0], covariance[0]
+    if return_covariance:
+        return coefficients, errors, covariance
+    return coefficients, errors
+
+
+@traced("fit")
+def fit_pol_functions(
+    xdata: Union[np.ndarray, Quantity],
+    data: Union[np.ndarray, Quantity],
+    x_0: Union[float, np.ndarray, Quantity],
+    n_terms: int = 3,
+    mask: np.ndarray = None,
+    sigma: np.ndarray = None,
+    return_covariance: bool = False
+) -> Tuple[np.ndarray, ...]:
+    # Fits PolFunction polynomials in (x - x_0) / x_0 to every row of data at once.
+    # xdata is (n_freq,) or (n_spectra, n_freq), x_0 is a scalar or one value per row and
+    # mask flags the valid entries of each row. Rows with fewer valid points than terms get NaN.
+    xdata, data, x_0, weights, single = _prepare_batch(xdata, data, x_0, mask, sigma)
+    nu_div = (xdata - x_0) / x_0
+    design = nu_div[..., np.newaxis]**np.arange(n_terms)
+    valid_rows = _condition_invalid_rows(design, weights, n_terms)
+
+    coefficients, covariance = _weighted_least_squares(design, data, weights)
+    return _finish_batch(coefficients, covariance, valid_rows, single, return_covariance)
+
+
+@traced("fit")
+def fit_flux_functions(
+    xdata: Union[np.ndarray, Quantity],
+    data: Union[np.ndarray, Quantity],
+    x_0: Union[float, np.ndarray, Quantity],
+    flux_0: Union[float, np.ndarray, Quantity],
+    mask: np.ndarray = None,
+    sigma: np.ndarray = None,
+    initial_coefficients: np.ndarray = None,
+    max_iterations: int = 200,
+    tolerance: float = 1e-12,
+    return_covariance: bool = False
+) -> Tuple[np.ndarray, ...]:
+    # Fits the FluxFunction curved power law flux_0 * (x / x_0)^(a + b log10(x / x_0)) to every
+    # row of data at once with a vectorized Levenberg-Marquardt iteration on (a, b).
+    xdata, data, x_0, weights, single = _prepare_batch(xdata, data, x_0, mask, sigma)
+    if isinstance(flux_0, Quantity):
+        flux_0 = flux_0.value
+    flux_0 = np.broadcast_to(np.asarray(flux_0, dtype=np.float64).reshape(-1, 1), x_0.shape)
+    n_spectra = data.shape[0]
+
+    log_nu_div = np.log10(xdata / x_0)
+    design = np.stack([log_nu_div, log_nu_div**2], axis=-1)
+    valid_rows = _condition_invalid_rows(design, weights, 2)
+
+    if initial_coefficients is None:
+        # Warm start from the log-log fit, only on the rows that can be fitted: the masked
+        # points of the others sit at x_0, where the log design is singular
+        coefficients = np.zeros((n_spectra, 2))
+        if np.any(valid_rows):
+            coefficients[valid_rows] = log_linear_coefficients(
+                xdata[valid_rows] / x_0[valid_rows], data[valid_rows] / flux_0[valid_rows],
+                weights[valid_rows]
+            )
+    else:
+        coefficients = np.array(np.broadcast_to(initial_coefficients, (n_spectra, 2)), dtype=float)
+
+    def residuals_and_jacobian(c):
+        exponent = np.einsum("...nm,...m->...n", design, c)
+        model = flux_0 * 10.0**exponent
+        residuals = weights * (data - model)
+        jacobian = (weights * model * np.log(10.0))[..., np.newaxis] * design
+        return residuals, jacobian
+
+    residuals, jacobian = residuals_and_jacobian(coefficients)
+    cost = np.sum(residuals**2, axis=-1)
+    damping = np.full(n_spectra, 1e-3)
+    active = valid_rows.copy()
+    identity = np.eye(2)
+
+    for _ in range(max_iterations):
+        if not np.any(active):
+            break
+        jtj = np.swapaxes(jacobian, -1, -2) @ jacobian
+        jtr = np.einsum("...nm,...n->...m", jacobian, residuals)
+        scaling = (np.diagonal(jtj, axis1=-2, axis2=-1)[..., np.newaxis] + 1e-30) * identity
+        step = np.linalg.solve(
+            jtj + damping[:, np.newaxis, np.newaxis] * scaling, jtr[..., np.newaxis]
+        )[..., 0]
+
+        trial = coefficients + np.where(active[:, np.newaxis], step, 0.0)
+        trial_residuals, trial_jacobian = residuals_and_jacobian(trial)
+        trial_cost = np.sum(trial_residuals**2, axis=-1)
+        improved = active & np.isfinite(trial_cost) & (trial_cost <= cost)
+
+        coefficients = np.where(improved[:, np.newaxis], trial, coefficients)
+        residuals = np.where(improved[:, np.newaxis], trial_residuals, residuals)
+        jacobian = np.where(improved[:, np.newaxis, np.newaxis], trial_jacobian, jacobian)
+        converged = improved & (cost - trial_cost <= tolerance * np.maximum(cost, tolerance))
+        cost = np.where(improved, trial_cost, cost)
+        damping = np.where(improved, damping / 10.0, damping * 10.0)
+        active &= ~converged & (damping < 1e16)
+
+    jtj = np.swapaxes(jacobian, -1, -2) @ jacobian
+    degrees_of_freedom = np.count_nonzero(weights, axis=-1) - 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        residual_variance = np.where(degrees_of_freedom > 0, cost / degrees_of_freedom, np.inf)
+        covariance = np.linalg.pinv(jtj) * residual_variance[:, np.newaxis, np.newaxis]
+    return _finish_batch(coefficients, covariance, valid_rows, single, return_covariance)
@@ -2,26 +2,60 @@ import numpy as np
 from typing import Union
 from astropy.units import Quantity
 from dataclasses import dataclass
-from .function import Function
+from .function import Function, _weighted_least_squares
+
+
+def log_linear_coefficients(
+    nu_div: np.ndarray, data_div: np.ndarray, weights: np.ndarray = None
+) -> np.ndarray:
+    # With flux_0 fixed, log10(S / flux_0) = a * log10(nu_div) + b * log10(nu_div)^2, so the
+    # curved power law is linear in (a, b) in log-log space. Inputs can carry leading stack
+    # dimensions; non-positive fluxes get zero weight.
+    valid = data_div > 0.0
+    if weights is None:
+        weights = np.ones(data_div.shape)
+    # Propagate the linear-space weights to log space: d(log10 S) = dS / (S ln 10)
+    log_weights = np.where(valid, weights * np.abs(data_div) * np.log(10.0), 0.0)
+    log_nu_div = np.log10(nu_div)
+    log_data_div = np.log10(np.where(valid, data_div, 1.0))
+    design = np.stack([log_nu_div, log_nu_div**2], axis=-1)
+    coefficients, _ = _weighted_least_squares(design, log_data_div, log_weights)
+    return coefficients
 
 
 @dataclass(init=True, repr=True)
 class FluxFunction(Function):
     flux_0: float = 0.0
 
-    def f(self, xdata: Union[np.ndarray, Quantity], *args):
+    def _nu_div(self, xdata: Union[np.ndarray, Quantity]):
         nu_div = xdata / self.x_0
         if isinstance(nu_div, Quantity):
             nu_div = nu_div.value
+        return nu_div
+
+    def f(self, xdata: Union[np.ndarray, Quantity], *args):
+        nu_div = self._nu_div(xdata)
         exp = args[0] + args[1] * np.log10(nu_div)
         s_flux = self.flux_0 * nu_div**exp
         return s_flux
 
     def f_eval(self, xdata: Union[np.ndarray, Quantity], coefficients):
         self.check_same_units(xdata)
-        nu_div = xdata / self.x_0
-        if isinstance(nu_div, Quantity):
-            nu_div = nu_div.value
+        nu_div = self._nu_div(xdata)
         exp = coefficients[0] + coefficients[1] * np.log10(nu_div)
         s_flux = self.flux_0 * nu_div**exp
         return s_flux
+
+    def jacobian(self, xdata: Union[np.ndarray, Quantity], *args):
+        # dS/da = S ln(nu_div), dS/db = S ln(nu_div) log10(nu_div)
+        nu_div = self._nu_div(xdata)
+        log_nu_div = np.log10(nu_div)
+        s_flux = self.f(xdata, *args)
+        d_alpha = s_flux * np.log(nu_div)
+        return np.stack([d_alpha, d_alpha * log_nu_div], axis=-1)
+
+    def initial_guess(self, xdata: Union[np.ndarray, Quantity], data):
+        flux_0 = self.flux_0.value if isinstance(self.flux_0, Quantity) else self.flux_0
+        if isinstance(data, Quantity):
+            data = data.value
+        return log_linear_coefficients(self._nu_div(xdata), np.asarray(data) / flux_0)
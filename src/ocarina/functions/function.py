@@ -1,9 +1,47 @@
 import numpy as np
-from scipy.optimize import curve_fit
 from abc import ABCMeta, abstractmethod
 from dataclasses import dataclass
 from astropy.units import Quantity
 from typing import Union
+from ..utils.tracing import traced
+
+
+def _weighted_least_squares(design: np.ndarray, data: np.ndarray, weights: np.ndarray = None):
+    # Solves min ||W (A c - y)|| through a QR factorization of W A. Every argument can carry
+    # leading stack dimensions: design is (..., n, m), data and weights are (..., n).
+    # The covariance is scaled by the reduced chi-square, as curve_fit does by default
+    if weights is None:
+        weights = np.ones(data.shape)
+    weighted_design = weights[..., np.newaxis] * design
+    weighted_data = weights * data
+    q, r = np.linalg.qr(weighted_design)
+    qtb = np.einsum("...nm,...n->...m", q, weighted_data)
+    coefficients = np.linalg.solve(r, qtb[..., np.newaxis])[..., 0]
+
+    residuals = weighted_data - np.einsum("...nm,...m->...n", weighted_design, coefficients)
+    degrees_of_freedom = np.count_nonzero(weights, axis=-1) - design.shape[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        residual_variance = np.where(
+            degrees_of_freedom > 0,
+            np.sum(residuals**2, axis=-1) / degrees_of_freedom, np.inf
+        )
+    r_inv = np.linalg.inv(r)
+    covariance = r_inv @ np.swapaxes(r_inv, -1, -2)
+    covariance = covariance * residual_variance[..., np.newaxis, np.newaxis]
+    return coefficients, covariance
+
+
+def horner(x: np.ndarray, coefficients: np.ndarray) -> np.ndarray:
+    # sum_k c_k x^k in float64, with the terms on the last axis of coefficients. The leading
+    # axes of coefficients broadcast against x, so a batch of polynomials shaped (n, 1, terms)
+    # evaluated on x shaped (n_channels,) gives (n, n_channels) in a single pass per term.
+    x = np.asarray(x, dtype=np.float64)
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+    result = np.zeros(np.broadcast_shapes(coefficients.shape[:-1], x.shape))
+    for k in range(coefficients.shape[-1] - 1, -1, -1):
+        result *= x
+        result += coefficients[..., k]
+    return result
 
 
 @dataclass(init=True, repr=True)
@@ -28,6 +66,15 @@ class Function(metaclass=ABCMeta):
                 print("Converting x_0 to {0}".format(xdata.unit))
                 self.x_0 = self.x_0.to(xdata.unit)
 
+    # Subclasses with an analytic derivative override this with a method returning the
+    # (n_data, n_coefficients) matrix of partial derivatives of f. None means finite differences
+    jacobian = None
+
+    # Deterministic starting point for the iterative solver
+    def initial_guess(self, xdata, data):
+        return None
+
+    @traced("fit")
     def fit(
         self,
         xdata,
@@ -37,11 +84,21 @@ class Function(metaclass=ABCMeta):
         upper_bound=np.inf,
         sigma=None
     ):
+        self.check_same_units(xdata)
+        guessed = initial_coefficients is None
+        if guessed:
+            initial_coefficients = self.initial_guess(xdata, data)
+        if initial_coefficients is None:
+            raise ValueError("Initial coefficients cannot be None for this function")
         lower_bounds = np.ones_like(initial_coefficients) * lower_bound
         upper_bounds = np.ones_like(initial_coefficients) * upper_bound
+        if guessed:
+            initial_coefficients = np.clip(initial_coefficients, lower_bounds, upper_bounds)
 
-        self.check_same_units(xdata)
-        self.x_0 = self.x_0.value
+        if isinstance(self.x_0, Quantity):
+            self.x_0 = self.x_0.value
+        # scipy.optimize is slow to import and only needed by the iterative solver
+        from scipy.optimize import curve_fit
         popt, pcov = curve_fit(
             self.f,
             xdata,
@@ -49,7 +106,8 @@ class Function(metaclass=ABCMeta):
             p0=initial_coefficients,
             check_finite=True,
             sigma=sigma,
-            bounds=(lower_bounds, upper_bounds)
+            bounds=(lower_bounds, upper_bounds),
+            jac=self.jacobian
         )
         opt_error = np.sqrt(np.diag(pcov))
         self.coefficients = popt
@@ -1,4 +1,4 @@
-from .function import Function
+from .function import Function, _weighted_least_squares, horner
 from astropy.units import Quantity
 from dataclasses import dataclass
 import numpy as np
@@ -13,21 +13,79 @@ class PolFunction(Function):
         if self.coefficients is None:
             self.coefficients = np.array([])
 
+    def _nu_div(self, xdata) -> np.ndarray:
+        # (x - x_0) / x_0 on plain float64 values, converting units once
+        x_0 = self.x_0
+        if isinstance(xdata, Quantity):
+            xdata = xdata.to_value(x_0.unit) if isinstance(x_0, Quantity) else xdata.value
+        if isinstance(x_0, Quantity):
+            x_0 = x_0.value
+        return (np.asarray(xdata, dtype=np.float64) - x_0) / x_0
+
     def f(self, xdata, *args):
-        y = np.zeros(xdata.shape)
-        nu_div = (xdata - self.x_0) / self.x_0
-        if isinstance(nu_div, Quantity):
-            nu_div = nu_div.value
-        for i in range(0, self.n_terms):
-            y += args[i] * nu_div**i
-        return y
+        return horner(self._nu_div(xdata), args[:self.n_terms])
 
     def f_eval(self, xdata, coefficients):
         self.check_same_units(xdata)
-        y = np.zeros(xdata.shape)
-        nu_div = ((xdata - self.x_0) / self.x_0)
-        if isinstance(nu_div, Quantity):
-            nu_div = nu_div.value
-        for i in range(0, len(coefficients)):
-            y += coefficients[i] * nu_div**i
-        return y
+        return horner(self._nu_div(xdata), coefficients)
+
+    def vandermonde(self, xdata) -> np.ndarray:
+        # Design matrix of the polynomial in (x - x_0) / x_0, one column per term
+        return np.vander(self._nu_div(xdata), self.n_terms, increasing=True)
+
+    def jacobian(self, xdata, *args):
+        return self.vandermonde(xdata)
+
+    def initial_guess(self, xdata, data):
+        if isinstance(data, Quantity):
+            data = data.value
+        coefficients, _ = _weighted_least_squares(self.vandermonde(xdata), np.asarray(data))
+        return coefficients
+
+    def linear_fit(self, xdata, data, sigma=None):
+        # The model is linear in its coefficients, so it can be solved directly.
+        # data can be a single spectrum (n_freq,) or a stack of spectra (n_spectra, n_freq)
+        # sharing the same xdata; sigma broadcasts against data.
+        self.check_same_units(xdata)
+        if isinstance(data, Quantity):
+            data = data.value
+        data = np.asarray(data, dtype=np.float64)
+
+        weights = None
+        if sigma is not None:
+            weights = 1.0 / np.broadcast_to(np.asarray(sigma, dtype=np.float64), data.shape)
+
+        design = self.vandermonde(xdata)
+        if data.ndim > 1:
+            design = np.broadcast_to(design, data.shape[:-1] + design.shape)
+
+        popt, pcov = _weighted_least_squares(design, data, weights)
+        opt_error = np.sqrt(np.diagonal(pcov, axis1=-2, axis2=-1))
+        self.coefficients = popt
+        self.coefficients_errors = opt_error
+        return popt, opt_error
+
+    def fit(
+        self,
+        xdata,
+        data,
+        initial_coefficients=None,
+        lower_bound=-np.inf,
+        upper_bound=np.inf,
+        sigma=None,
+        method: str = "linear"
+    ):
+        # Bounded problems still need the iterative solver
+        if method == "linear" and np.all(np.isinf([lower_bound, upper_bound])):
+            return self.linear_fit(xdata, data, sigma=sigma)
+        elif method in ("linear", "curve_fit"):
+            return super().fit(
+                xdata,
+                data,
+                initial_coefficients=initial_coefficients,
+                lower_bound=lower_bound,
+                upper_bound=upper_bound,
+                sigma=sigma
+            )
+        else:
+            raise ValueError("Fit method must be either 'linear' or 'curve_fit'")
@@ -0,0 +1,148 @@
+import numpy as np
+import astropy.units as un
+from astropy.units import Quantity
+from dataclasses import dataclass
+from typing import Union
+from .function import horner
+
+SPEED_OF_LIGHT = 299792458.0
+
+
+def _hertz(nu: Union[float, np.ndarray, Quantity, str]) -> np.ndarray:
+    # Frequencies as float64 Hz; plain numbers are taken to be in Hz already
+    if isinstance(nu, str):
+        nu = Quantity(nu)
+    if isinstance(nu, Quantity):
+        return np.asarray(nu.to_value(un.Hz), dtype=np.float64)
+    return np.asarray(nu, dtype=np.float64)
+
+
+def _terms(coefficients, n_sources: int) -> np.ndarray:
+    # Coefficients as (n_sources, n_terms), or (n_terms,) for a single source
+    if coefficients is None:
+        coefficients = np.zeros(0)
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+    if n_sources is None:
+        return coefficients.reshape(-1)
+    if coefficients.size == 0:
+        # e.g. a batch of unpolarized sources
+        return np.zeros((n_sources, 0))
+    return np.broadcast_to(
+        coefficients.reshape(-1, coefficients.shape[-1]), (n_sources, coefficients.shape[-1])
+    )
+
+
+@dataclass(init=True, repr=True)
+class StokesModel:
+    # Stokes I, Q, U and V of a source, as setjy(standard='manual') models it, evaluated on any
+    # set of channels in float64 with one Horner pass per term:
+    #   log10 I = log10 intensity + y (alpha + beta y + ...), y = log10(nu / nu_0)
+    #   p = sum_k p_k x^k, chi = sum_k chi_k x^k + RM (lambda^2 - lambda_0^2), x = nu / nu_0 - 1
+    #   Q + iU = p I exp(2i chi), V = 0
+    # intensity given as an array makes a batch of sources, with one row of coefficients (and
+    # optionally one nu_0 and rotation measure) per source.
+    nu_0: Union[float, np.ndarray, Quantity] = 1.0e9
+    intensity: Union[float, np.ndarray] = 1.0
+    spectral_index: np.ndarray = None
+    pol_fraction: np.ndarray = None
+    pol_angle: np.ndarray = None
+    rotation_measure: Union[float, np.ndarray] = 0.0
+
+    def __post_init__(self):
+        self.intensity = np.asarray(self.intensity, dtype=np.float64)
+        if self.intensity.ndim > 1:
+            raise ValueError("Intensity must be a scalar or one value per source")
+        n_sources = self.n_sources
+        self.nu_0 = _hertz(self.nu_0)
+        self.rotation_measure = np.asarray(self.rotation_measure, dtype=np.float64)
+        if n_sources is not None:
+            self.nu_0 = np.broadcast_to(self.nu_0, (n_sources, ))
+            self.rotation_measure = np.broadcast_to(self.rotation_measure, (n_sources, ))
+        self.spectral_index = _terms(self.spectral_index, n_sources)
+        self.pol_fraction = _terms(self.pol_fraction, n_sources)
+        self.pol_angle = _terms(self.pol_angle, n_sources)
+
+    @property
+    def n_sources(self) -> int:
+        # None for a single source
+        return None if self.intensity.ndim == 0 else len(self.intensity)
+
+    @classmethod
+    def from_setjy(
+        cls,
+        fluxdensity: list = (1.0, 0.0, 0.0, 0.0),
+        spix: list = (),
+        reffreq: Union[float, Quantity, str] = 1.0e9,
+        polindex: list = (),
+        polangle: list = (),
+        rotmeas: float = 0.0
+    ):
+        # The model of the setjy(standard='manual') arguments ocarina passes
+        return cls(
+            nu_0=reffreq,
+            intensity=fluxdensity[0],
+            spectral_index=spix,
+            pol_fraction=polindex,
+            pol_angle=polangle,
+            rotation_measure=rotmeas
+        )
+
+    @classmethod
+    def batch(cls, models: list):
+        # Stacks single-source models; shorter polynomials are padded with zero terms
+        def stacked(name):
+            terms = [getattr(model, name) for model in models]
+            n_terms = max(len(coefficients) for coefficients in terms)
+            return np.array(
+                [np.pad(coefficients, (0, n_terms - len(coefficients))) for coefficients in terms]
+            )
+
+        return cls(
+            nu_0=np.array([model.nu_0 for model in models]),
+            intensity=np.array([model.intensity for model in models]),
+            spectral_index=stacked("spectral_index"),
+            pol_fraction=stacked("pol_fraction"),
+            pol_angle=stacked("pol_angle"),
+            rotation_measure=np.array([model.rotation_measure for model in models])
+        )
+
+    def _per_source(self, values: np.ndarray, ndim: int) -> np.ndarray:
+        # Per-source values (or coefficient rows) against channel arrays with ndim axes
+        if self.n_sources is None:
+            return values
+        extra = 1 if values.ndim > 1 else 0
+        return values.reshape(values.shape[:1] + (1, ) * ndim + values.shape[1:1 + extra])
+
+    def intensity_at(self, nu: Union[np.ndarray, Quantity]) -> np.ndarray:
+        nu = _hertz(nu)
+        nu_0 = self._per_source(self.nu_0, nu.ndim)
+        log_nu = np.log10(nu / nu_0)
+        exponent = horner(log_nu, self._per_source(self.spectral_index, nu.ndim))
+        return self._per_source(self.intensity, nu.ndim) * 10.0**(log_nu * exponent)
+
+    def fraction_and_angle(self, nu: Union[np.ndarray, Quantity]) -> tuple:
+        # Polarization fraction and angle (rad) per channel
+        nu = _hertz(nu)
+        nu_0 = self._per_source(self.nu_0, nu.ndim)
+        x = (nu - nu_0) / nu_0
+        pol_fraction = horner(x, self._per_source(self.pol_fraction, nu.ndim))
+        pol_angle = horner(x, self._per_source(self.pol_angle, nu.ndim))
+        if np.any(self.rotation_measure != 0.0):
+            rotation_measure = self._per_source(self.rotation_measure, nu.ndim)
+            pol_angle = pol_angle + rotation_measure * SPEED_OF_LIGHT**2 * (
+                1.0 / nu**2 - 1.0 / nu_0**2
+            )
+        return pol_fraction, pol_angle
+
+    def evaluate(self, nu: Union[np.ndarray, Quantity]) -> np.ndarray:
+        # (4, [n_sources,] *nu.shape) array of I, Q, U and V in Jy. nu can hold the channels
+        # of every spw at once, e.g. MSMetadata.chan_freq
+        intensity = self.intensity_at(nu)
+        pol_fraction, pol_angle = self.fraction_and_angle(nu)
+        linear = pol_fraction * intensity
+        return np.stack(
+            [
+                intensity, linear * np.cos(2.0 * pol_angle), linear * np.sin(2.0 * pol_angle),
+                np.zeros_like(intensity)
+            ]
+        )
@@ -0,0 +1,139 @@
+import numpy as np
+import astropy.units as un
+from astropy.units import Quantity
+from dataclasses import dataclass
+from typing import Union
+from .function import horner
+from .stokesmodel import StokesModel, _hertz
+
+# Median and the one and two sigma bands of a normal distribution
+PERCENTILES = (2.275, 15.865, 50.0, 84.135, 97.725)
+
+
+def draw_coefficients(
+    coefficients: np.ndarray,
+    covariance: np.ndarray = None,
+    errors: np.ndarray = None,
+    n_draws: int = 4000,
+    rng: np.random.Generator = None
+) -> np.ndarray:
+    # (n_draws, n_terms) normal realizations of the coefficients, correlated by covariance or
+    # independent with standard deviations errors; without either they are all the same
+    coefficients = np.asarray(coefficients, dtype=np.float64).reshape(-1)
+    if rng is None:
+        rng = np.random.default_rng()
+    if covariance is None:
+        errors = np.zeros_like(coefficients) if errors is None else errors
+        covariance = np.diag(np.asarray(errors, dtype=np.float64)**2)
+    covariance = np.asarray(covariance, dtype=np.float64)
+    if covariance.shape != (len(coefficients), len(coefficients)):
+        raise ValueError("The covariance must have one row and column per coefficient")
+    if not np.all(np.isfinite(covariance)):
+        raise ValueError("The covariance of the coefficients is not finite")
+    # An eigendecomposition, unlike a Cholesky one, takes the singular covariances of exactly
+    # determined fits
+    variances, axes = np.linalg.eigh(covariance)
+    scale = axes * np.sqrt(np.clip(variances, 0.0, None))
+    return coefficients + rng.standard_normal((n_draws, len(coefficients))) @ scale.T
+
+
+def _draw_terms(
+    coefficients: np.ndarray, covariance: np.ndarray, n_draws: int, rng: np.random.Generator
+) -> np.ndarray:
+    # Empty coefficient sets (e.g. the polarization of an unpolarized model) are not drawn
+    if len(coefficients) == 0:
+        return np.zeros((n_draws, 0))
+    return draw_coefficients(coefficients, covariance, n_draws=n_draws, rng=rng)
+
+
+def monte_carlo_flux(
+    nu: Union[np.ndarray, Quantity],
+    coefficients: np.ndarray,
+    errors: np.ndarray = None,
+    covariance: np.ndarray = None,
+    n_draws: int = 4000,
+    seed: int = None
+) -> np.ndarray:
+    # (n_draws, *nu.shape) fluxes of the tabulated log10 S = sum_k c_k log10(nu)^k polynomial
+    # (nu in GHz) for realizations of its coefficients
+    if isinstance(nu, Quantity):
+        nu = nu.to_value(un.GHz)
+    draws = draw_coefficients(
+        coefficients, covariance, errors, n_draws, np.random.default_rng(seed)
+    )
+    log_nu = np.log10(np.asarray(nu, dtype=np.float64))
+    return 10.0**horner(log_nu, draws.reshape((n_draws, ) + (1, ) * log_nu.ndim + (-1, )))
+
+
+@dataclass(init=True, repr=True)
+class StokesUncertainty:
+    # Spread of I, Q, U and V over Monte Carlo realizations of a source model: percentile
+    # bands (n_percentiles, 4, n_nu), mean and standard deviation (4, n_nu) and the covariance
+    # of every Stokes parameter between channels (4, n_nu, n_nu)
+    nu: np.ndarray = None
+    n_draws: int = 0
+    percentiles: np.ndarray = None
+    bands: np.ndarray = None
+    mean: np.ndarray = None
+    std: np.ndarray = None
+    covariance: np.ndarray = None
+
+    def band(self, percentile: float) -> np.ndarray:
+        # (4, n_nu) values at one of the computed percentiles
+        index = np.flatnonzero(np.isclose(self.percentiles, percentile))
+        if len(index) == 0:
+            raise ValueError("Percentile {0} was not computed".format(percentile))
+        return self.bands[index[0]]
+
+
+def monte_carlo_stokes(
+    model: StokesModel,
+    nu: Union[np.ndarray, Quantity],
+    spectral_covariance: np.ndarray = None,
+    pol_fraction_covariance: np.ndarray = None,
+    pol_angle_covariance: np.ndarray = None,
+    n_draws: int = 4000,
+    percentiles: tuple = PERCENTILES,
+    seed: int = None,
+    covariance: bool = True
+) -> StokesUncertainty:
+    # Propagates coefficient uncertainties of a single-source model to its Stokes spectrum.
+    # spectral_covariance is that of (log10 intensity, *spectral_index), as reexpanded from
+    # the flux-density tables; parts without a covariance stay fixed. All realizations are
+    # evaluated as one StokesModel batch.
+    if model.n_sources is not None:
+        raise ValueError("Uncertainties are propagated for a single source model")
+    nu = _hertz(nu).reshape(-1)
+    rng = np.random.default_rng(seed)
+    log_flux = draw_coefficients(
+        np.concatenate([[np.log10(model.intensity)], model.spectral_index]),
+        spectral_covariance,
+        n_draws=n_draws,
+        rng=rng
+    )
+    realizations = StokesModel(
+        nu_0=model.nu_0,
+        intensity=10.0**log_flux[:, 0],
+        spectral_index=log_flux[:, 1:],
+        pol_fraction=_draw_terms(model.pol_fraction, pol_fraction_covariance, n_draws, rng),
+        pol_angle=_draw_terms(model.pol_angle, pol_angle_covariance, n_draws, rng),
+        rotation_measure=model.rotation_measure
+    )
+    # (4, n_draws, n_nu)
+    samples = realizations.evaluate(nu)
+    mean = np.mean(samples, axis=1)
+    deviations = samples - mean[:, np.newaxis]
+    degrees_of_freedom = max(n_draws - 1, 1)
+    stokes_covariance = None
+    if covariance:
+        # Batched matrix product, (4, n_nu, n_draws) @ (4, n_draws, n_nu)
+        stokes_covariance = np.swapaxes(deviations, 1, 2) @ deviations / degrees_of_freedom
+    return StokesUncertainty(
+        nu=nu,
+        n_draws=n_draws,
+        percentiles=np.asarray(percentiles, dtype=np.float64),
+        bands=np.percentile(samples, percentiles, axis=1),
+        mean=mean,
+        std=np.sqrt(np.sum(deviations**2, axis=1) / degrees_of_freedom),
+        covariance=stokes_covariance
+    )
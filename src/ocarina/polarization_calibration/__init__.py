@@ -1 +1,7 @@
 from .polcalibration import PolarizationCalibrator
+from .plotqueue import PlotQueue, PlotSpec
+from .pipeline import CalibrationPipeline, PipelineNode
+from .caltablestore import CaltableStore
+from .batch import BatchDriver, BatchJob
+from .daemon import WorkerDaemon, submit_job
+from .modelwriter import ModelWriter
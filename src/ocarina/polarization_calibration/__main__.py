@@ -0,0 +1,10 @@
+import sys
+from .batch import main
+from .daemon import DAEMON_COMMANDS, main as daemon_main
+
+# python -m ocarina.polarization_calibration manifest.json
+# python -m ocarina.polarization_calibration serve|submit|status|stop ...
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in DAEMON_COMMANDS:
+        sys.exit(daemon_main(sys.argv[1:]))
+    sys.exit(main())
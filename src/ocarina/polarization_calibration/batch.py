@@ -0,0 +1,293 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from multiprocessing.connection import wait
+from dataclasses import dataclass, field
+from typing import List
+import numpy as np
+from astropy.units import Quantity
+from ..polarized_sources import PolarizedSource
+from ..utils import MSMetadata, Tracer, table_pool
+from .caltablestore import CaltableStore
+from .pipeline import CalibrationPipeline
+from .polcalibration import PolarizationCalibrator
+
+# Rough cost model of a calibration: a CASA process needs BASE_MEMORY on its own plus a
+# fraction of the visibilities it reads (complex64 DATA with its flags and weights)
+BASE_MEMORY = 2 * 1024**3
+BYTES_PER_VISIBILITY = 8 + 1 + 4
+GIGABYTE = 1024**3
+
+
+def estimate_visibility_bytes(vis_name: str) -> int:
+    # rows x channels x correlations of the MS, from the main table row count and the
+    # channels and correlations of each data description weighted equally
+    ms_metadata = MSMetadata.from_ms(vis_name)
+    with table_pool.open(vis_name) as tb:
+        n_rows = tb.nrows()
+    table_pool.close(vis_name)
+    channels = ms_metadata.spw_num_chan[ms_metadata.dd_spw_ids]
+    correlations = ms_metadata.pol_num_corr[ms_metadata.dd_pol_ids]
+    return int(n_rows * np.mean(channels * correlations) * BYTES_PER_VISIBILITY)
+
+
+def _calibrator_kwargs(config: dict) -> dict:
+    # JSON has no units: frequencies are given as strings such as "3 GHz"
+    kwargs = dict(config)
+    for key, value in config.items():
+        if key.startswith("nu_") and isinstance(value, str):
+            kwargs[key] = Quantity(value)
+        elif key == "spw_ids" and value is not None:
+            kwargs[key] = np.array(value)
+    return kwargs
+
+
+def _step_kwargs(kwargs: dict) -> dict:
+    # set_known_model and set_unknown_model take a PolarizedSource, named by pol_source
+    kwargs = dict(kwargs)
+    if "pol_source" in kwargs:
+        kwargs["pol_source_object"] = PolarizedSource(source=kwargs.pop("pol_source"))
+    return kwargs
+
+
+def run_calibration(job: dict) -> dict:
+    # Full calibration of one MS; runs inside the job process. The steps are chained into a
+    # CalibrationPipeline, so a retried job skips the steps it already finished. With
+    # "trace", the steps are traced into <vis>.ocarina_trace.jsonl and summarized at the end.
+    tracer = None
+    if job.get("trace"):
+        tracer = Tracer(trace_file=job["vis"].rstrip("/") + ".ocarina_trace.jsonl")
+    calibrator = PolarizationCalibrator(
+        vis_name=job["vis"], tracer=tracer, **_calibrator_kwargs(job.get("calibrator", {}))
+    )
+    caltable_store = None
+    if job.get("caltable_store"):
+        caltable_store = CaltableStore(store_dir=job["caltable_store"])
+    if job.get("steps"):
+        pipeline = CalibrationPipeline(calibrator=calibrator, caltable_store=caltable_store)
+        previous = []
+        for i, step in enumerate(job["steps"]):
+            name = step.get("name", "{0}_{1}".format(i, step["method"]))
+            pipeline.add_calibrator_step(
+                name, step["method"], depends_on=previous, **_step_kwargs(step.get("kwargs", {}))
+            )
+            previous = [name]
+    else:
+        chain = dict(job.get("chain", {}))
+        for model in ("known_model", "unknown_model"):
+            if chain.get(model) is not None:
+                chain[model] = _step_kwargs(chain[model])
+        pipeline = CalibrationPipeline.polarization_chain(
+            calibrator, caltable_store=caltable_store, **chain
+        )
+    try:
+        statuses = pipeline.run()
+        calibrator.plot_queue.shutdown()
+    finally:
+        if tracer is not None:
+            tracer.print_summary()
+    return statuses
+
+
+def _job_process(job: dict, result_file: str, log_file: str, memory_limit: int):
+    # Entry point of a job process: output goes to the job log (file descriptors included,
+    # so CASA's own messages too) and the result to result_file
+    with open(log_file, "a") as log:
+        os.dup2(log.fileno(), sys.stdout.fileno())
+        os.dup2(log.fileno(), sys.stderr.fileno())
+    if memory_limit > 0:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    result = {"status": "done", "error": None, "steps": {}}
+    try:
+        result["steps"] = run_calibration(job)
+    except BaseException:
+        result["status"] = "failed"
+        result["error"] = traceback.format_exc()
+        print(result["error"])
+    with open(result_file, "w") as result_output:
+        json.dump(result, result_output, indent=2, default=str)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+
+@dataclass(init=True, repr=True)
+class BatchJob:
+    config: dict = field(default_factory=dict)
+    memory_bytes: int = 0
+    io_bytes: int = 0
+    attempts: int = 0
+    status: str = "pending"
+    elapsed: List[float] = field(default_factory=list)
+    error: str = None
+    steps: dict = field(default_factory=dict)
+
+    @property
+    def vis(self) -> str:
+        return self.config["vis"]
+
+
+@dataclass(init=True, repr=True)
+class BatchDriver:
+    # Calibrates the measurement sets of a manifest, each in its own spawned process, so a
+    # crash or memory kill only takes down its job. Jobs start while fewer than max_workers
+    # run and their estimated memory and read volume fit in the remaining budgets; a job
+    # larger than a whole budget runs alone. Failed jobs go to the back of the queue until
+    # they have been tried retries + 1 times. The summary file is rewritten after every job.
+    #
+    # Manifest (JSON): {"jobs": [{"vis": ..., "calibrator": {...}, "steps": [...]}, ...],
+    # "defaults": {...}} plus any of the fields below. Each step is {"method": ...,
+    # "kwargs": {...}}; without steps the K-cross -> leakage -> pol angle -> apply chain runs
+    # with the "chain" arguments. Calibrator frequencies are strings such as "3 GHz".
+    jobs: List[BatchJob] = field(default_factory=list)
+    max_workers: int = 2
+    memory_budget_gb: float = 32.0
+    io_budget_gb: float = 200.0
+    memory_fraction: float = 0.1
+    limit_memory: bool = False
+    retries: int = 1
+    summary_file: str = "ocarina_batch_summary.json"
+    log_dir: str = "ocarina_batch_logs"
+
+    @classmethod
+    def from_manifest(cls, manifest_file: str, **kwargs):
+        with open(manifest_file) as manifest_input:
+            manifest = json.load(manifest_input)
+        defaults = manifest.pop("defaults", {})
+        job_configs = manifest.pop("jobs", [])
+        manifest.update(kwargs)
+        driver = cls(**manifest)
+        for job_config in job_configs:
+            config = dict(defaults)
+            config.update(job_config)
+            config["calibrator"] = {
+                **defaults.get("calibrator", {}),
+                **job_config.get("calibrator", {})
+            }
+            driver.add_job(config)
+        return driver
+
+    def add_job(self, config: dict) -> BatchJob:
+        if not os.path.exists(config.get("vis", "")):
+            raise ValueError("Measurement set " + str(config.get("vis")) + " does not exist")
+        io_bytes = estimate_visibility_bytes(config["vis"])
+        job = BatchJob(
+            config=config,
+            memory_bytes=int(BASE_MEMORY + self.memory_fraction * io_bytes),
+            io_bytes=io_bytes
+        )
+        self.jobs.append(job)
+        return job
+
+    def _fits(self, job: BatchJob, running: dict) -> bool:
+        if not running:
+            return True
+        if len(running) >= self.max_workers:
+            return False
+        memory = sum(other.memory_bytes for other in running.values()) + job.memory_bytes
+        io = sum(other.io_bytes for other in running.values()) + job.io_bytes
+        return memory <= self.memory_budget_gb * GIGABYTE and io <= self.io_budget_gb * GIGABYTE
+
+    def write_summary(self, elapsed: float):
+        summary = {
+            "elapsed": elapsed,
+            "jobs": {
+                job.vis: {
+                    "status": job.status,
+                    "attempts": job.attempts,
+                    "elapsed": job.elapsed,
+                    "memory_estimate_gb": job.memory_bytes / GIGABYTE,
+                    "io_estimate_gb": job.io_bytes / GIGABYTE,
+                    "steps": job.steps,
+                    "error": job.error,
+                    "log": self._log_file(job)
+                }
+                for job in self.jobs
+            }
+        }
+        temporary_file = self.summary_file + ".{0}.tmp".format(os.getpid())
+        with open(temporary_file, "w") as summary_output:
+            json.dump(summary, summary_output, indent=2, default=str)
+        os.replace(temporary_file, self.summary_file)
+
+    def _log_file(self, job: BatchJob) -> str:
+        return os.path.join(self.log_dir, os.path.basename(job.vis.rstrip("/")) + ".log")
+
+    def _start(self, job: BatchJob, context) -> tuple:
+        job.attempts += 1
+        job.status = "running"
+        result_file = self._log_file(job) + ".result.json"
+        if os.path.exists(result_file):
+            os.remove(result_file)
+        # The limit leaves room above the estimate, which is only meant for scheduling
+        memory_limit = 2 * job.memory_bytes if self.limit_memory else 0
+        process = context.Process(
+            target=_job_process,
+            args=(job.config, result_file, self._log_file(job), memory_limit),
+            name="ocarina-" + os.path.basename(job.vis.rstrip("/"))
+        )
+        process.start()
+        print("Started {0} (attempt {1})".format(job.vis, job.attempts))
+        return process, result_file, time.time()
+
+    def _finish(self, job: BatchJob, process, result_file: str, start: float):
+        job.elapsed.append(time.time() - start)
+        if os.path.exists(result_file):
+            with open(result_file) as result_input:
+                result = json.load(result_input)
+        else:
+            result = {
+                "status": "failed",
+                "error": "Process exited with code {0}".format(process.exitcode),
+                "steps": {}
+            }
+        job.status = result["status"]
+        job.error = result["error"]
+        job.steps = result["steps"]
+        print("{0} {1} after {2:.1f} s".format(job.vis, job.status, job.elapsed[-1]))
+
+    def run(self) -> dict:
+        os.makedirs(self.log_dir, exist_ok=True)
+        context = multiprocessing.get_context("spawn")
+        start = time.time()
+        queue = list(self.jobs)
+        running = {}
+        while queue or running:
+            for job in list(queue):
+                if self._fits(job, {key: value[0] for key, value in running.items()}):
+                    queue.remove(job)
+                    process, result_file, job_start = self._start(job, context)
+                    running[process.sentinel] = (job, process, result_file, job_start)
+            for sentinel in wait(list(running.keys())):
+                job, process, result_file, job_start = running.pop(sentinel)
+                process.join()
+                self._finish(job, process, result_file, job_start)
+                if job.status == "failed" and job.attempts <= self.retries:
+                    job.status = "retrying"
+                    queue.append(job)
+                self.write_summary(time.time() - start)
+        self.write_summary(time.time() - start)
+        return {job.vis: job.status for job in self.jobs}
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Calibrate the measurement sets of a manifest")
+    parser.add_argument("manifest", help="JSON manifest with the jobs and their configuration")
+    parser.add_argument("--max-workers", type=int, dest="max_workers")
+    parser.add_argument("--memory-budget-gb", type=float, dest="memory_budget_gb")
+    parser.add_argument("--io-budget-gb", type=float, dest="io_budget_gb")
+    parser.add_argument("--retries", type=int)
+    parser.add_argument("--summary-file", dest="summary_file")
+    parser.add_argument("--log-dir", dest="log_dir")
+    parser.add_argument("--limit-memory", action="store_true", default=None, dest="limit_memory")
+    arguments = {
+        key: value
+        for key, value in vars(parser.parse_args(argv)).items() if value is not None
+    }
+    driver = BatchDriver.from_manifest(arguments.pop("manifest"), **arguments)
+    statuses = driver.run()
+    return 0 if all(status == "done" for status in statuses.values()) else 1
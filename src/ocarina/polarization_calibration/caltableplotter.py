@@ -0,0 +1,248 @@
+import os
+import numpy as np
+from dataclasses import dataclass
+from ..utils import table_pool
+from ..utils.tracing import traced
+
+# plotms axis names understood by the native backend
+X_AXES = ("freq", "frequency", "chan", "antenna1", "real")
+Y_AXES = ("amp", "phase", "delay", "snr", "real", "imag")
+COLOR_AXES = ("", "corr", "spw", "antenna1")
+
+
+def antenna_ids(antenna: str, antenna_names: np.ndarray) -> list:
+    # Antenna selections are comma separated names or ids
+    ids = []
+    for token in antenna.split(","):
+        token = token.strip()
+        if token in antenna_names:
+            ids.append(int(np.flatnonzero(antenna_names == token)[0]))
+        elif token.isdigit():
+            ids.append(int(token))
+    return ids
+
+
+def plot_antennas(antenna1: np.ndarray, antenna_names: np.ndarray, plot: dict) -> np.ndarray:
+    # Antennas an iteraxis='antenna' plot iterates over: those with rows in the table, flagged
+    # or not, within the antenna selection of the plot
+    antennas = np.unique(antenna1)
+    if plot.get("antenna", ""):
+        antennas = antennas[np.isin(antennas, antenna_ids(plot["antenna"], antenna_names))]
+    return antennas
+
+
+@dataclass(init=True, repr=True)
+class CaltableColumns:
+    # Flattened view of a caltable: one entry per (row, correlation, channel)
+    param: np.ndarray = None
+    snr: np.ndarray = None
+    flag: np.ndarray = None
+    frequency: np.ndarray = None
+    channel: np.ndarray = None
+    correlation: np.ndarray = None
+    antenna: np.ndarray = None
+    spw: np.ndarray = None
+    antenna_names: np.ndarray = None
+
+    @classmethod
+    def from_table(cls, table_name: str):
+        # One bulk read per column. Rows can have different channel counts when spws differ,
+        # so the columns are read with getvarcol and flattened row by row.
+        with table_pool.open(table_name) as tb:
+            param_column = "CPARAM" if "CPARAM" in tb.colnames() else "FPARAM"
+            params = tb.getvarcol(param_column)
+            snrs = tb.getvarcol("SNR")
+            flags = tb.getvarcol("FLAG")
+            antenna1 = tb.getcol("ANTENNA1")
+            spw_ids = tb.getcol("SPECTRAL_WINDOW_ID")
+        with table_pool.open(table_name + "/SPECTRAL_WINDOW") as tb:
+            chan_freq_cells = tb.getvarcol("CHAN_FREQ")
+        # The getvarcol cells can come in string order of their keys (r1, r10, r2, ...)
+        chan_freqs = [
+            chan_freq_cells[key] for key in sorted(chan_freq_cells, key=lambda name: int(name[1:]))
+        ]
+        with table_pool.open(table_name + "/ANTENNA") as tb:
+            antenna_names = np.array(tb.getcol("NAME"))
+        # Caltables are rewritten between solves, so no handle is kept on them
+        table_pool.close(table_name)
+
+        columns = {
+            key: []
+            for key in
+            ("param", "snr", "flag", "frequency", "channel", "correlation", "antenna", "spw")
+        }
+        for row, key in enumerate(sorted(params.keys(), key=lambda name: int(name[1:]))):
+            param = params[key][..., 0]
+            n_corr, n_chan = param.shape
+            frequency = chan_freqs[spw_ids[row]][:, 0]
+            columns["param"].append(param.ravel())
+            columns["snr"].append(snrs[key][..., 0].ravel())
+            columns["flag"].append(flags[key][..., 0].ravel())
+            columns["frequency"].append(np.tile(frequency[:n_chan], n_corr))
+            columns["channel"].append(np.tile(np.arange(n_chan), n_corr))
+            columns["correlation"].append(np.repeat(np.arange(n_corr), n_chan))
+            columns["antenna"].append(np.full(param.size, antenna1[row]))
+            columns["spw"].append(np.full(param.size, spw_ids[row]))
+
+        flattened = {key: np.concatenate(value) for key, value in columns.items()}
+        return cls(antenna_names=antenna_names, **flattened)
+
+    def antenna_ids(self, antenna: str) -> list:
+        return antenna_ids(antenna, self.antenna_names)
+
+    def axis(self, name: str) -> np.ndarray:
+        if name in ("freq", "frequency"):
+            return self.frequency / 1e9
+        if name == "chan":
+            return self.channel
+        if name == "antenna1":
+            return self.antenna
+        if name == "corr":
+            return self.correlation
+        if name == "spw":
+            return self.spw
+        if name == "amp":
+            return np.abs(self.param)
+        if name == "phase":
+            return np.degrees(np.angle(self.param))
+        if name == "delay":
+            return np.real(self.param)
+        if name == "snr":
+            return self.snr
+        if name == "real":
+            return np.real(self.param)
+        if name == "imag":
+            return np.imag(self.param)
+        raise ValueError("Unsupported axis: " + name)
+
+
+_AXIS_LABELS = {
+    "freq": "Frequency (GHz)",
+    "frequency": "Frequency (GHz)",
+    "chan": "Channel",
+    "antenna1": "Antenna1",
+    "amp": "Amp",
+    "phase": "Phase (deg)",
+    "delay": "Delay (ns)",
+    "snr": "SNR",
+    "real": "Real",
+    "imag": "Imag"
+}
+
+
+def antenna_pages(antennas: np.ndarray, antenna_names: np.ndarray, plot: dict) -> list:
+    # (plot file, antennas) of each page of an iteraxis='antenna' plot. Pages hold
+    # gridrows x gridcols antennas and are named as plotms exports them: the plot file with
+    # the antennas of the page appended, and the page number from the second page on. Only
+    # the first page is exported, under the plot file name, unless exprange is 'all'.
+    per_page = plot.get("gridrows", 1) * plot.get("gridcols", 1)
+    pages = [antennas[start:start + per_page] for start in range(0, len(antennas), per_page)]
+    if plot.get("exprange", "") != "all":
+        return [(plot["plotfile"], pages[0] if pages else antennas)]
+    root, extension = os.path.splitext(plot["plotfile"])
+    plot_pages = []
+    for number, page in enumerate(pages, start=1):
+        suffix = "_Antenna" + ",".join(str(antenna_names[antenna]) for antenna in page)
+        if number > 1:
+            suffix += "_" + str(number)
+        plot_pages.append((root + suffix + extension, page))
+    return plot_pages
+
+
+def _scatter(axes, columns: CaltableColumns, selection: np.ndarray, plot: dict):
+    x = columns.axis(plot["xaxis"])[selection]
+    y = columns.axis(plot["yaxis"])[selection]
+    color_axis = plot.get("coloraxis", "")
+    if color_axis == "":
+        axes.scatter(x, y, s=2)
+    else:
+        color = columns.axis(color_axis)[selection]
+        for value in np.unique(color):
+            label = "{0} {1}".format(color_axis, value)
+            axes.scatter(x[color == value], y[color == value], s=2, label=label)
+    plot_range = plot.get("plotrange", [])
+    if len(plot_range) == 4 and plot_range[2] != plot_range[3]:
+        axes.set_ylim(plot_range[2], plot_range[3])
+    axes.set_xlabel(_AXIS_LABELS[plot["xaxis"]])
+    axes.set_ylabel(_AXIS_LABELS[plot["yaxis"]])
+
+
+def _is_paged(plot: dict) -> bool:
+    return plot.get("iteraxis", "") == "antenna" and plot.get("exprange", "") == "all"
+
+
+def caltable_plot_files(vis: str, plots: list) -> list:
+    # Files the plots of a caltable are written to, by either backend: paged antenna plots
+    # go to one file per page (see antenna_pages), which needs the antennas of the table
+    if not any(_is_paged(plot) for plot in plots) or not os.path.exists(vis):
+        return [plot["plotfile"] for plot in plots]
+    with table_pool.open(vis) as tb:
+        antenna1 = tb.getcol("ANTENNA1")
+    with table_pool.open(vis + "/ANTENNA") as tb:
+        antenna_names = np.array(tb.getcol("NAME"))
+    table_pool.close(vis)
+    plot_files = []
+    for plot in plots:
+        if plot.get("iteraxis", "") == "antenna":
+            antennas = plot_antennas(antenna1, antenna_names, plot)
+            plot_files += [
+                plot_file for plot_file, _ in antenna_pages(antennas, antenna_names, plot)
+            ]
+        else:
+            plot_files.append(plot["plotfile"])
+    return plot_files
+
+
+def _save(plt, figure, vis: str, plot_file: str):
+    figure.suptitle(vis)
+    figure.tight_layout()
+    figure.savefig(plot_file)
+    plt.close(figure)
+
+
+@traced("plot")
+def render_caltable_plots(vis: str = "", plots: list = None):
+    # Renders every plot of a caltable from a single read. Each plot is a dictionary of plotms
+    # keyword arguments (xaxis, yaxis, coloraxis, iteraxis='antenna' with gridrows, gridcols
+    # and exprange, antenna, plotrange and plotfile), so the same specs drive both backends.
+    # Returns the files written, as caltable_plot_files lists them.
+    try:
+        import matplotlib
+    except ImportError:
+        raise ImportError("The native plotting backend requires matplotlib")
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    columns = CaltableColumns.from_table(vis)
+    unflagged = ~columns.flag
+    plot_files = []
+    for plot in plots:
+        if plot["xaxis"] not in X_AXES or plot["yaxis"] not in Y_AXES or \
+                plot.get("coloraxis", "") not in COLOR_AXES:
+            raise ValueError("Unsupported plot for the native backend: {0}".format(plot))
+        selection = unflagged.copy()
+        if plot.get("antenna", ""):
+            selection &= np.isin(columns.antenna, columns.antenna_ids(plot["antenna"]))
+
+        if plot.get("iteraxis", "") == "antenna":
+            antennas = plot_antennas(columns.antenna, columns.antenna_names, plot)
+            n_rows, n_cols = plot.get("gridrows", 1), plot.get("gridcols", 1)
+            for plot_file, page in antenna_pages(antennas, columns.antenna_names, plot):
+                figure, axes = plt.subplots(
+                    n_rows, n_cols, figsize=(4 * n_cols, 3 * n_rows), squeeze=False
+                )
+                for panel, antenna in zip(axes.flat, page):
+                    _scatter(panel, columns, selection & (columns.antenna == antenna), plot)
+                    panel.set_title(str(columns.antenna_names[antenna]))
+                for panel in axes.flat[len(page):]:
+                    panel.set_visible(False)
+                _save(plt, figure, vis, plot_file)
+                plot_files.append(plot_file)
+        else:
+            figure, panel = plt.subplots(figsize=(8, 6))
+            _scatter(panel, columns, selection, plot)
+            if plot.get("coloraxis", ""):
+                panel.legend(markerscale=4, fontsize="small")
+            _save(plt, figure, vis, plot["plotfile"])
+            plot_files.append(plot["plotfile"])
+    return plot_files
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import shutil
+import stat
+import time
+from dataclasses import dataclass, fields
+from pathlib import Path
+import numpy as np
+from ..utils import MSMetadata, table_pool
+
+STORED_TABLE = "table"
+ENTRY_METADATA = "entry.json"
+# Files never copied into or out of the store
+SKIPPED_FILES = ("table.lock", )
+
+
+def _default_store_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "ocarina", "caltables")
+
+
+def table_digest(table_name: str) -> str:
+    # Digest of the files of a table, for tables that are inputs of a solve
+    digest = hashlib.sha256()
+    for root, directories, files in os.walk(table_name):
+        directories.sort()
+        for file_name in sorted(files):
+            if file_name in SKIPPED_FILES:
+                continue
+            path = os.path.join(root, file_name)
+            digest.update(os.path.relpath(path, table_name).encode())
+            with open(path, "rb") as table_file:
+                for block in iter(lambda: table_file.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+def _update_flag_digest(digest, tb, ms_metadata: MSMetadata, max_chunk_bytes: int):
+    # Hashes FLAG_ROW and FLAG in row windows. getcol needs one cell shape, so windows are
+    # split into runs of rows whose data descriptions have the same number of correlations
+    # and channels.
+    n_rows = tb.nrows()
+    digest.update(np.ascontiguousarray(tb.getcol("FLAG_ROW")).tobytes())
+    dd_ids = tb.getcol("DATA_DESC_ID")
+    cell_shapes = np.stack(
+        [
+            ms_metadata.pol_num_corr[ms_metadata.dd_pol_ids],
+            ms_metadata.spw_num_chan[ms_metadata.dd_spw_ids]
+        ],
+        axis=-1
+    )
+    _, shape_ids = np.unique(cell_shapes, axis=0, return_inverse=True)
+    row_shape_ids = shape_ids.reshape(-1)[dd_ids]
+    rows_per_window = max(1, int(max_chunk_bytes // np.max(np.prod(cell_shapes, axis=-1))))
+    edges = np.flatnonzero(np.diff(row_shape_ids)) + 1
+    for start, stop in zip(np.concatenate([[0], edges]), np.concatenate([edges, [n_rows]])):
+        for startrow in range(start, stop, rows_per_window):
+            nrow = min(rows_per_window, stop - startrow)
+            digest.update(np.ascontiguousarray(tb.getcol("FLAG", startrow, nrow)).tobytes())
+
+
+def ms_content_digest(
+    vis_name: str, ms_metadata: MSMetadata = None, max_chunk_bytes: int = 256 * 1024**2
+) -> str:
+    # Identifies the observation rather than the files: the subtable contents, the number of
+    # rows, the observation time ranges and the flags (FLAG_ROW and FLAG, read in windows of
+    # at most max_chunk_bytes). Unlike modification times it is the same for a re-imported
+    # copy of the MS, while flagging it gives a different digest. The model a solve used is
+    # not part of it: pipelines key the model steps themselves and chain them to the solves.
+    if ms_metadata is None:
+        ms_metadata = MSMetadata.from_ms(vis_name)
+    digest = hashlib.sha256()
+    for item in fields(ms_metadata):
+        if item.init and item.name not in ("vis_name", "stamps"):
+            digest.update(item.name.encode())
+            digest.update(repr(getattr(ms_metadata, item.name).tolist()).encode())
+    with table_pool.open(vis_name) as tb:
+        digest.update(str(tb.nrows()).encode())
+        _update_flag_digest(digest, tb, ms_metadata, max_chunk_bytes)
+    with table_pool.open(os.path.join(vis_name, "OBSERVATION")) as tb:
+        digest.update(repr(tb.getcol("TIME_RANGE").tolist()).encode())
+    # CASA tasks write to the MS, so no handle is kept on it
+    table_pool.close(vis_name)
+    return digest.hexdigest()
+
+
+def _copy_table(source: str, destination: str, link: bool):
+    # Recreates the directory tree of a table, hardlinking (or copying) its files
+    for root, _, files in os.walk(source):
+        target_root = os.path.join(destination, os.path.relpath(root, source))
+        os.makedirs(target_root, exist_ok=True)
+        for file_name in files:
+            if file_name in SKIPPED_FILES:
+                continue
+            target = os.path.join(target_root, file_name)
+            if link:
+                try:
+                    os.link(os.path.join(root, file_name), target)
+                    continue
+                except OSError:
+                    # e.g. the store is on another filesystem
+                    pass
+            shutil.copy2(os.path.join(root, file_name), target)
+
+
+def _make_read_only(table_name: str):
+    for root, _, files in os.walk(table_name):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            os.chmod(path, os.stat(path).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+@dataclass(init=True, repr=True)
+class CaltableStore:
+    # Content-addressed store of solved caltables shared by runs and measurement sets. Each
+    # entry is <store_dir>/<digest>/table plus entry.json, where the digest covers everything
+    # the solve depends on. Stored files are read-only and are handed out as hardlinks (or
+    # read-only copies when link is False or linking fails); casacore only needs the table
+    # directory to be writable, for its lock file. gc drops entries unused for max_age_days
+    # and then the least recently used ones until the store fits in max_bytes.
+    store_dir: str = None
+    max_bytes: int = 10 * 1024**3
+    max_age_days: float = 90.0
+    link: bool = True
+
+    def __post_init__(self):
+        if self.store_dir is None:
+            self.store_dir = _default_store_dir()
+
+    @staticmethod
+    def get_digest(inputs: dict) -> str:
+        encoded = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def _entry_dir(self, digest: str) -> Path:
+        return Path(self.store_dir) / digest
+
+    def _read_entry(self, digest: str) -> dict:
+        metadata_file = self._entry_dir(digest) / ENTRY_METADATA
+        if not metadata_file.exists():
+            return None
+        with open(metadata_file) as entry_file:
+            return json.load(entry_file)
+
+    def _write_entry(self, entry_dir: Path, entry: dict):
+        temporary_file = entry_dir / (ENTRY_METADATA + ".{0}.tmp".format(os.getpid()))
+        with open(temporary_file, "w") as entry_file:
+            json.dump(entry, entry_file, indent=2)
+        os.replace(temporary_file, entry_dir / ENTRY_METADATA)
+
+    def has(self, digest: str) -> bool:
+        return self._read_entry(digest) is not None
+
+    def put(self, digest: str, cal_table: str, inputs: dict = None) -> str:
+        # Files a solved caltable under its digest; a concurrent writer of the same digest wins
+        if self.has(digest):
+            return str(self._entry_dir(digest) / STORED_TABLE)
+        Path(self.store_dir).mkdir(parents=True, exist_ok=True)
+        temporary_dir = Path(self.store_dir) / ".{0}.{1}.tmp".format(digest, os.getpid())
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+        _copy_table(cal_table, str(temporary_dir / STORED_TABLE), link=False)
+        _make_read_only(str(temporary_dir / STORED_TABLE))
+        size = sum(path.stat().st_size for path in temporary_dir.rglob("*") if path.is_file())
+        now = time.time()
+        self._write_entry(
+            temporary_dir, {
+                "source": os.path.abspath(cal_table),
+                "size": size,
+                "created": now,
+                "last_used": now,
+                "inputs": inputs
+            }
+        )
+        try:
+            os.rename(temporary_dir, self._entry_dir(digest))
+        except OSError:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+        return str(self._entry_dir(digest) / STORED_TABLE)
+
+    def get(self, digest: str, cal_table: str) -> bool:
+        # Materializes the stored table at cal_table, replacing what is there. Returns False
+        # when the store has no entry for the digest.
+        entry = self._read_entry(digest)
+        if entry is None:
+            return False
+        if os.path.exists(cal_table):
+            table_pool.close(cal_table)
+            shutil.rmtree(cal_table)
+        _copy_table(str(self._entry_dir(digest) / STORED_TABLE), cal_table, link=self.link)
+        _make_read_only(cal_table)
+        entry["last_used"] = time.time()
+        self._write_entry(self._entry_dir(digest), entry)
+        return True
+
+    def entries(self) -> dict:
+        entries = {}
+        if os.path.isdir(self.store_dir):
+            for entry_dir in Path(self.store_dir).iterdir():
+                entry = self._read_entry(entry_dir.name)
+                if entry is not None:
+                    entries[entry_dir.name] = entry
+        return entries
+
+    def size(self) -> int:
+        return sum(entry["size"] for entry in self.entries().values())
+
+    def remove(self, digest: str):
+        entry_dir = self._entry_dir(digest)
+        if entry_dir.exists():
+            # Stored files are read-only, which only matters to rmtree on some platforms
+            for path in entry_dir.rglob("*"):
+                if path.is_file():
+                    os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+            shutil.rmtree(entry_dir)
+
+    def gc(self, max_age_days: float = None, max_bytes: int = None) -> list:
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.entries().items(), key=lambda item: item[1]["last_used"])
+        removed = []
+        oldest_allowed = time.time() - max_age_days * 86400.
+        total = sum(entry["size"] for _, entry in entries)
+        for digest, entry in entries:
+            if entry["last_used"] >= oldest_allowed and total <= max_bytes:
+                break
+            self.remove(digest)
+            total -= entry["size"]
+            removed.append(digest)
+        if removed:
+            print("Removed {0} caltables from the store".format(len(removed)))
+        return removed
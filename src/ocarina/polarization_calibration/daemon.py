@@ -0,0 +1,374 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from ..utils import table_pool
+from .batch import run_calibration
+
+DAEMON_COMMANDS = ("serve", "submit", "status", "stop")
+# Written by a worker after each job, so the result follows the last line of the job log
+_JOB_END = "\x00ocarina-job-end"
+PRELOADED_MODULES = ("casatools", "casatasks", "casaplotms")
+CRASH_GRACE_SECONDS = 3.0
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir())
+    return os.path.join(runtime_dir, "ocarina-{0}.sock".format(os.getuid()))
+
+
+def _worker_main(worker_id: int, jobs, events, max_jobs: int):
+    # Worker process: imports CASA once, then runs jobs until it has done max_jobs of them.
+    # Its stdout and stderr (file descriptors, so CASA's messages too) go through a pipe read
+    # by a thread that forwards each line, tagged with the current job, to the daemon.
+    read_fd, write_fd = os.pipe()
+    os.dup2(write_fd, sys.stdout.fileno())
+    os.dup2(write_fd, sys.stderr.fileno())
+    os.close(write_fd)
+    sys.stdout.reconfigure(line_buffering=True)
+    sys.stderr.reconfigure(line_buffering=True)
+    state = {"job": None, "result": None}
+    job_ended = threading.Event()
+
+    def forward_output():
+        with os.fdopen(read_fd, "r", errors="replace") as pipe:
+            for line in pipe:
+                line = line.rstrip("\n")
+                if line == _JOB_END:
+                    events.put(("done", worker_id, state["job"], state["result"]))
+                    job_ended.set()
+                else:
+                    events.put(("log", worker_id, state["job"], line))
+
+    threading.Thread(target=forward_output, daemon=True).start()
+
+    start = time.time()
+    for module in PRELOADED_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            print("Could not preload " + module)
+    print("Worker {0} ready after {1:.1f} s".format(worker_id, time.time() - start))
+
+    n_jobs = 0
+    while max_jobs <= 0 or n_jobs < max_jobs:
+        item = jobs.get()
+        if item is None:
+            break
+        job_id, job = item
+        state["job"] = job_id
+        events.put(("start", worker_id, job_id, None))
+        start = time.time()
+        result = {"status": "done", "error": None, "steps": {}}
+        try:
+            os.chdir(job.get("cwd", os.getcwd()))
+            result["steps"] = run_calibration(job)
+        except BaseException:
+            result["status"] = "failed"
+            result["error"] = traceback.format_exc()
+            print(result["error"])
+        finally:
+            table_pool.close_all()
+        result["elapsed"] = time.time() - start
+        state["result"] = result
+        job_ended.clear()
+        print(_JOB_END)
+        job_ended.wait()
+        state["job"] = None
+        n_jobs += 1
+    events.put(("exit", worker_id, None, n_jobs))
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    # One JSON request per connection, answered with JSON lines
+
+    def send(self, message: dict):
+        self.wfile.write((json.dumps(message, default=str) + "\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        daemon = self.server.daemon
+        if request["type"] == "submit":
+            try:
+                job_id, messages = daemon.submit(request["job"])
+            except ValueError as error:
+                self.send({"type": "error", "error": str(error)})
+                return
+            self.send({"type": "accepted", "job_id": job_id})
+            try:
+                while True:
+                    message = messages.get()
+                    self.send(message)
+                    if message["type"] == "result":
+                        break
+            except (BrokenPipeError, ConnectionResetError):
+                # The job keeps running; its output is no longer sent anywhere
+                daemon.detach(job_id)
+        elif request["type"] == "status":
+            self.send(daemon.status())
+        elif request["type"] == "stop":
+            self.send({"type": "stopping"})
+            threading.Thread(target=daemon.stop).start()
+        else:
+            self.send({"type": "error", "error": "Unknown request " + str(request["type"])})
+
+
+class WorkerDaemon:
+    # Long-lived local service keeping n_workers processes with CASA already imported.
+    # Clients submit batch job configurations (see BatchDriver) over a UNIX socket and get
+    # the job output streamed back, followed by the result. A worker is replaced by a fresh
+    # one after max_jobs_per_worker jobs, which bounds the memory CASA accumulates, or when
+    # it dies, in which case its job is reported as failed.
+
+    def __init__(self, socket_path: str = None, n_workers: int = 1, max_jobs_per_worker: int = 20):
+        self.socket_path = default_socket_path() if socket_path is None else socket_path
+        self.n_workers = n_workers
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._context = multiprocessing.get_context("spawn")
+        self._jobs = self._context.Queue()
+        self._events = self._context.Queue()
+        self._workers = {}
+        self._clients = {}
+        self._queued = 0
+        self._next_worker_id = 0
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._server = None
+
+    def _start_worker(self):
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, self._jobs, self._events, self.max_jobs_per_worker),
+            name="ocarina-worker-" + str(worker_id)
+        )
+        process.start()
+        self._workers[worker_id] = {"process": process, "job": None, "jobs_done": 0}
+
+    def submit(self, job: dict) -> tuple:
+        job_id = uuid.uuid4().hex
+        messages = queue.Queue()
+        with self._lock:
+            if self._stopping:
+                raise ValueError("The daemon is stopping")
+            self._clients[job_id] = messages
+            self._queued += 1
+        self._jobs.put((job_id, job))
+        return job_id, messages
+
+    def detach(self, job_id: str):
+        with self._lock:
+            self._clients.pop(job_id, None)
+
+    def _send(self, job_id: str, message: dict):
+        with self._lock:
+            messages = self._clients.get(job_id)
+            if message["type"] == "result":
+                self._clients.pop(job_id, None)
+        if messages is not None:
+            messages.put(message)
+        elif message["type"] == "log":
+            print(message["line"])
+
+    def _drained(self) -> bool:
+        # Every submitted job has started and reported its result
+        with self._lock:
+            return self._queued == 0 and all(
+                worker["job"] is None for worker in self._workers.values()
+            )
+
+    def _dispatch(self):
+        # Forwards worker events to the clients and replaces workers that exited. Once
+        # stopping, it goes on until the jobs already submitted have reported.
+        while not (self._stopping and self._drained()):
+            try:
+                kind, worker_id, job_id, payload = self._events.get(timeout=1.0)
+            except queue.Empty:
+                kind, worker_id = None, None
+            with self._lock:
+                worker = self._workers.get(worker_id)
+            if kind == "log":
+                self._send(job_id, {"type": "log", "line": payload})
+            elif worker is None:
+                pass
+            elif kind == "start":
+                with self._lock:
+                    worker["job"] = job_id
+                    self._queued -= 1
+            elif kind == "done":
+                with self._lock:
+                    worker["job"] = None
+                    worker["jobs_done"] += 1
+                self._send(job_id, dict(payload, type="result", job_id=job_id, worker=worker_id))
+            elif kind == "exit":
+                # Recycled after max_jobs_per_worker jobs, or stopped
+                worker["process"].join()
+                if not self._stopping:
+                    print("Recycling worker {0} after {1} jobs".format(worker_id, payload))
+                self._replace_worker(worker_id)
+            self._check_crashed_workers()
+
+    def _replace_worker(self, worker_id: int):
+        # While stopping, a worker is only replaced if submitted jobs have not started yet;
+        # the stop sentinels were queued before it, so it gets one of its own
+        with self._lock:
+            del self._workers[worker_id]
+            if self._stopping and self._queued == 0:
+                return
+            self._start_worker()
+            if self._stopping:
+                self._jobs.put(None)
+
+    def _check_crashed_workers(self):
+        # A worker that died without an exit event crashed (e.g. killed for memory). It is only
+        # handled a few seconds later, once the events it sent before dying were forwarded.
+        with self._lock:
+            workers = list(self._workers.items())
+        for worker_id, worker in workers:
+            if worker["process"].is_alive():
+                continue
+            worker.setdefault("died", time.time())
+            if time.time() - worker["died"] < CRASH_GRACE_SECONDS:
+                continue
+            worker["process"].join()
+            error = "Worker exited with code {0}".format(worker["process"].exitcode)
+            print("Worker {0} crashed: {1}".format(worker_id, error))
+            if worker["job"] is not None:
+                self._send(
+                    worker["job"], {
+                        "type": "result",
+                        "job_id": worker["job"],
+                        "worker": worker_id,
+                        "status": "failed",
+                        "error": error,
+                        "steps": {},
+                        "elapsed": 0.0
+                    }
+                )
+            self._replace_worker(worker_id)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "type": "status",
+                "socket": self.socket_path,
+                "queued": self._queued,
+                "workers": [
+                    {
+                        "id": worker_id,
+                        "pid": worker["process"].pid,
+                        "job": worker["job"],
+                        "jobs_done": worker["jobs_done"]
+                    } for worker_id, worker in self._workers.items()
+                ]
+            }
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            raise ValueError("Socket " + self.socket_path + " exists; is a daemon already running?")
+        for _ in range(self.n_workers):
+            self._start_worker()
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, _RequestHandler)
+        self._server.daemon_threads = True
+        self._server.daemon = self
+        os.chmod(self.socket_path, 0o600)
+        dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        dispatcher.start()
+        print("Serving on " + self.socket_path)
+        try:
+            self._server.serve_forever()
+        finally:
+            with self._lock:
+                self._stopping = True
+                # Queued after every submitted job, so the workers run those first
+                for _ in self._workers:
+                    self._jobs.put(None)
+            self._server.server_close()
+            os.remove(self.socket_path)
+            dispatcher.join()
+            with self._lock:
+                workers = list(self._workers.values())
+            for worker in workers:
+                worker["process"].join(timeout=60)
+
+    def stop(self):
+        # Running and queued jobs are finished, and their results sent, before the workers
+        # are closed
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def _request(message: dict, socket_path: str = None):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.connect(default_socket_path() if socket_path is None else socket_path)
+    stream = connection.makefile("rwb")
+    stream.write((json.dumps(message) + "\n").encode())
+    stream.flush()
+    return connection, stream
+
+
+def submit_job(job: dict, socket_path: str = None, output=sys.stdout) -> dict:
+    # Sends a job to the daemon, prints its output as it arrives and returns the result.
+    # Paths are resolved here, since the daemon runs in another directory.
+    job = dict(job)
+    job["vis"] = os.path.abspath(job["vis"])
+    job.setdefault("cwd", os.getcwd())
+    connection, stream = _request({"type": "submit", "job": job}, socket_path)
+    with connection:
+        for line in stream:
+            message = json.loads(line)
+            if message["type"] == "log":
+                print(message["line"], file=output)
+            elif message["type"] == "result":
+                return message
+    raise ValueError("The daemon closed the connection before the job finished")
+
+
+def daemon_request(request_type: str, socket_path: str = None) -> dict:
+    connection, stream = _request({"type": request_type}, socket_path)
+    with connection:
+        return json.loads(stream.readline())
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Warm CASA worker daemon")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Start the daemon")
+    serve_parser.add_argument("--workers", type=int, default=1)
+    serve_parser.add_argument("--max-jobs", type=int, default=20, dest="max_jobs")
+    submit_parser = subparsers.add_parser("submit", help="Run a job (JSON file) on the daemon")
+    submit_parser.add_argument("job", help="JSON job, as in a batch manifest")
+    subparsers.add_parser("status", help="Show the workers of the daemon")
+    subparsers.add_parser("stop", help="Stop the daemon after the running jobs")
+    for subparser in subparsers.choices.values():
+        subparser.add_argument("--socket", default=None)
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == "serve":
+        WorkerDaemon(arguments.socket, arguments.workers, arguments.max_jobs).serve_forever()
+        return 0
+    if arguments.command == "submit":
+        with open(arguments.job) as job_file:
+            result = submit_job(json.load(job_file), arguments.socket)
+        print(
+            "Job {0} {1} in {2:.1f} s".format(
+                result["job_id"], result["status"], result["elapsed"]
+            )
+        )
+        if result["error"]:
+            print(result["error"])
+        return 0 if result["status"] == "done" else 1
+    print(json.dumps(daemon_request(arguments.command, arguments.socket), indent=2))
+    return 0
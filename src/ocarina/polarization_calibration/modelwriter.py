@@ -0,0 +1,174 @@
+import multiprocessing
+import numpy as np
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from ..functions import StokesModel
+from ..utils import MSMetadata, table_pool
+from ..utils.tracing import traced
+
+# Visibility of each CASA correlation type (Stokes enum) as a combination of I, Q, U and V
+CORRELATION_STOKES = {
+    1: (1, 0, 0, 0),  # I
+    2: (0, 1, 0, 0),  # Q
+    3: (0, 0, 1, 0),  # U
+    4: (0, 0, 0, 1),  # V
+    5: (1, 0, 0, 1),  # RR = I + V
+    6: (0, 1, 1j, 0),  # RL = Q + iU
+    7: (0, 1, -1j, 0),  # LR = Q - iU
+    8: (1, 0, 0, -1),  # LL = I - V
+    9: (1, 1, 0, 0),  # XX = I + Q
+    10: (0, 0, 1, 1j),  # XY = U + iV
+    11: (0, 0, 1, -1j),  # YX = U - iV
+    12: (1, -1, 0, 0)  # YY = I - Q
+}
+
+
+def stokes_to_correlations(stokes: np.ndarray, corr_types: np.ndarray) -> np.ndarray:
+    # (4, ...) I, Q, U and V to the (n_corr, ...) visibilities of the given correlation types.
+    # As in setjy, the model is in the sky frame: linear feeds are not rotated by the
+    # parallactic angle here but by the solvers
+    unknown = [int(corr) for corr in corr_types if int(corr) not in CORRELATION_STOKES]
+    if unknown:
+        raise ValueError("Correlation types {0} cannot be modelled".format(unknown))
+    matrix = np.array([CORRELATION_STOKES[int(corr)] for corr in corr_types], dtype=np.complex128)
+    return np.tensordot(matrix, stokes, axes=1)
+
+
+def _shape_runs(shape_ids: np.ndarray) -> list:
+    # (start, stop) of the runs of consecutive rows whose cells have the same shape
+    edges = np.flatnonzero(np.diff(shape_ids)) + 1
+    return list(zip(np.concatenate([[0], edges]), np.concatenate([edges, [len(shape_ids)]])))
+
+
+def _write_windows(
+    vis_name: str, field_id: int, models: dict, shape_ids: np.ndarray, windows: list
+) -> int:
+    # Writes the model rows of field_id in the (startrow, nrow) windows; runs in the calling
+    # process or in a spawned worker. Returns the number of rows written.
+    written = 0
+    with table_pool.open(vis_name, readonly=False) as tb:
+        for startrow, nrow in windows:
+            field_ids = tb.getcol("FIELD_ID", startrow, nrow)
+            dd_ids = tb.getcol("DATA_DESC_ID", startrow, nrow)
+            selected = (field_ids == field_id) & np.isin(dd_ids, list(models))
+            # getcol and putcol need one cell shape, so windows mixing spws of different
+            # channel counts are written run by run
+            for start, stop in _shape_runs(shape_ids[dd_ids]):
+                rows = np.flatnonzero(selected[start:stop]) + start
+                if len(rows) == 0:
+                    continue
+                start, stop = rows[0], rows[-1] + 1
+                if len(rows) == stop - start:
+                    first_model = models[dd_ids[start]]
+                    data = np.empty(first_model.shape + (stop - start, ), dtype=np.complex64)
+                else:
+                    # Rows of other fields in between keep their model
+                    data = tb.getcol("MODEL_DATA", startrow + start, stop - start)
+                for dd_id in np.unique(dd_ids[rows]):
+                    in_dd = rows[dd_ids[rows] == dd_id] - start
+                    data[..., in_dd] = models[dd_id][..., np.newaxis]
+                tb.putcol("MODEL_DATA", data, startrow + start, stop - start)
+                written += len(rows)
+    return written
+
+
+@dataclass(init=True, repr=True)
+class ModelWriter:
+    # Writes MODEL_DATA of a field from a StokesModel evaluated on every channel, the
+    # equivalent of setjy(standard='manual', scalebychan=True, usescratch=True). The MS is
+    # streamed in row windows holding at most max_chunk_bytes of visibilities, and the
+    # windows are split among max_workers spawned processes when it is above one.
+    vis_name: str = ""
+    ms_metadata: MSMetadata = field(default=None, repr=False)
+    max_chunk_bytes: int = 256 * 1024**2
+    max_workers: int = 1
+
+    def __post_init__(self):
+        if self.ms_metadata is None:
+            self.ms_metadata = MSMetadata.from_ms(self.vis_name)
+        if self.max_chunk_bytes <= 0:
+            raise ValueError("Chunk size must be positive")
+
+    def correlation_models(self, model: StokesModel, spw_ids: np.ndarray = None) -> dict:
+        # (n_corr, n_chan) visibilities of every data description of the selected spws; the
+        # model is evaluated on the channels of all spws at once
+        if model.n_sources is not None:
+            raise ValueError("A model of a single source is needed to write MODEL_DATA")
+        metadata = self.ms_metadata
+        stokes = model.evaluate(metadata.chan_freq)
+        models = {}
+        for dd_id, (spw_id, pol_id) in enumerate(zip(metadata.dd_spw_ids, metadata.dd_pol_ids)):
+            if spw_ids is not None and spw_id not in spw_ids:
+                continue
+            channels = stokes[:, metadata.chan_offsets[spw_id]:metadata.chan_offsets[spw_id + 1]]
+            visibilities = stokes_to_correlations(channels, metadata.correlation_types(pol_id))
+            models[dd_id] = visibilities.astype(np.complex64)
+        return models
+
+    def cell_shapes(self) -> np.ndarray:
+        # (n_dd, 2) correlations and channels of the MODEL_DATA cells of each data description
+        metadata = self.ms_metadata
+        return np.stack(
+            [
+                metadata.pol_num_corr[metadata.dd_pol_ids],
+                metadata.spw_num_chan[metadata.dd_spw_ids]
+            ],
+            axis=-1
+        )
+
+    def windows(self, n_rows: int) -> list:
+        # (startrow, nrow) windows whose largest cells fit in max_chunk_bytes
+        cell_size = np.max(np.prod(self.cell_shapes(), axis=-1))
+        cell_bytes = cell_size * np.dtype(np.complex64).itemsize
+        rows_per_window = max(1, int(self.max_chunk_bytes // cell_bytes))
+        return [
+            (startrow, min(rows_per_window, n_rows - startrow))
+            for startrow in range(0, n_rows, rows_per_window)
+        ]
+
+    @traced("task")
+    def write(self, model: StokesModel, field: str, spw_ids: np.ndarray = None) -> dict:
+        # Returns the model fluxes at the centre channel of every spw, as setjy reports them
+        field_id = self.ms_metadata.field_id(field)
+        with table_pool.open(self.vis_name) as tb:
+            if "MODEL_DATA" not in tb.colnames():
+                raise ValueError("The measurement set has no MODEL_DATA column to write")
+            n_rows = tb.nrows()
+        # The writable handles below change the table
+        table_pool.close(self.vis_name)
+
+        models = self.correlation_models(model, spw_ids)
+        # Cells of the same shape share an id, so runs of rows can be read at once
+        _, shape_ids = np.unique(self.cell_shapes(), axis=0, return_inverse=True)
+        shape_ids = shape_ids.reshape(-1)
+        windows = self.windows(n_rows)
+        n_workers = min(self.max_workers, len(windows))
+        if n_workers <= 1:
+            written = _write_windows(self.vis_name, field_id, models, shape_ids, windows)
+        else:
+            print("Writing {0} row windows on {1} processes".format(len(windows), n_workers))
+            # Contiguous groups of windows, so the workers write separate parts of the table.
+            # CASA is not fork-safe, so workers are spawned
+            groups = [
+                [windows[i] for i in group]
+                for group in np.array_split(np.arange(len(windows)), n_workers)
+            ]
+            with ProcessPoolExecutor(
+                max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        _write_windows, self.vis_name, field_id, models, shape_ids, group
+                    ) for group in groups
+                ]
+                written = sum(future.result() for future in futures)
+        print("Model written to {0} rows of field {1}".format(written, field))
+
+        metadata = self.ms_metadata
+        spw_ids = [metadata.dd_spw_ids[dd_id] for dd_id in models]
+        centres = [(metadata.chan_offsets[i] + metadata.chan_offsets[i + 1]) // 2 for i in spw_ids]
+        stokes = model.evaluate(metadata.chan_freq[centres])
+        fluxes = {str(spw_id): {"fluxd": stokes[:, i].tolist()} for i, spw_id in enumerate(spw_ids)}
+        source_dict = {str(field_id): fluxes}
+        source_dict["format"] = "{field Id: {spw Id: {fluxd: [I,Q,U,V] in Jy}}}"
+        return source_dict
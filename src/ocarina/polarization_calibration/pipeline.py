@@ -0,0 +1,379 @@
+import hashlib
+import json
+import os
+import time
+import threading
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import List
+from ..utils import MSMetadata
+from ..utils.tablepool import table_stamp
+from .caltablestore import CaltableStore, ms_content_digest, table_digest
+from .polcalibration import PolarizationCalibrator
+
+# Calibrator attributes that select the data every step works on
+SELECTION_ATTRIBUTES = (
+    "vis_name", "spw_ids", "antennas", "pol_angle_field", "leakage_field", "ref_ant",
+    "k_cross_ref_ant", "mapped_spw", "nu_0", "old_vla"
+)
+
+# Calibrator attribute and table suffix written by each solve method
+SOLVE_OUTPUTS = {
+    "solve_cross_hands_delay": ("k_cross_table", ".Kcross"),
+    "calibrate_leakage": ("leakage_table", ".D0"),
+    "calibrate_pol_angle": ("pol_angle_table", ".X0"),
+    "pre_average": ("solve_vis_name", ".preavg.ms")
+}
+
+# Outputs never put in the caltable store: scratch MSs are large and depend on MODEL_DATA
+UNSTORED_METHODS = ("pre_average", )
+
+# Steps writing MODEL_DATA, and the calibrator attributes that change the model they write.
+# MODEL_DATA has no cheap stamp (the main table changes whenever apply writes
+# CORRECTED_DATA), so these steps run every time; their keys only hash their parameters,
+# and solves downstream of an unchanged model are still skipped.
+MODEL_METHODS = ("set_known_model", "set_unknown_model")
+MODEL_ATTRIBUTES = ("model_backend", "nu_min_frac", "nu_max_frac", "nu_min_angle", "nu_max_angle")
+
+
+def _input_tables(value) -> list:
+    # Table paths passed as step arguments (e.g. explicit gain tables)
+    if isinstance(value, str):
+        return [value] if value and os.path.exists(os.path.join(value, "table.dat")) else []
+    if isinstance(value, (list, tuple)):
+        return [table for item in value for table in _input_tables(item)]
+    return []
+
+
+@dataclass(init=True, repr=True)
+class PipelineNode:
+    # One calibrator method call. output_attribute names the calibrator attribute holding
+    # the caltable the step writes, which is restored when the step is skipped, and
+    # output_table the path the method writes it to, where a stored copy is placed.
+    # always_run nodes are never skipped; downstream nodes only rerun when their key changes.
+    name: str = ""
+    method: str = ""
+    kwargs: dict = field(default_factory=dict)
+    depends_on: List[str] = field(default_factory=list)
+    output_attribute: str = ""
+    output_table: str = ""
+    always_run: bool = False
+
+
+@dataclass(init=True, repr=True)
+class CalibrationPipeline:
+    # Runs calibrator steps as a DAG. Every node is keyed by a hash of its method and
+    # arguments, the calibrator selection, a fingerprint of the MS metadata, the stamps of
+    # any input tables and the keys of the nodes it depends on (model steps included, so a
+    # different calibrator model reruns the solves), so changing one step only
+    # reruns that step and everything downstream. Keys and outputs are kept in a JSON state
+    # file next to the MS; nodes whose key matches and whose output is unchanged are skipped.
+    # Independent nodes run on max_workers threads; CASA tasks are not thread-safe, so the
+    # default runs them one at a time.
+    # With a caltable_store, solves are also looked up by a digest that only depends on
+    # content (MS contents, arguments, input table digests), so the same solve from another
+    # run or a re-imported MS is linked from the store instead of recomputed.
+    calibrator: PolarizationCalibrator = None
+    state_file: str = ""
+    max_workers: int = 1
+    caltable_store: CaltableStore = None
+    nodes: dict = field(default_factory=dict, init=False, repr=False)
+    state: dict = field(default_factory=dict, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.state_file == "":
+            self.state_file = self.calibrator.vis_name.rstrip("/") + ".ocarina_pipeline.json"
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as state_file:
+                self.state = json.load(state_file)
+
+    @classmethod
+    def polarization_chain(
+        cls,
+        calibrator: PolarizationCalibrator = None,
+        cross_hands_delay: dict = None,
+        leakage: dict = None,
+        pol_angle: dict = None,
+        apply: dict = None,
+        solve_cross_hands_delay: bool = True,
+        pre_average: dict = None,
+        known_model: dict = None,
+        unknown_model: dict = None,
+        **kwargs
+    ):
+        # [models ->] [pre-average ->] K-cross -> leakage -> pol angle -> apply, with the
+        # arguments of each step. known_model and unknown_model are the arguments of
+        # set_known_model (polarization angle calibrator) and set_unknown_model (leakage
+        # calibrator); the solves using each model depend on it. The solves read the
+        # pre-averaged MS when pre_average is given.
+        pipeline = cls(calibrator=calibrator, **kwargs)
+        angle_model, leakage_model = [], []
+        if known_model is not None:
+            pipeline.add_calibrator_step("known_model", "set_known_model", **known_model)
+            angle_model = ["known_model"]
+        if unknown_model is not None:
+            # Both models are written to the same MS, so they are not written concurrently
+            pipeline.add_calibrator_step(
+                "unknown_model", "set_unknown_model", depends_on=angle_model, **unknown_model
+            )
+            leakage_model = ["unknown_model"]
+        averaged = []
+        if pre_average is not None:
+            pipeline.add_calibrator_step(
+                "pre_average", "pre_average", depends_on=angle_model + leakage_model, **pre_average
+            )
+            averaged = ["pre_average"]
+        k_cross = []
+        if solve_cross_hands_delay:
+            pipeline.add_calibrator_step(
+                "k_cross",
+                "solve_cross_hands_delay",
+                depends_on=angle_model + averaged,
+                **(cross_hands_delay or {})
+            )
+            k_cross = ["k_cross"]
+        pipeline.add_calibrator_step(
+            "leakage",
+            "calibrate_leakage",
+            depends_on=leakage_model + averaged + k_cross,
+            **(leakage or {})
+        )
+        pipeline.add_calibrator_step(
+            "pol_angle",
+            "calibrate_pol_angle",
+            depends_on=angle_model + averaged + k_cross + ["leakage"],
+            **(pol_angle or {})
+        )
+        pipeline.add_calibrator_step(
+            "apply",
+            "apply_solutions",
+            depends_on=k_cross + ["leakage", "pol_angle"],
+            **(apply or {})
+        )
+        return pipeline
+
+    def add_calibrator_step(self, name: str, method: str, depends_on: list = (), **kwargs):
+        # add_step with the output attribute and table name of the calibrator solve methods
+        output_attribute, suffix = "", ""
+        if method in SOLVE_OUTPUTS:
+            output_attribute, suffix = SOLVE_OUTPUTS[method]
+            if method == "calibrate_leakage" and kwargs.get("field"):
+                suffix = ".D." + kwargs["field"]
+        return self.add_step(
+            name,
+            method,
+            depends_on=depends_on,
+            output_attribute=output_attribute,
+            output_table=self.calibrator.vis_name[:-3] + suffix if suffix else "",
+            always_run=method in MODEL_METHODS,
+            **kwargs
+        )
+
+    def add_step(
+        self,
+        name: str,
+        method: str,
+        depends_on: list = (),
+        output_attribute: str = "",
+        output_table: str = "",
+        always_run: bool = False,
+        **kwargs
+    ) -> PipelineNode:
+        if name in self.nodes:
+            raise ValueError("Step " + name + " is already in the pipeline")
+        if not callable(getattr(self.calibrator, method, None)):
+            raise ValueError("The calibrator has no method " + method)
+        for dependency in depends_on:
+            if dependency not in self.nodes:
+                raise ValueError("Step " + name + " depends on unknown step " + dependency)
+        node = PipelineNode(
+            name=name,
+            method=method,
+            kwargs=kwargs,
+            depends_on=list(depends_on),
+            output_attribute=output_attribute,
+            output_table=output_table,
+            always_run=always_run
+        )
+        self.nodes[name] = node
+        return node
+
+    def ms_fingerprint(self) -> list:
+        # Subtable stamps rather than the main table's, which changes whenever apply writes
+        # CORRECTED_DATA. Flagging the MS in between is not detected; rerun with force.
+        return MSMetadata.get_stamps(self.calibrator.vis_name).tolist()
+
+    def model_parameters(self, name: str) -> dict:
+        # Calibrator attributes that change the model a model step writes
+        if self.nodes[name].method not in MODEL_METHODS:
+            return {}
+        return {attribute: getattr(self.calibrator, attribute) for attribute in MODEL_ATTRIBUTES}
+
+    def node_key(self, name: str, keys: dict) -> str:
+        node = self.nodes[name]
+        content = {
+            "method": node.method,
+            "kwargs": node.kwargs,
+            "selection": {
+                attribute: getattr(self.calibrator, attribute)
+                for attribute in SELECTION_ATTRIBUTES
+            },
+            "ms": self.ms_fingerprint(),
+            "inputs": {
+                table: table_stamp(table)
+                for table in _input_tables(list(node.kwargs.values()))
+            },
+            "model": self.model_parameters(name),
+            "upstream": [keys[dependency] for dependency in node.depends_on]
+        }
+        encoded = json.dumps(content, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def store_digest(self, name: str, digests: dict, ms_digest: str) -> str:
+        # Like node_key, but free of paths and modification times so it holds across runs
+        node = self.nodes[name]
+        return CaltableStore.get_digest(
+            {
+                "method": node.method,
+                "kwargs": {
+                    argument: value
+                    for argument, value in node.kwargs.items() if not _input_tables(value)
+                },
+                "selection": {
+                    attribute: getattr(self.calibrator, attribute)
+                    for attribute in SELECTION_ATTRIBUTES if attribute != "vis_name"
+                },
+                "ms": ms_digest,
+                "inputs": [
+                    table_digest(table) for table in _input_tables(list(node.kwargs.values()))
+                ],
+                "model": self.model_parameters(name),
+                "upstream": [digests[dependency] for dependency in node.depends_on]
+            }
+        )
+
+    def _is_valid(self, name: str, key: str) -> bool:
+        record = self.state.get(name)
+        if record is None or record.get("key") != key or record.get("status") != "done":
+            return False
+        output = record.get("output", "")
+        return output == "" or (
+            os.path.exists(output) and table_stamp(output) == record.get("output_stamp")
+        )
+
+    def _save_state(self):
+        temporary_file = self.state_file + ".{0}.tmp".format(os.getpid())
+        with open(temporary_file, "w") as state_file:
+            json.dump(self.state, state_file, indent=2)
+        os.replace(temporary_file, self.state_file)
+
+    def _run_node(self, name: str, key: str, digest: str = None) -> dict:
+        node = self.nodes[name]
+        start = time.time()
+        restored = False
+        if node.method in UNSTORED_METHODS:
+            digest = None
+        if digest is not None and node.output_table and node.output_attribute:
+            restored = self.caltable_store.get(digest, node.output_table)
+        if restored:
+            print("Restored step " + name + " from the caltable store")
+            setattr(self.calibrator, node.output_attribute, node.output_table)
+        else:
+            print("Running step " + name)
+            getattr(self.calibrator, node.method)(**node.kwargs)
+        output = getattr(self.calibrator, node.output_attribute) if node.output_attribute else ""
+        if digest is not None and output and not restored:
+            self.caltable_store.put(digest, output, inputs={"step": name, "key": key})
+        return {
+            "key": key,
+            "status": "done",
+            "restored": restored,
+            "output": output,
+            "output_stamp": table_stamp(output) if output else -1,
+            "elapsed": time.time() - start
+        }
+
+    def run(self, force: list = ()) -> dict:
+        # Returns the status of every step: skipped, done, restored (from the caltable store),
+        # failed or blocked (a dependency failed). Steps in force, and everything downstream
+        # of them, always run.
+        # Steps can only depend on steps added before them, so insertion order is topological
+        order = list(self.nodes.keys())
+        keys = {}
+        for name in order:
+            keys[name] = self.node_key(name, keys)
+        digests = {name: None for name in order}
+        if self.caltable_store is not None:
+            ms_digest = ms_content_digest(self.calibrator.vis_name, self.calibrator.ms_metadata)
+            for name in order:
+                digests[name] = self.store_digest(name, digests, ms_digest)
+
+        # A step is only skipped when everything it depends on was skipped too, so rerunning
+        # a step (e.g. because its table was deleted) also reruns what consumes its table.
+        # always_run steps whose key is unchanged rerun without invalidating their consumers.
+        statuses = {}
+        unchanged = set()
+        for name in order:
+            dependencies_skipped = all(
+                statuses.get(dependency) == "skipped" or dependency in unchanged
+                for dependency in self.nodes[name].depends_on
+            )
+            if self.nodes[name].always_run:
+                if name not in force and dependencies_skipped and \
+                        self._is_valid(name, keys[name]):
+                    unchanged.add(name)
+                continue
+            if name not in force and dependencies_skipped and self._is_valid(name, keys[name]):
+                node = self.nodes[name]
+                if node.output_attribute:
+                    setattr(self.calibrator, node.output_attribute, self.state[name]["output"])
+                statuses[name] = "skipped"
+                print("Skipping step " + name + ", its output is up to date")
+
+        failures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {}
+            while True:
+                for name in order:
+                    if name in statuses or name in running.values():
+                        continue
+                    dependencies = [statuses.get(d) for d in self.nodes[name].depends_on]
+                    if any(status in ("failed", "blocked") for status in dependencies):
+                        statuses[name] = "blocked"
+                    elif all(status in ("skipped", "done", "restored") for status in dependencies):
+                        future = executor.submit(self._run_node, name, keys[name], digests[name])
+                        running[future] = name
+                if not running:
+                    break
+                finished, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        record = future.result()
+                        statuses[name] = "restored" if record["restored"] else "done"
+                    except (Exception, SystemExit) as exception:
+                        print("Step " + name + " failed:")
+                        traceback.print_exception(
+                            type(exception), exception, exception.__traceback__
+                        )
+                        record = {"key": keys[name], "status": "failed"}
+                        statuses[name] = "failed"
+                        failures.append(name)
+                    with self._lock:
+                        self.state[name] = record
+                        self._save_state()
+
+        if self.caltable_store is not None:
+            self.caltable_store.gc()
+        if failures:
+            raise RuntimeError("Pipeline steps failed: " + ", ".join(failures))
+        return statuses
+
+    def invalidate(self, names: list = None):
+        # Forgets the recorded outputs so the steps (all by default) run again
+        with self._lock:
+            for name in list(self.state.keys()) if names is None else names:
+                self.state.pop(name, None)
+            self._save_state()
@@ -0,0 +1,108 @@
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List
+from .caltableplotter import caltable_plot_files
+
+PLOT_MODES = ("sync", "async", "deferred")
+
+
+@dataclass(init=True, repr=True)
+class PlotSpec:
+    # A plotting call that can be rendered now, in a worker process or later on.
+    # function has to be picklable (module-level functions or LazyObject proxies).
+    function: Callable = None
+    kwargs: dict = field(default_factory=dict)
+
+    @property
+    def plot_files(self) -> list:
+        # The files the plots are written to. The native backend renders several plots from
+        # one spec, and paged antenna plots of a caltable go to one file per page
+        if "plots" in self.kwargs:
+            plots = self.kwargs["plots"]
+        elif "plotfile" in self.kwargs:
+            plots = [self.kwargs]
+        else:
+            return []
+        return caltable_plot_files(self.kwargs.get("vis", ""), plots)
+
+    @property
+    def plot_file(self) -> str:
+        return ", ".join(self.plot_files)
+
+    def render(self):
+        return self.function(**self.kwargs)
+
+
+@dataclass(init=True, repr=True)
+class PlotQueue:
+    # sync renders each plot as it is submitted, async hands it to a bounded pool of spawned
+    # processes and deferred only collects the specs so they can be rendered later
+    mode: str = "sync"
+    max_workers: int = 2
+    specs: List[PlotSpec] = field(default_factory=list, init=False, repr=False)
+    _executor: ProcessPoolExecutor = field(default=None, init=False, repr=False)
+    _pending: list = field(default_factory=list, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.mode not in PLOT_MODES:
+            raise ValueError("Plot mode must be one of: " + ", ".join(PLOT_MODES))
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Forking a process with CASA already loaded is unsafe, so workers are spawned
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def submit(self, function: Callable, **kwargs) -> PlotSpec:
+        spec = PlotSpec(function=function, kwargs=kwargs)
+        if self.mode == "sync":
+            spec.render()
+        elif self.mode == "deferred":
+            self.specs.append(spec)
+        else:
+            self._pending.append((spec, self._get_executor().submit(spec.render)))
+        return spec
+
+    def wait(self) -> List[PlotSpec]:
+        # Blocks until every queued plot has been rendered and returns the specs that failed
+        failed = []
+        for spec, future in self._pending:
+            try:
+                future.result()
+            except Exception:
+                print("Plot " + spec.plot_file + " failed:")
+                traceback.print_exc()
+                failed.append(spec)
+        self._pending = []
+        return failed
+
+    def render_deferred(self, asynchronous: bool = True) -> List[PlotSpec]:
+        # Returns the specs rendered or, asynchronously, handed to the pool; then this returns
+        # at once and wait() (or the calibrator before it writes the MS) collects them
+        specs, self.specs = self.specs, []
+        for spec in specs:
+            if asynchronous:
+                self._pending.append((spec, self._get_executor().submit(spec.render)))
+            else:
+                spec.render()
+        return specs
+
+    def pending_plots(self) -> int:
+        return len([future for _, future in self._pending if not future.done()])
+
+    def shutdown(self):
+        self.wait()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __getstate__(self):
+        # Worker pools and futures stay with the process that created them
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_pending"] = []
+        return state
@@ -1,15 +1,63 @@
+import functools
+import multiprocessing
 import os
 import sys
+import time
+import traceback
 import numpy as np
 from dataclasses import dataclass
 from dataclasses import field as dataclass_field
+from concurrent.futures import ProcessPoolExecutor
 from abc import ABCMeta
-from casatasks import polcal, applycal, gaincal, setjy, fluxscale, rmtables, flagdata, flagmanager
-from casaplotms import plotms
 import astropy.units as un
 from astropy.units import Quantity
-from ..utils import query_table
+from ..utils import LazyObject, MSMetadata, Tracer, table_pool
+from ..functions import StokesModel
 from ..polarized_sources import PolarizedSource
+from .caltableplotter import render_caltable_plots
+from .modelwriter import ModelWriter
+from .plotqueue import PlotQueue
+from .spwparallel import SPW_INDEPENDENT_POL_TYPES, solve_polcal_by_spw
+
+# CASA tasks are only imported the first time they are called
+polcal = LazyObject("casatasks", "polcal")
+applycal = LazyObject("casatasks", "applycal")
+gaincal = LazyObject("casatasks", "gaincal")
+setjy = LazyObject("casatasks", "setjy")
+fluxscale = LazyObject("casatasks", "fluxscale")
+rmtables = LazyObject("casatasks", "rmtables")
+flagdata = LazyObject("casatasks", "flagdata")
+flagmanager = LazyObject("casatasks", "flagmanager")
+mstransform = LazyObject("casatasks", "mstransform")
+plotms = LazyObject("casaplotms", "plotms")
+
+
+def _traced_step(method):
+    # Runs a calibrator step inside a span of the calibrator tracer, if it has one, which
+    # also traces the CASA tasks and fits the step calls
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.tracer is None:
+            return method(self, *args, **kwargs)
+        with self.tracer.activate(), self.tracer.span(method.__name__, vis=self.vis_name):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def _calibrate_leakage_field(calibrator, field: str, kwargs: dict) -> dict:
+    # Runs in a worker process on a copy of the calibrator. Plots are only collected, so the
+    # parent renders them with its own plot queue.
+    calibrator.plot_queue = PlotQueue(mode="deferred")
+    start = time.time()
+    result = {"table": "", "error": None, "plots": []}
+    try:
+        result["table"] = calibrator.calibrate_leakage(field=field, **kwargs)
+    except (Exception, SystemExit):
+        result["error"] = traceback.format_exc()
+    result["plots"] = calibrator.plot_queue.specs
+    result["elapsed"] = time.time() - start
+    return result
 
 
 @dataclass(init=True, repr=True)
@@ -33,16 +81,36 @@ class PolarizationCalibrator(metaclass=ABCMeta):
     k_cross_table: str = ""
     leakage_table: str = ""
     pol_angle_table: str = ""
+    plot_mode: str = "sync"
+    plot_workers: int = 2
+    plot_backend: str = "plotms"
+    plot_queue: PlotQueue = dataclass_field(init=False, repr=False, default=None)
+    ms_metadata: MSMetadata = dataclass_field(default=None, repr=False)
+    persist_metadata: bool = False
+    polcal_workers: int = 1
+    polcal_spw_groups: int = 0
+    solve_vis_name: str = ""
+    tracer: Tracer = dataclass_field(default=None, repr=False)
+    model_backend: str = "setjy"
+    model_workers: int = 1
 
     def __post_init__(self):
+        self.plot_queue = PlotQueue(mode=self.plot_mode, max_workers=self.plot_workers)
+        if self.plot_backend not in ("plotms", "native"):
+            raise ValueError("Plot backend must be either 'plotms' or 'native'")
+        if self.model_backend not in ("setjy", "native"):
+            raise ValueError("Model backend must be either 'setjy' or 'native'")
+
+        # Subtables are read once here and shared by every calibration step
+        if self.ms_metadata is None:
+            self.ms_metadata = MSMetadata.from_ms(self.vis_name, persist=self.persist_metadata)
+
+        # MS read by the solvers, a pre-averaged copy of the calibrator fields after pre_average
+        if self.solve_vis_name == "":
+            self.solve_vis_name = self.vis_name
 
         if self.nu_0 is None:
-            channel_column = query_table(
-                table_name=self.vis_name,
-                query="SELECT CHAN_FREQ FROM " + self.vis_name + "/SPECTRAL_WINDOW" +
-                " WHERE !FLAG_ROW"
-            )
-            channel_frequencies = channel_column.getcol("CHAN_FREQ") * un.Hz
+            channel_frequencies = self.ms_metadata.unflagged_channel_frequencies() * un.Hz
             self.nu_0 = (np.max(channel_frequencies) + np.min(channel_frequencies)) / 2.
 
         if self.nu_min_frac is None:
@@ -58,13 +126,7 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             self.nu_max_angle = np.inf * un.Hz
 
         if self.spw_ids is None:
-            spw_table = query_table(
-                table_name=self.vis_name,
-                query="SELECT ROWID() AS ROW_ID FROM " + self.vis_name + "/SPECTRAL_WINDOW" +
-                " WHERE !FLAG_ROW"
-            )
-            spw_dict = spw_table.getvarcol("ROW_ID")
-            self.spw_ids = np.array([item for item in spw_dict.values()]).flatten()
+            self.spw_ids = self.ms_metadata.unflagged_spw_ids()
 
         self.number_spectral_windows = len(self.spw_ids)
         print("Number of spectral windows: " + str(self.number_spectral_windows))
@@ -74,8 +136,45 @@ class PolarizationCalibrator(metaclass=ABCMeta):
         print("Minimum freq for polarization angle: {0}".format(self.nu_min_angle.to(un.GHz)))
         print("Maximum freq for polarization angle: {0}".format(self.nu_max_angle.to(un.GHz)))
 
+    @_traced_step
+    def wait_for_plots(self) -> list:
+        # Barrier for plots rendered in the background. Returns the specs of failed plots
+        return self.plot_queue.wait()
+
+    @_traced_step
+    def render_deferred_plots(self, asynchronous: bool = True) -> list:
+        return self.plot_queue.render_deferred(asynchronous=asynchronous)
+
+    def remove_table(self, table_name: str):
+        # Background plots and pooled read-only handles may still be using the previous table
+        self.wait_for_plots()
+        table_pool.close(table_name)
+        rmtables(table_name)
+
+    def run_polcal(self, split_spws: bool = False, **kwargs):
+        # Per-spw solutions over the whole spw range can be split into groups solved in
+        # parallel processes and merged into one table (polcal_workers > 1)
+        if split_spws and self.polcal_workers > 1 and not self.old_vla and \
+                kwargs["poltype"] in SPW_INDEPENDENT_POL_TYPES:
+            n_groups = self.polcal_spw_groups if self.polcal_spw_groups > 0 else self.polcal_workers
+            solve_polcal_by_spw(kwargs, self.spw_ids, n_groups, self.polcal_workers)
+        else:
+            polcal(**kwargs)
+
+    def plot_caltable(self, cal_table: str, plots: list):
+        # Each plot is a dictionary of plotms arguments. The native backend renders all of them
+        # from a single read of the table instead of launching plotms once per plot, and
+        # exports every page of antenna iterations (plotms only exports the first).
+        if self.plot_backend == "native":
+            plots = [dict(plot, exprange="all") for plot in plots]
+            self.plot_queue.submit(render_caltable_plots, vis=cal_table, plots=plots)
+        else:
+            for plot in plots:
+                self.plot_queue.submit(plotms, vis=cal_table, showgui=False, overwrite=True, **plot)
+
     def plot_models(self, field: str = ""):
-        plotms(
+        self.plot_queue.submit(
+            plotms,
             vis=self.vis_name,
             field=field,
             correlation='RR',
@@ -88,7 +187,8 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             plotfile=field + '_RRamp_model.png',
             overwrite=True
         )
-        plotms(
+        self.plot_queue.submit(
+            plotms,
             vis=self.vis_name,
             field=field,
             correlation='RL',
@@ -101,7 +201,8 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             plotfile=field + '_RLamp_model.png',
             overwrite=True
         )
-        plotms(
+        self.plot_queue.submit(
+            plotms,
             vis=self.vis_name,
             field=field,
             correlation='RR',
@@ -115,7 +216,8 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             plotfile=field + '_RRphase_model.png',
             overwrite=True
         )
-        plotms(
+        self.plot_queue.submit(
+            plotms,
             vis=self.vis_name,
             field=field,
             correlation='RL',
@@ -130,6 +232,17 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             overwrite=True
         )
 
+    def write_model(self, model: StokesModel, field: str = "", use_scratch: bool = True) -> dict:
+        # MODEL_DATA of the field written by ocarina instead of setjy; there is no virtual model
+        if not use_scratch:
+            raise ValueError("The native model backend writes MODEL_DATA, so it needs use_scratch")
+        self.wait_for_plots()
+        writer = ModelWriter(
+            vis_name=self.vis_name, ms_metadata=self.ms_metadata, max_workers=self.model_workers
+        )
+        return writer.write(model, field)
+
+    @_traced_step
     def set_unknown_model(
         self,
         pol_source_object: PolarizedSource = None,
@@ -142,24 +255,12 @@ class PolarizationCalibrator(metaclass=ABCMeta):
         telescope_factor: float = 1.0
     ):
 
-        field_table = query_table(
-            table_name=self.vis_name, query="SELECT NAME FROM " + self.vis_name + "/FIELD"
-        )
-        field_ids = field_table.rownumbers()
-        fields = field_table.getcol("NAME")
-
-        try:
-            field_id_query = np.where(fields == field)[0][0]
-        except IndexError:
-            raise ValueError("The field you have entered does not exist in the measurement set")
-
-        field_id = field_ids[field_id_query]
+        field_id = self.ms_metadata.field_id(field)
         print("Field " + field + " - ID: " + str(field_id))
-        field_table.close()
         # TODO: get MS string without using slicing
         flux_table = self.vis_name[:-3] + ".F." + field
         if os.path.exists(flux_table):
-            rmtables(flux_table)
+            self.remove_table(flux_table)
 
         # From flux scale documentation we know that coefficients are
         # returned from the natural log nu/nu_0 Taylor expansion
@@ -191,23 +292,33 @@ class PolarizationCalibrator(metaclass=ABCMeta):
 
         print("Alpha & Beta: ", spectral_index)
 
-        source_dict = setjy(
-            vis=self.vis_name,
-            field=field,
-            standard='manual',
-            spw='',
-            fluxdensity=[intensity, 0, 0, 0],
-            spix=spectral_index.tolist(),
-            reffreq=str(fit_ref_freq).replace(" ", ""),
-            interpolation="nearest",
-            scalebychan=True,
-            usescratch=use_scratch
-        )
+        # Background plots may still be reading MODEL_DATA
+        self.wait_for_plots()
+        if self.model_backend == "native":
+            source_dict = self.write_model(
+                StokesModel(nu_0=fit_ref_freq, intensity=intensity, spectral_index=spectral_index),
+                field=field,
+                use_scratch=use_scratch
+            )
+        else:
+            source_dict = setjy(
+                vis=self.vis_name,
+                field=field,
+                standard='manual',
+                spw='',
+                fluxdensity=[intensity, 0, 0, 0],
+                spix=spectral_index.tolist(),
+                reffreq=str(fit_ref_freq).replace(" ", ""),
+                interpolation="nearest",
+                scalebychan=True,
+                usescratch=use_scratch
+            )
         print(source_dict)
         self.plot_models(field)
 
         return flux_table
 
+    @_traced_step
     def set_known_model(
         self,
         pol_source_object: PolarizedSource = None,
@@ -249,34 +360,94 @@ class PolarizationCalibrator(metaclass=ABCMeta):
         print("Error: ", pol_fraction_coefficients_errors)
         print("Pol angle coefficients: ", pol_angle_coefficients)
         print("Error: ", pol_angle_coefficients_errors)
-        source_dict = setjy(
-            vis=self.vis_name,
-            field=field,
-            standard='manual',
-            spw='',
-            selectdata=False,
-            timerange="",
-            scan="",
-            intent="",
-            observation="",
-            model="",
-            listmodels=False,
-            fluxdensity=[intensity, 0, 0, 0],
-            spix=spec_idx.tolist(),
-            reffreq=str(self.nu_0).replace(" ", ""),
-            polindex=pol_fraction_coefficients,
-            polangle=pol_angle_coefficients,
-            rotmeas=0,
-            fluxdict={},
-            useephemdir=False,
-            interpolation="nearest",
-            scalebychan=True,
-            usescratch=use_scratch,
-            ismms=False
-        )
+        # Background plots may still be reading MODEL_DATA
+        self.wait_for_plots()
+        if self.model_backend == "native":
+            model = StokesModel(
+                nu_0=self.nu_0,
+                intensity=intensity,
+                spectral_index=spec_idx,
+                pol_fraction=pol_fraction_coefficients,
+                pol_angle=pol_angle_coefficients
+            )
+            source_dict = self.write_model(model, field=field, use_scratch=use_scratch)
+        else:
+            source_dict = setjy(
+                vis=self.vis_name,
+                field=field,
+                standard='manual',
+                spw='',
+                selectdata=False,
+                timerange="",
+                scan="",
+                intent="",
+                observation="",
+                model="",
+                listmodels=False,
+                fluxdensity=[intensity, 0, 0, 0],
+                spix=spec_idx.tolist(),
+                reffreq=str(self.nu_0).replace(" ", ""),
+                polindex=pol_fraction_coefficients,
+                polangle=pol_angle_coefficients,
+                rotmeas=0,
+                fluxdict={},
+                useephemdir=False,
+                interpolation="nearest",
+                scalebychan=True,
+                usescratch=use_scratch,
+                ismms=False
+            )
         print(source_dict)
         self.plot_models(field)
 
+    @_traced_step
+    def pre_average(
+        self, time_bin: str = "", chan_bin: int = 1, fields: list = (), spw: str = ""
+    ) -> str:
+        # Averages the calibrator fields (pol angle and leakage by default) into a scratch MS
+        # once, and points the solvers at it. Field and spw IDs are not reindexed, so the
+        # caltables apply to the original MS; channel-averaged solutions are interpolated in
+        # frequency by applycal. Models must be set (usescratch=True) before, since MODEL_DATA
+        # is averaged along with DATA. time_bin should stay short compared to the parallactic
+        # angle rotation; averaging never crosses scans.
+        if time_bin == "" and chan_bin <= 1:
+            raise ValueError("Pre-averaging needs a time bin or a channel bin larger than 1")
+        if not fields:
+            fields = [field for field in (self.pol_angle_field, self.leakage_field) if field]
+            fields = list(dict.fromkeys(fields))
+        # TODO: Get string before .ms without using slicing
+        output_vis = self.vis_name[:-3] + ".preavg.ms"
+        if os.path.exists(output_vis):
+            self.remove_table(output_vis)
+        if spw == "":
+            spw = str(self.spw_ids[0]) + '~' + str(self.spw_ids[-1])
+
+        print("Pre-averaging " + ",".join(fields) + " into " + output_vis)
+        print("Time bin: " + (time_bin if time_bin else "none"))
+        print("Channel bin: " + str(chan_bin))
+        mstransform(
+            vis=self.vis_name,
+            outputvis=output_vis,
+            field=",".join(fields),
+            spw=spw,
+            datacolumn="all",
+            reindex=False,
+            keepflags=True,
+            timeaverage=time_bin != "",
+            timebin=time_bin if time_bin else "0s",
+            chanaverage=chan_bin > 1,
+            chanbin=chan_bin
+        )
+
+        if not os.path.exists(output_vis):
+            raise FileNotFoundError(
+                "Pre-averaged MS was not created and cannot continue. Exiting..."
+            )
+
+        self.solve_vis_name = output_vis
+        return output_vis
+
+    @_traced_step
     def solve_cross_hands_delay(
         self,
         min_snr: float = 3.0,
@@ -288,14 +459,14 @@ class PolarizationCalibrator(metaclass=ABCMeta):
         min_bl_per_ant: int = 4
     ):
         print("Solving Cross-hand Delays")
-        print("Vis: " + self.vis_name)
+        print("Vis: " + self.solve_vis_name)
         print("Field: " + self.pol_angle_field)
         print("Reference antenna: " + self.ref_ant)
 
         # TODO: Get string before .ms without using slicing
         cal_table = self.vis_name[:-3] + ".Kcross"
         if os.path.exists(cal_table):
-            rmtables(cal_table)
+            self.remove_table(cal_table)
         first_spw = self.spw_ids[0]
         last_spw = self.spw_ids[-1]
 
@@ -313,7 +484,7 @@ class PolarizationCalibrator(metaclass=ABCMeta):
         print("Spw: " + spw)
 
         gaincal(
-            vis=self.vis_name,
+            vis=self.solve_vis_name,
             caltable=cal_table,
             field=self.pol_angle_field,
             spw=spw,
@@ -339,20 +510,22 @@ class PolarizationCalibrator(metaclass=ABCMeta):
                 "Calibration table was not created and cannot continue. Exiting..."
             )
 
-        plotms(
-            vis=cal_table,
-            xaxis='frequency',
-            yaxis='delay',
-            antenna=self.k_cross_ref_ant,
-            coloraxis='corr',
-            showgui=False,
-            plotfile=self.vis_name[:-3] + '.Kcross.png',
-            overwrite=True
+        self.plot_caltable(
+            cal_table, [
+                dict(
+                    xaxis='frequency',
+                    yaxis='delay',
+                    antenna=self.k_cross_ref_ant,
+                    coloraxis='corr',
+                    plotfile=self.vis_name[:-3] + '.Kcross.png'
+                )
+            ]
         )
 
         self.k_cross_table = cal_table
         return cal_table
 
+    @_traced_step
     def calibrate_leakage(
         self,
         sol_int: str = 'inf',
@@ -375,7 +548,7 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             else:
                 gain_table = [self.k_cross_table]
         print("Leakage calibration")
-        print("Vis: " + self.vis_name)
+        print("Vis: " + self.solve_vis_name)
 
         print("Gain tables: ", gain_table)
         print("Reference antenna: " + self.ref_ant)
@@ -390,11 +563,12 @@ class PolarizationCalibrator(metaclass=ABCMeta):
         if not gain_field:
             gain_field = [''] * len(gain_table)
         if os.path.exists(cal_table):
-            rmtables(cal_table)
+            self.remove_table(cal_table)
 
         first_spw = self.spw_ids[0]
         last_spw = self.spw_ids[-1]
 
+        split_spws = spw == ""
         if spw == "":
             spw = str(first_spw) + '~' + str(last_spw)
 
@@ -421,8 +595,9 @@ class PolarizationCalibrator(metaclass=ABCMeta):
         if field == "":
             field = self.leakage_field
 
-        polcal(
-            vis=self.vis_name,
+        self.run_polcal(
+            split_spws=split_spws,
+            vis=self.solve_vis_name,
             caltable=cal_table,
             field=field,
             spw=spw,
@@ -461,46 +636,79 @@ class PolarizationCalibrator(metaclass=ABCMeta):
                 comment="Clip flagging outside [" + str(clip_min) + "," + str(clip_max) + "]"
             )
 
-        plotms(
-            vis=cal_table,
-            xaxis='freq',
-            yaxis='amp',
-            iteraxis='antenna',
-            coloraxis='corr',
-            showgui=False,
-            gridrows=3,
-            gridcols=3,
-            plotfile=self.vis_name[:-3] + '.D0.ampvsfreq.png',
-            overwrite=True
-        )
-
-        plotms(
-            vis=cal_table,
-            xaxis='chan',
-            yaxis='phase',
-            iteraxis='antenna',
-            coloraxis='corr',
-            gridrows=3,
-            gridcols=3,
-            plotrange=[-1, -1, -180, 180],
-            showgui=False,
-            plotfile=self.vis_name[:-3] + '.D0.phasevschan.png',
-            overwrite=True
-        )
-
-        plotms(
-            vis=cal_table,
-            xaxis='antenna1',
-            yaxis='amp',
-            coloraxis='corr',
-            showgui=False,
-            plotfile=self.vis_name[:-3] + '.D0.ampvsantenna.png',
-            overwrite=True
+        self.plot_caltable(
+            cal_table, [
+                dict(
+                    xaxis='freq',
+                    yaxis='amp',
+                    iteraxis='antenna',
+                    coloraxis='corr',
+                    gridrows=3,
+                    gridcols=3,
+                    plotfile=cal_table + '.ampvsfreq.png'
+                ),
+                dict(
+                    xaxis='chan',
+                    yaxis='phase',
+                    iteraxis='antenna',
+                    coloraxis='corr',
+                    gridrows=3,
+                    gridcols=3,
+                    plotrange=[-1, -1, -180, 180],
+                    plotfile=cal_table + '.phasevschan.png'
+                ),
+                dict(
+                    xaxis='antenna1',
+                    yaxis='amp',
+                    coloraxis='corr',
+                    plotfile=cal_table + '.ampvsantenna.png'
+                )
+            ]
         )
 
         self.leakage_table = cal_table
         return cal_table
 
+    @_traced_step
+    def calibrate_leakage_fields(self, fields: list = (), max_workers: int = 2, **kwargs) -> dict:
+        # Solves one .D.<field> table per field concurrently. Solves only read the MS and each
+        # writes its own table, so they run in a bounded pool of spawned processes. Returns,
+        # per field, the table, the plot files, the elapsed seconds and the error (or None).
+        results = {}
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = {
+                field: executor.submit(_calibrate_leakage_field, self, field, kwargs)
+                for field in fields
+            }
+            for field, future in futures.items():
+                try:
+                    results[field] = future.result()
+                except Exception:
+                    # The worker itself died (e.g. killed for memory)
+                    results[field] = {
+                        "table": "",
+                        "error": traceback.format_exc(),
+                        "plots": [],
+                        "elapsed": float("nan")
+                    }
+                plots = results[field]["plots"]
+                for spec in plots:
+                    self.plot_queue.submit(spec.function, **spec.kwargs)
+                results[field]["plots"] = [plot for spec in plots for plot in spec.plot_files]
+                if results[field]["error"] is None:
+                    print(
+                        "Leakage for field {0} solved in {1:.1f} s".format(
+                            field, results[field]["elapsed"]
+                        )
+                    )
+                else:
+                    print("Leakage for field " + field + " failed:")
+                    print(results[field]["error"])
+        return results
+
+    @_traced_step
     def calibrate_pol_angle(
         self,
         sol_int: str = 'inf',
@@ -520,7 +728,7 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             else:
                 gain_table = [self.k_cross_table, self.leakage_table]
         print("Polarization angle calibration")
-        print("Vis: " + self.vis_name)
+        print("Vis: " + self.solve_vis_name)
         print("Field: " + self.pol_angle_field)
 
         print("Gain tables: ", gain_table)
@@ -533,10 +741,11 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             gain_field = [''] * len(gain_table)
 
         if os.path.exists(cal_table):
-            rmtables(cal_table)
+            self.remove_table(cal_table)
         first_spw = self.spw_ids[0]
         last_spw = self.spw_ids[-1]
 
+        split_spws = spw == ""
         if spw == "":
             spw = str(first_spw) + '~' + str(last_spw)
 
@@ -562,8 +771,9 @@ class PolarizationCalibrator(metaclass=ABCMeta):
         if field == "":
             field = self.pol_angle_field
 
-        polcal(
-            vis=self.vis_name,
+        self.run_polcal(
+            split_spws=split_spws,
+            vis=self.solve_vis_name,
             caltable=cal_table,
             field=field,
             spw=spw,
@@ -582,90 +792,44 @@ class PolarizationCalibrator(metaclass=ABCMeta):
 
         if not os.path.exists(cal_table):
             sys.exit("Caltable was not created and cannot continue. Exiting...")
-        plotms(
-            vis=cal_table,
-            xaxis='freq',
-            yaxis='phase',
-            coloraxis='spw',
-            plotrange=[-1, -1, -180, 180],
-            showgui=False,
-            plotfile=self.vis_name[:-3] + '.X0.phasevsfreq.png',
-            overwrite=True
+        self.plot_caltable(
+            cal_table, [
+                dict(
+                    xaxis='freq',
+                    yaxis='phase',
+                    coloraxis='spw',
+                    plotrange=[-1, -1, -180, 180],
+                    plotfile=self.vis_name[:-3] + '.X0.phasevsfreq.png'
+                )
+            ]
         )
 
         self.pol_angle_table = cal_table
         return cal_table
 
+    @_traced_step
     def plot_leakage(self, plot_dir="", field="", cal_table=""):
         if field == "" and cal_table == "":
-            plotms(
-                vis=self.leakage_table,
-                xaxis='antenna1',
-                yaxis='amp',
-                plotfile=plot_dir + self.vis_name[:-3] + '.D0.amp.png',
-                showgui=False,
-                overwrite=True
-            )
-            plotms(
-                vis=self.leakage_table,
-                xaxis='antenna1',
-                yaxis='phase',
-                plotrange=[-1, -1, -180, 180],
-                plotfile=plot_dir + self.vis_name[:-3] + '.D0.phs.png',
-                showgui=False,
-                overwrite=True
-            )
-            plotms(
-                vis=self.leakage_table,
-                xaxis='antenna1',
-                yaxis='snr',
-                showgui=False,
-                plotfile=plot_dir + self.vis_name[:-3] + '.D0.snr.png',
-                overwrite=True
-            )
-            plotms(
-                vis=self.leakage_table,
-                xaxis='real',
-                yaxis='imag',
-                showgui=False,
-                plotfile=plot_dir + self.vis_name[:-3] + '.D0.cmplx.png',
-                overwrite=True
-            )
+            cal_table = self.leakage_table
+            plot_prefix = plot_dir + self.vis_name[:-3] + '.D0.'
         else:
-            plotms(
-                vis=cal_table,
-                xaxis='antenna1',
-                yaxis='amp',
-                plotfile=plot_dir + self.vis_name[:-3] + '.D.' + field + 'amp.png',
-                showgui=False,
-                overwrite=True
-            )
-            plotms(
-                vis=cal_table,
-                xaxis='antenna1',
-                yaxis='phase',
-                plotrange=[-1, -1, -180, 180],
-                plotfile=plot_dir + self.vis_name[:-3] + '.D.' + field + 'phs.png',
-                showgui=False,
-                overwrite=True
-            )
-            plotms(
-                vis=cal_table,
-                xaxis='antenna1',
-                yaxis='snr',
-                showgui=False,
-                plotfile=plot_dir + self.vis_name[:-3] + '.D.' + field + 'snr.png',
-                overwrite=True
-            )
-            plotms(
-                vis=cal_table,
-                xaxis='real',
-                yaxis='imag',
-                showgui=False,
-                plotfile=plot_dir + self.vis_name[:-3] + '.D.' + field + 'cmplx.png',
-                overwrite=True
-            )
+            plot_prefix = plot_dir + self.vis_name[:-3] + '.D.' + field + '.'
+
+        self.plot_caltable(
+            cal_table, [
+                dict(xaxis='antenna1', yaxis='amp', plotfile=plot_prefix + 'amp.png'),
+                dict(
+                    xaxis='antenna1',
+                    yaxis='phase',
+                    plotrange=[-1, -1, -180, 180],
+                    plotfile=plot_prefix + 'phs.png'
+                ),
+                dict(xaxis='antenna1', yaxis='snr', plotfile=plot_prefix + 'snr.png'),
+                dict(xaxis='real', yaxis='imag', plotfile=plot_prefix + 'cmplx.png')
+            ]
+        )
 
+    @_traced_step
     def apply_single_solution(
         self,
         field: str = '',
@@ -680,6 +844,8 @@ class PolarizationCalibrator(metaclass=ABCMeta):
         antenna: str = '',
         flag_backup: bool = True
     ):
+        # Background plots may still be reading the MS
+        self.wait_for_plots()
         applycal(
             vis=self.vis_name,
             field=field,
@@ -696,6 +862,7 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             flagbackup=flag_backup
         )
 
+    @_traced_step
     def apply_solutions(
         self,
         spw_map: list = [],
@@ -742,6 +909,8 @@ class PolarizationCalibrator(metaclass=ABCMeta):
         print("Spwmap: ", spw_map)
         if not gain_field:
             gain_field = [''] * len(gain_table)
+        # Background plots may still be reading the MS
+        self.wait_for_plots()
         applycal(
             vis=self.vis_name,
             field='',
@@ -758,8 +927,10 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             flagbackup=flag_backup
         )
 
+    @_traced_step
     def final_plots(self):
-        plotms(
+        self.plot_queue.submit(
+            plotms,
             vis=self.vis_name,
             field=self.pol_angle_field,
             correlation='',
@@ -775,7 +946,8 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             overwrite=True
         )
 
-        plotms(
+        self.plot_queue.submit(
+            plotms,
             vis=self.vis_name,
             field=self.pol_angle_field,
             correlation='',
@@ -792,7 +964,8 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             overwrite=True
         )
 
-        plotms(
+        self.plot_queue.submit(
+            plotms,
             vis=self.vis_name,
             field=self.leakage_field,
             correlation='',
@@ -808,7 +981,8 @@ class PolarizationCalibrator(metaclass=ABCMeta):
             overwrite=True
         )
 
-        plotms(
+        self.plot_queue.submit(
+            plotms,
             vis=self.vis_name,
             field=self.leakage_field,
             correlation='RR,LL',
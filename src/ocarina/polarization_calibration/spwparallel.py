@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import shutil
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from ..utils import LazyObject, table_pool
+
+polcal = LazyObject("casatasks", "polcal")
+
+# Solution types solved independently for every spw (and channel)
+SPW_INDEPENDENT_POL_TYPES = ("Df", "Dflls", "Xf")
+# Lower-case fragments of the errors polcal raises when its selection holds no data
+NO_DATA_MESSAGES = ("no data selected", "selects zero rows", "selection is empty")
+
+
+def spw_groups(spw_ids: np.ndarray, n_groups: int) -> list:
+    # Splits the spws into at most n_groups contiguous groups, as polcal spw selections
+    groups = []
+    for group in np.array_split(np.asarray(spw_ids), min(n_groups, len(spw_ids))):
+        if np.all(np.diff(group) == 1):
+            groups.append(str(group[0]) + '~' + str(group[-1]))
+        else:
+            groups.append(",".join(str(spw) for spw in group))
+    return groups
+
+
+def _solve_partial(kwargs: dict) -> str:
+    # Runs in a worker process, which loads casatasks on first use
+    polcal(**kwargs)
+    return kwargs["caltable"]
+
+
+def _merge_spectral_windows(partial_table: str, cal_table: str):
+    # Copies the SPECTRAL_WINDOW rows (FLAG_ROW, NUM_CHAN, CHAN_FREQ, ...) of the spws a
+    # partial table solved into the merged table, which otherwise marks them as unsolved
+    with table_pool.open(partial_table) as tb:
+        spw_ids = np.unique(tb.getcol("SPECTRAL_WINDOW_ID"))
+    partial_spectral_window = os.path.join(partial_table, "SPECTRAL_WINDOW")
+    with table_pool.open(partial_spectral_window) as partial, \
+            table_pool.open(os.path.join(cal_table, "SPECTRAL_WINDOW"), readonly=False) as merged:
+        for column in partial.colnames():
+            for spw in spw_ids:
+                cell = partial.getvarcol(column, startrow=int(spw), nrow=1)
+                merged.putvarcol(column, cell, startrow=int(spw), nrow=1)
+    table_pool.close(partial_spectral_window)
+
+
+def merge_caltables(partial_tables: list, cal_table: str) -> str:
+    # Every partial table carries the subtables copied from the MS, so the first one becomes
+    # the output; the main table rows of the others are appended to it and the rows of the
+    # spws they solved replace those of its SPECTRAL_WINDOW subtable
+    partial_tables = [table for table in partial_tables if os.path.exists(table)]
+    if not partial_tables:
+        return cal_table
+    shutil.copytree(partial_tables[0], cal_table, ignore=shutil.ignore_patterns("table.lock"))
+    for partial_table in partial_tables[1:]:
+        with table_pool.open(partial_table) as tb:
+            tb.copyrows(cal_table, startrowin=0, startrowout=-1, nrow=-1)
+        _merge_spectral_windows(partial_table, cal_table)
+    for partial_table in partial_tables:
+        table_pool.close(partial_table)
+        shutil.rmtree(partial_table)
+    return cal_table
+
+
+def _has_no_data(exception: Exception) -> bool:
+    # polcal fails with a selection error for a group of spws without data on the field
+    message = str(exception).lower()
+    return any(text in message for text in NO_DATA_MESSAGES)
+
+
+def solve_polcal_by_spw(
+    polcal_kwargs: dict, spw_ids: np.ndarray, n_groups: int, max_workers: int
+) -> str:
+    # Solves each group of spws in its own process, into <caltable>.spw<i>, and merges them
+    cal_table = polcal_kwargs["caltable"]
+    jobs = []
+    for i, spw in enumerate(spw_groups(spw_ids, n_groups)):
+        kwargs = dict(polcal_kwargs)
+        kwargs["spw"] = spw
+        kwargs["caltable"] = cal_table + ".spw" + str(i)
+        if os.path.exists(kwargs["caltable"]):
+            shutil.rmtree(kwargs["caltable"])
+        jobs.append(kwargs)
+    print("Solving {0} spw groups on {1} processes".format(len(jobs), max_workers))
+
+    # CASA is not fork-safe, so workers are spawned
+    failures = []
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = [executor.submit(_solve_partial, kwargs) for kwargs in jobs]
+        for kwargs, future in zip(jobs, futures):
+            try:
+                future.result()
+            except Exception as exception:
+                if not _has_no_data(exception):
+                    failures.append((kwargs["spw"], exception))
+                    continue
+                # A group without data leaves no table, as a single polcal call would skip it
+                print("No data to solve in spw " + kwargs["spw"] + ": " + str(exception))
+
+    if failures:
+        # A partial table would pass for a complete one, so nothing is merged
+        for kwargs in jobs:
+            if os.path.exists(kwargs["caltable"]):
+                shutil.rmtree(kwargs["caltable"])
+        spw, exception = failures[0]
+        raise RuntimeError(
+            "polcal failed for spw {0} ({1} of {2} groups failed)".format(
+                spw, len(failures), len(jobs)
+            )
+        ) from exception
+    return merge_caltables([kwargs["caltable"] for kwargs in jobs], cal_table)
@@ -1 +1,3 @@
+from .calibratorcatalog import CalibratorCatalog, build_catalog, calibrator_catalog
+from .coefficientcache import CoefficientCache, coefficient_cache
 from .polarizedsource import PolarizedSource
@@ -0,0 +1,155 @@
+import json
+import numpy as np
+import astropy.units as un
+from collections import namedtuple
+from pathlib import Path
+
+_PACKAGE_DIR = Path(__file__).parent.parent
+CATALOG_DIR = _PACKAGE_DIR / "catalog"
+CATALOG_DATA = "calibrators.npy"
+CATALOG_INDEX = "calibrators.json"
+
+# Rows of the struct-of-arrays catalog
+NU_ROW, FLUX_ROW, POL_FRACTION_ROW, POL_ANGLE_ROW = range(4)
+
+CatalogEntry = namedtuple("CatalogEntry", ["source", "nu", "flux", "pol_fraction", "pol_angle"])
+
+# Values from https://science.nrao.edu/facilities/vla/docs/manuals/obsguide/modes/pol
+# Frequencies in GHz, pol angles in degrees and pol fractions in percent
+_LEGACY_NU = [
+    1.05, 1.45, 1.64, 1.95, 2.45, 2.95, 3.25, 3.75, 4.50, 5.00, 6.50, 7.25, 8.10, 8.80, 12.8, 13.7,
+    14.6, 15.5, 18.1, 19.0, 22.4, 23.3, 36.5, 43.5
+]
+_LEGACY_SOURCES = {
+    "3C48": {
+        "pol_angle": [
+            25.0, 140.0, -5.0, -150.0, -120.0, -100.0, -92.0, -84.0, -75.0, -72.0, -68.0, -67.0,
+            -64.0, -62.0, -62.0, -62.0, -63.0, -64.0, -66.0, -67.0, -70.0, -70.0, -77.0, -85.0
+        ],
+        "pol_fraction": [
+            0.3, 0.5, 0.7, 0.9, 1.4, 2.0, 2.5, 3.2, 3.8, 4.2, 5.2, 5.2, 5.3, 5.4, 6.0, 6.1, 6.4,
+            6.4, 6.9, 7.1, 7.7, 7.8, 7.4, 7.5
+        ]
+    },
+    "3C138": {
+        "pol_angle": [
+            -14.0, -11.0, -10.0, -10.0, -9.0, -10.0, -10.0, 0.0, -11.0, -11.0, -12.0, -12.0, -10.0,
+            -8.0, -7.0, -7.0, -8.0, -9.0, -12.0, -13.0, -16.0, -17.0, -24.0, -27.0
+        ],
+        "pol_fraction": [
+            5.6, 7.5, 8.4, 9.0, 10.4, 10.7, 10.0, 0.0, 10.0, 10.4, 9.8, 10.0, 10.4, 10.1, 8.4, 7.9,
+            7.7, 7.4, 6.7, 6.5, 6.7, 6.6, 6.6, 6.5
+        ]
+    },
+    "3C286": {
+        "pol_angle": [
+            33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 34.0, 34.0,
+            34.0, 34.0, 34.0, 34.0, 34.0, 35.0, 35.0, 35.0, 36.0, 36.0
+        ],
+        "pol_fraction": [
+            8.6, 9.5, 9.9, 10.1, 10.5, 10.8, 10.9, 11.1, 11.3, 11.4, 11.6, 11.7, 11.9, 11.9, 11.9,
+            11.9, 12.1, 12.2, 12.5, 12.5, 12.6, 12.6, 13.1, 13.2
+        ]
+    },
+    "3C147": {
+        "pol_angle": [
+            0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, -100.0, 0.0, -65.0, -39.0, -24.0, -11.0, 43.0,
+            48.0, 53.0, 59.0, 67.0, 68.0, 75.0, 76.0, 85.0, 86.0
+        ],
+        "pol_fraction": [
+            0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.1, 0.3, 0.3, 0.6, 0.7, 0.8, 2.2, 2.4, 2.7,
+            2.9, 3.4, 3.5, 3.8, 3.8, 4.4, 5.2
+        ]
+    }
+}
+# Sources measured on 31Jan/01Feb 2019, stored as text tables in sources_2019
+_SOURCES_2019 = ["3C48", "3C138", "3C286", "3C147", "3C295", "3C196"]
+
+
+def _collect_sources() -> dict:
+    # Gathers every catalog entry as (source, nu [Hz], flux [Jy], pol fraction, pol angle [rad])
+    sources = {}
+    for source, values in _LEGACY_SOURCES.items():
+        pol_fraction = np.array(values["pol_fraction"]) / 100.
+        sources[source] = (
+            source, (np.array(_LEGACY_NU) * un.GHz).to_value(un.Hz), np.zeros_like(pol_fraction),
+            pol_fraction, (np.array(values["pol_angle"]) * un.deg).to_value(un.rad)
+        )
+    for source in _SOURCES_2019:
+        key = source + "_2019"
+        data = np.loadtxt(str(_PACKAGE_DIR / "sources_2019" / (key.lower() + ".txt")))
+        sources[key] = (
+            source, (data[:, 0] * un.GHz).to_value(un.Hz), data[:, 1], data[:, 2], data[:, 3]
+        )
+    return sources
+
+
+def build_catalog(output_dir: str = None) -> Path:
+    # Packs every source into one (4, n_points) float64 array plus a JSON name index holding
+    # the column range of each source
+    output_dir = CATALOG_DIR if output_dir is None else Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    index = {}
+    columns = []
+    start = 0
+    for key, (source, nu, flux, pol_fraction, pol_angle) in _collect_sources().items():
+        columns.append(np.stack([nu, flux, pol_fraction, pol_angle]))
+        index[key] = {"source": source, "start": start, "stop": start + len(nu)}
+        start += len(nu)
+
+    np.save(str(output_dir / CATALOG_DATA), np.ascontiguousarray(np.hstack(columns)))
+    with open(output_dir / CATALOG_INDEX, "w") as index_file:
+        json.dump(index, index_file, indent=2)
+    return output_dir
+
+
+class CalibratorCatalog:
+    # Read-only, memory-mapped view of the prebuilt catalog. The file is mapped on first use,
+    # so nothing is parsed; every entry is a writeable copy of its (small) slice, so sources
+    # can be edited in place without touching the mapping.
+
+    def __init__(self, catalog_dir: str = None):
+        self.catalog_dir = CATALOG_DIR if catalog_dir is None else Path(catalog_dir)
+        self._data = None
+        self._index = None
+
+    def _load(self):
+        if self._index is None:
+            with open(self.catalog_dir / CATALOG_INDEX) as index_file:
+                index = json.load(index_file)
+            self._data = np.load(str(self.catalog_dir / CATALOG_DATA), mmap_mode="r")
+            self._index = index
+
+    @property
+    def data(self) -> np.ndarray:
+        self._load()
+        return self._data
+
+    def names(self) -> list:
+        self._load()
+        return list(self._index.keys())
+
+    def __contains__(self, name) -> bool:
+        self._load()
+        return name in self._index
+
+    def __getitem__(self, name: str) -> CatalogEntry:
+        self._load()
+        if name not in self._index:
+            raise KeyError("Source " + str(name) + " is not in the calibrator catalog")
+        entry = self._index[name]
+        columns = np.array(self._data[:, entry["start"]:entry["stop"]])
+        return CatalogEntry(
+            source=entry["source"],
+            nu=un.Quantity(columns[NU_ROW], un.Hz, copy=False),
+            flux=un.Quantity(columns[FLUX_ROW], un.Jy, copy=False),
+            pol_fraction=columns[POL_FRACTION_ROW],
+            pol_angle=un.Quantity(columns[POL_ANGLE_ROW], un.rad, copy=False)
+        )
+
+
+calibrator_catalog = CalibratorCatalog()
+
+if __name__ == "__main__":
+    print("Catalog written to {0}".format(build_catalog()))
@@ -0,0 +1,173 @@
+import io
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Tuple
+from ..utils import LazyObject, table_pool
+
+ctsys = LazyObject("casatools", "ctsys")
+
+# Flux-density standards and their coefficient tables under nrao/VLA/standards/
+STANDARD_TABLES = {
+    'Perley-Butler 2013': 'PerleyButler2013Coeffs',
+    'Perley-Butler 2017': 'PerleyButler2017Coeffs',
+    'Scaife-Heald 2012': 'ScaifeHeald2012Coeffs'
+}
+
+
+def _default_cache_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "ocarina", "coefficients")
+
+
+@dataclass(init=True, repr=True)
+class CoefficientCache:
+    # In-memory LRU over (standard, epoch, source, table stamp) backed by one .npz file per
+    # (standard, epoch, table stamp). A hit never touches casatools; a miss reads every
+    # source of the standard and epoch in a single table scan.
+    cache_dir: str = None
+    max_entries: int = 512
+    standards_dir: str = None
+    _entries: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.cache_dir is None:
+            self.cache_dir = _default_cache_dir()
+
+    def get_standards_dir(self) -> str:
+        # The resolved standards directory is remembered on disk so later processes do not
+        # need ctsys to find it again
+        if self.standards_dir is None:
+            index_file = Path(self.cache_dir) / "standards_dir"
+            if index_file.exists() and os.path.isdir(index_file.read_text().strip()):
+                self.standards_dir = index_file.read_text().strip()
+            else:
+                self.standards_dir = ctsys.resolve("nrao/VLA/standards/")
+                self._write_file(index_file, self.standards_dir.encode())
+        return self.standards_dir
+
+    def get_table_name(self, standard: str) -> str:
+        if standard not in STANDARD_TABLES:
+            raise ValueError("Unknown flux-density standard: " + standard)
+        return os.path.join(self.get_standards_dir(), STANDARD_TABLES[standard])
+
+    @staticmethod
+    def get_table_stamp(table_name: str) -> int:
+        table_file = os.path.join(table_name, "table.dat")
+        if not os.path.exists(table_file):
+            table_file = table_name
+        return os.stat(table_file).st_mtime_ns
+
+    def _disk_file(self, standard: str, epoch: str, stamp: int) -> Path:
+        file_name = "{0}_{1}_{2}.npz".format(STANDARD_TABLES[standard], epoch, stamp)
+        return Path(self.cache_dir) / file_name
+
+    @staticmethod
+    def _write_file(file_name: Path, content: bytes):
+        file_name.parent.mkdir(parents=True, exist_ok=True)
+        temporary_file = file_name.with_name(file_name.name + ".{0}.tmp".format(os.getpid()))
+        temporary_file.write_bytes(content)
+        os.replace(temporary_file, file_name)
+
+    def _store(self, standard: str, epoch: str, stamp: int, columns: dict):
+        # The LRU always holds at least the table just read, so get finds every source of it
+        max_entries = max(self.max_entries, len(columns))
+        with self._lock:
+            for source, entry in columns.items():
+                key = (standard, epoch, source, stamp)
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def _read_disk(self, standard: str, epoch: str, stamp: int) -> dict:
+        disk_file = self._disk_file(standard, epoch, stamp)
+        if not disk_file.exists():
+            return {}
+        with np.load(str(disk_file)) as data:
+            sources = {name[:-len("_coeffs")] for name in data.files if name.endswith("_coeffs")}
+            return {
+                source: (data[source + "_coeffs"], data[source + "_coefferrs"])
+                for source in sources
+            }
+
+    def _write_disk(self, standard: str, epoch: str, stamp: int, columns: dict):
+        disk_file = self._disk_file(standard, epoch, stamp)
+        # Entries for older versions of the same table are stale; another process may have
+        # removed them already. The current one may be being read by another process, and is
+        # replaced atomically below.
+        for old_file in disk_file.parent.glob(
+            "{0}_{1}_*.npz".format(STANDARD_TABLES[standard], epoch)
+        ):
+            if old_file != disk_file:
+                old_file.unlink(missing_ok=True)
+        arrays = {}
+        for source, (coefficients, coefficients_errors) in columns.items():
+            arrays[source + "_coeffs"] = coefficients
+            arrays[source + "_coefferrs"] = coefficients_errors
+        content = io.BytesIO()
+        np.savez(content, **arrays)
+        self._write_file(disk_file, content.getvalue())
+
+    def prefetch(self, standard: str = "Perley-Butler 2017", epoch: str = "2017") -> list:
+        # Reads the coefficients of every source of a standard and epoch in one table scan
+        epoch = str(epoch)
+        table_name = self.get_table_name(standard)
+        stamp = self.get_table_stamp(table_name)
+
+        columns = self._read_disk(standard, epoch, stamp)
+        if not columns:
+            with table_pool.open(table_name) as tb:
+                _query_table = tb.taql("select * from " + table_name + " where Epoch=" + epoch)
+            try:
+                if _query_table.nrows() == 0:
+                    raise ValueError("The selected epoch does not have any data")
+                for column in _query_table.colnames():
+                    if column.endswith("_coeffs"):
+                        source = column[:-len("_coeffs")]
+                        columns[source] = (
+                            _query_table.getcol(column).flatten(),
+                            _query_table.getcol(source + "_coefferrs").flatten()
+                        )
+            finally:
+                _query_table.close()
+            self._write_disk(standard, epoch, stamp, columns)
+
+        self._store(standard, epoch, stamp, columns)
+        return sorted(columns.keys())
+
+    def get(self,
+            source: str,
+            standard: str = "Perley-Butler 2017",
+            epoch: str = "2017") -> Tuple[np.ndarray, np.ndarray]:
+        epoch = str(epoch)
+        stamp = self.get_table_stamp(self.get_table_name(standard))
+        key = (standard, epoch, source, stamp)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            self.prefetch(standard, epoch)
+            with self._lock:
+                entry = self._entries.get(key)
+        if entry is None:
+            raise ValueError("Source " + source + " is not in the " + standard + " table")
+        coefficients, coefficients_errors = entry
+        if coefficients.size == 0 or coefficients_errors.size == 0:
+            raise ValueError("The selected epoch does not have any data")
+        return coefficients.copy(), coefficients_errors.copy()
+
+    def clear(self, disk: bool = False):
+        with self._lock:
+            self._entries.clear()
+        if disk:
+            for cache_file in Path(self.cache_dir).glob("*.npz"):
+                cache_file.unlink()
+
+
+coefficient_cache = CoefficientCache()
@@ -1,15 +1,19 @@
 import numpy as np
-from casatools import table
 from dataclasses import dataclass, field
-from pathlib import Path
 import astropy.units as un
+from math import comb
 from typing import Union
 from astropy.units import Quantity
 from abc import ABCMeta
-from casatools import ctsys
-from ..functions import FluxFunction, PolFunction
+from ..functions import (
+    PERCENTILES, StokesModel, StokesUncertainty, fit_flux_functions, fit_pol_functions, horner,
+    monte_carlo_flux, monte_carlo_stokes
+)
+from ..utils import LazyObject, query_table
+from .calibratorcatalog import calibrator_catalog
+from .coefficientcache import STANDARD_TABLES, coefficient_cache
 
-tb = table()
+ctsys = LazyObject("casatools", "ctsys")
 
 
 @dataclass(init=True, repr=True)
@@ -26,30 +30,15 @@ class PolarizedSource(metaclass=ABCMeta):
     spix_dict: dict = field(default_factory=dict)
 
     def __post_init__(self):
-        self.spix_dict = {
-            'Perley-Butler 2013': 'PerleyButler2013Coeffs',
-            'Perley-Butler 2017': 'PerleyButler2017Coeffs',
-            'Scaife-Heald 2012': 'ScaifeHeald2012Coeffs'
-        }
-        switcher = {
-            "3C48": "p3c48",
-            "3C48_2019": "p3c48_2019",
-            "3C138": "p3c138",
-            "3C138_2019": "p3c138_2019",
-            "3C286": "p3c286",
-            "3C286_2019": "p3c286_2019",
-            "3C147": "p3c147",
-            "3C147_2019": "p3c147_2019",
-            "3C295_2019": "p3c295_2019",
-            "3C196_2019": "p3c196_2019"
-        }
-
+        self.spix_dict = dict(STANDARD_TABLES)
         if self.source is not None:
             self.source = self.source.upper()
 
         if self.source != "":
-            method = getattr(self, switcher.get(self.source, "init_empty"))
-            method()
+            if self.source in calibrator_catalog:
+                self.load_from_catalog(self.source)
+            else:
+                self.init_empty()
 
         # convert frequencies to Hz
         self.nu = self.nu.to(un.Hz)
@@ -57,123 +46,43 @@ class PolarizedSource(metaclass=ABCMeta):
         # Pol angle from degrees to radians
         self.pol_angle = self.pol_angle.to(un.rad)
 
-    def p3c48(self):
-        self.nu = np.array(
-            [
-                1.05, 1.45, 1.64, 1.95, 2.45, 2.95, 3.25, 3.75, 4.50, 5.00, 6.50, 7.25, 8.10, 8.80,
-                12.8, 13.7, 14.6, 15.5, 18.1, 19.0, 22.4, 23.3, 36.5, 43.5
-            ]
-        ) * un.GHz
-        self.pol_angle = np.array(
-            [
-                25.0, 140.0, -5.0, -150.0, -120.0, -100.0, -92.0, -84.0, -75.0, -72.0, -68.0, -67.0,
-                -64.0, -62.0, -62.0, -62.0, -63.0, -64.0, -66.0, -67.0, -70.0, -70.0, -77.0, -85.0
-            ]
-        ) * un.deg
-        self.pol_fraction = np.array(
-            [
-                0.3, 0.5, 0.7, 0.9, 1.4, 2.0, 2.5, 3.2, 3.8, 4.2, 5.2, 5.2, 5.3, 5.4, 6.0, 6.1, 6.4,
-                6.4, 6.9, 7.1, 7.7, 7.8, 7.4, 7.5
-            ]
-        ) / 100.
+    def load_from_catalog(self, name: str):
+        entry = calibrator_catalog[name]
+        self.nu = entry.nu
+        self.flux = entry.flux
+        self.pol_fraction = entry.pol_fraction
+        self.pol_angle = entry.pol_angle
+        self.source = entry.source
 
-        self.flux = np.zeros_like(self.pol_fraction) * un.Jy
+    def p3c48(self):
+        self.load_from_catalog("3C48")
 
     def p3c48_2019(self):
-        self.__read_source_from_txt()
-        self.source = "3C48"
+        self.load_from_catalog("3C48_2019")
 
     def p3c138(self):
-        self.nu = np.array(
-            [
-                1.05, 1.45, 1.64, 1.95, 2.45, 2.95, 3.25, 3.75, 4.50, 5.00, 6.50, 7.25, 8.10, 8.80,
-                12.8, 13.7, 14.6, 15.5, 18.1, 19.0, 22.4, 23.3, 36.5, 43.5
-            ]
-        ) * un.GHz
-        self.pol_angle = np.array(
-            [
-                -14.0, -11.0, -10.0, -10.0, -9.0, -10.0, -10.0, 0.0, -11.0, -11.0, -12.0, -12.0,
-                -10.0, -8.0, -7.0, -7.0, -8.0, -9.0, -12.0, -13.0, -16.0, -17.0, -24.0, -27.0
-            ]
-        ) * un.deg
-        self.pol_fraction = np.array(
-            [
-                5.6, 7.5, 8.4, 9.0, 10.4, 10.7, 10.0, 0.0, 10.0, 10.4, 9.8, 10.0, 10.4, 10.1, 8.4,
-                7.9, 7.7, 7.4, 6.7, 6.5, 6.7, 6.6, 6.6, 6.5
-            ]
-        ) / 100.
-        self.flux = np.zeros_like(self.pol_fraction) * un.Jy
+        self.load_from_catalog("3C138")
 
     def p3c138_2019(self):
-        self.__read_source_from_txt()
-        self.source = "3C138"
+        self.load_from_catalog("3C138_2019")
 
     def p3c286(self):
-        self.nu = np.array(
-            [
-                1.05, 1.45, 1.64, 1.95, 2.45, 2.95, 3.25, 3.75, 4.50, 5.00, 6.50, 7.25, 8.10, 8.80,
-                12.8, 13.7, 14.6, 15.5, 18.1, 19.0, 22.4, 23.3, 36.5, 43.5
-            ]
-        ) * un.GHz
-        self.pol_angle = np.array(
-            [
-                33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 33.0, 34.0, 34.0,
-                34.0, 34.0, 34.0, 34.0, 34.0, 35.0, 35.0, 35.0, 36.0, 36.0
-            ]
-        ) * un.deg
-        self.pol_fraction = np.array(
-            [
-                8.6, 9.5, 9.9, 10.1, 10.5, 10.8, 10.9, 11.1, 11.3, 11.4, 11.6, 11.7, 11.9, 11.9,
-                11.9, 11.9, 12.1, 12.2, 12.5, 12.5, 12.6, 12.6, 13.1, 13.2
-            ]
-        ) / 100.
-        self.flux = np.zeros_like(self.pol_fraction) * un.Jy
+        self.load_from_catalog("3C286")
 
     def p3c286_2019(self):
-        self.__read_source_from_txt()
-        self.source = "3C286"
+        self.load_from_catalog("3C286_2019")
 
     def p3c147(self):
-        self.nu = np.array(
-            [
-                1.05, 1.45, 1.64, 1.95, 2.45, 2.95, 3.25, 3.75, 4.50, 5.00, 6.50, 7.25, 8.10, 8.80,
-                12.8, 13.7, 14.6, 15.5, 18.1, 19.0, 22.4, 23.3, 36.5, 43.5
-            ]
-        ) * un.GHz
-        self.pol_angle = np.array(
-            [
-                0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, -100.0, 0.0, -65.0, -39.0, -24.0, -11.0,
-                43.0, 48.0, 53.0, 59.0, 67.0, 68.0, 75.0, 76.0, 85.0, 86.0
-            ]
-        ) * un.deg
-        self.pol_fraction = np.array(
-            [
-                0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.1, 0.3, 0.3, 0.6, 0.7, 0.8, 2.2, 2.4, 2.7,
-                2.9, 3.4, 3.5, 3.8, 3.8, 4.4, 5.2
-            ]
-        ) / 100.
-        self.flux = np.zeros_like(self.pol_fraction) * un.Jy
+        self.load_from_catalog("3C147")
 
     def p3c147_2019(self):
-        self.__read_source_from_txt()
-        self.source = "3C147"
+        self.load_from_catalog("3C147_2019")
 
     def p3c196_2019(self):
-        self.__read_source_from_txt()
-        self.source = "3C196"
+        self.load_from_catalog("3C196_2019")
 
     def p3c295_2019(self):
-        self.__read_source_from_txt()
-        self.source = "3C295"
-
-    def __read_source_from_txt(self):
-        path_txt_files = Path(__file__).parent.parent / "sources_2019"
-        file_name = path_txt_files / (self.source.lower() + ".txt")
-        data = np.loadtxt(str(file_name))
-        self.nu = data[:, 0] * un.GHz
-        self.flux = data[:, 1] * un.Jy
-        self.pol_fraction = data[:, 2]
-        self.pol_angle = data[:, 3] * un.rad
+        self.load_from_catalog("3C295_2019")
 
     def init_empty(self):
         self.nu = np.array([]) * un.GHz
@@ -203,10 +112,7 @@ class PolarizedSource(metaclass=ABCMeta):
         if isinstance(nu, Quantity):
             nu = nu.to(un.GHz).value
 
-        index = np.arange(0, len(coefficients))
-        flux_at_nu = np.sum(coefficients * np.log10(nu)**index)
-
-        return 10.0**flux_at_nu
+        return float(10.0**horner(np.log10(nu), coefficients))
 
     @staticmethod
     def flux_giving_coefficients(
@@ -215,12 +121,7 @@ class PolarizedSource(metaclass=ABCMeta):
         # To use this formula frequency nu must be in GHz
         if isinstance(nu, Quantity):
             nu = nu.to(un.GHz).value
-        flux_at_nu = np.zeros_like(nu, dtype=np.float32)
-
-        for i, coefficient in enumerate(coefficients):
-            flux_at_nu += coefficient * np.log10(nu)**i
-
-        return 10.0**flux_at_nu
+        return 10.0**horner(np.log10(nu), coefficients)
 
     def get_flux_scalar(self, nu: Union[float, Quantity]) -> float:
         return self.flux_scalar_giving_coefficients(nu, self.spectral_idx_coefficients)
@@ -228,18 +129,28 @@ class PolarizedSource(metaclass=ABCMeta):
     def get_flux(self, nu: Union[np.ndarray, Quantity]) -> np.ndarray:
         return self.flux_giving_coefficients(nu, self.spectral_idx_coefficients)
 
-    def get_coefficients_from_table(self, standard="Perley-Butler 2017", epoch="2017"):
+    def get_coefficients_from_table(
+        self, standard="Perley-Butler 2017", epoch="2017", use_cache: bool = True
+    ):
+        if use_cache:
+            coefficients, coefficients_errs = coefficient_cache.get(self.source, standard, epoch)
+            self.spectral_idx_coefficients = coefficients
+            self.spectral_idx_coefficients_errors = coefficients_errs
+            return coefficients
+
         coefficients_table = ctsys.resolve("nrao/VLA/standards/") + self.spix_dict[standard]
-        tb.open(coefficients_table)
-        _query_table = tb.taql("select * from " + coefficients_table + " where Epoch=" + epoch)
+        _query_table = query_table(
+            query="select * from " + coefficients_table + " where Epoch=" + str(epoch),
+            table_name=coefficients_table
+        )
         coefficients = _query_table.getcol(self.source + "_coeffs").flatten()
         coefficients_errs = _query_table.getcol(self.source + "_coefferrs").flatten()
+        _query_table.close()
         if coefficients.size == 0 or coefficients_errs.size == 0:
             raise ValueError("The selected epoch does not have any data")
 
         self.spectral_idx_coefficients = coefficients
         self.spectral_idx_coefficients_errors = coefficients_errs
-        tb.close()
         return coefficients
 
     def get_coefficients_from_flux(self, nu: Quantity, nu_0: Quantity = None):
@@ -248,28 +159,40 @@ class PolarizedSource(metaclass=ABCMeta):
 
         nearest_nu_0_index = np.argmin(np.abs(nu - nu_0))
         flux_0 = self.flux[nearest_nu_0_index]
-        initial_coefficients = np.random.rand(2)
-        source_func_frac = FluxFunction(flux_0=flux_0, xdata=nu, x_0=nu_0)
-        source_func_frac.fit(nu, self.flux.value, initial_coefficients)
-        return source_func_frac.coefficients, source_func_frac.coefficients_errors
+        return fit_flux_functions(nu, self.flux.value, nu_0, flux_0)
 
-    def fit_alpha_and_beta(self, nu: Quantity, nu_0: Quantity = None):
+    def fit_alpha_and_beta(self, nu: Quantity, nu_0: Quantity = None, n_draws: int = 0):
+        # The fit is weighted by the flux errors: half the spread of the +-error coefficients by
+        # default, or the standard deviation over n_draws Monte Carlo realizations (slower)
         if nu_0 is None:
             nu_0 = (np.max(nu) + np.min(nu)) / 2.
         flux_0 = self.get_flux_scalar(nu_0)
         fluxes = self.get_flux(nu)
-        upper_bound = self.spectral_idx_coefficients + self.spectral_idx_coefficients_errors
-        lower_bound = self.spectral_idx_coefficients - self.spectral_idx_coefficients_errors
-        fluxes_upper_bound = self.flux_giving_coefficients(nu, upper_bound)
-        fluxes_lower_bound = self.flux_giving_coefficients(nu, lower_bound)
-        error_sigma = 0.5 * (fluxes_upper_bound - fluxes_lower_bound)
+        if n_draws > 1:
+            # Spread of the fluxes over realizations of the independently tabulated errors,
+            # seeded so the fit is reproducible
+            realizations = monte_carlo_flux(
+                nu,
+                self.spectral_idx_coefficients,
+                errors=self.spectral_idx_coefficients_errors,
+                n_draws=n_draws,
+                seed=0
+            )
+            error_sigma = np.std(realizations, axis=0, ddof=1)
+        else:
+            # Half the range between all coefficients shifted up and all shifted down
+            upper_bound = self.spectral_idx_coefficients + self.spectral_idx_coefficients_errors
+            lower_bound = self.spectral_idx_coefficients - self.spectral_idx_coefficients_errors
+            fluxes_upper_bound = self.flux_giving_coefficients(nu, upper_bound)
+            fluxes_lower_bound = self.flux_giving_coefficients(nu, lower_bound)
+            error_sigma = 0.5 * (fluxes_upper_bound - fluxes_lower_bound)
         if np.sum(error_sigma) == 0.0:
             error_sigma = None
 
-        initial_coefficients = np.random.rand(2)
-        source_func_frac = FluxFunction(flux_0=flux_0, xdata=nu, x_0=nu_0)
-        source_func_frac.fit(nu, fluxes, initial_coefficients, sigma=error_sigma)
-        return source_func_frac.coefficients, source_func_frac.coefficients_errors
+        return fit_flux_functions(nu, fluxes, nu_0, flux_0, sigma=error_sigma)
+
+    def _frequency_mask(self, nu_min: [float, Quantity] = 0.0, nu_max: [float, Quantity] = np.inf):
+        return (self.nu >= nu_min) & (self.nu <= nu_max)
 
     # Returns pol fraction coeffs
     def get_pol_fraction_coefficients(
@@ -277,16 +200,21 @@ class PolarizedSource(metaclass=ABCMeta):
         n_terms: int = 3,
         nu_0: [float, Quantity] = None,
         nu_min: [float, Quantity] = 0.0,
-        nu_max: [float, Quantity] = np.inf
+        nu_max: [float, Quantity] = np.inf,
+        return_covariance: bool = False
     ):
-        nu, pol_frac = self.filter(self.nu, self.pol_fraction, nu_min, nu_max)
+        mask = self._frequency_mask(nu_min, nu_max)
 
         if nu_0 is None:
-            nu_0 = (np.max(nu) + np.min(nu)) / 2.
-        initial_pol_fraction_coefficients = np.random.uniform(0.0, 1.0, n_terms)
-        source_func_frac = PolFunction(x_0=nu_0, n_terms=n_terms)
-        source_func_frac.fit(nu, pol_frac, initial_pol_fraction_coefficients)
-        return source_func_frac.coefficients, source_func_frac.coefficients_errors
+            nu_0 = (np.max(self.nu[mask]) + np.min(self.nu[mask])) / 2.
+        return fit_pol_functions(
+            self.nu,
+            self.pol_fraction,
+            nu_0,
+            n_terms=n_terms,
+            mask=mask,
+            return_covariance=return_covariance
+        )
 
     # Returns pol angle coefficients in radians
     def get_pol_angle_coefficients(
@@ -294,21 +222,71 @@ class PolarizedSource(metaclass=ABCMeta):
         n_terms: int = 3,
         nu_0: [float, Quantity] = None,
         nu_min: [float, Quantity] = 0.0,
-        nu_max: [float, Quantity] = np.inf
+        nu_max: [float, Quantity] = np.inf,
+        return_covariance: bool = False
     ):
-        nu, pol_angle = self.filter(self.nu, self.pol_angle, nu_min, nu_max)
+        mask = self._frequency_mask(nu_min, nu_max)
 
         if nu_0 is None:
-            nu_0 = (np.max(nu) + np.min(nu)) / 2.
-        initial_pol_angle_coefficients = np.random.uniform(-np.pi, np.pi, n_terms)
-        source_func_angle = PolFunction(x_0=nu_0, n_terms=n_terms)
-        source_func_angle.fit(nu, pol_angle, initial_pol_angle_coefficients)
-        return source_func_angle.coefficients, source_func_angle.coefficients_errors
+            nu_0 = (np.max(self.nu[mask]) + np.min(self.nu[mask])) / 2.
+        return fit_pol_functions(
+            self.nu,
+            self.pol_angle,
+            nu_0,
+            n_terms=n_terms,
+            mask=mask,
+            return_covariance=return_covariance
+        )
+
+    @staticmethod
+    def reexpand_coefficients(
+        coefficients: np.ndarray,
+        coefficients_errors: np.ndarray = None,
+        nu_0: Union[float, Quantity] = 1.0,
+        return_covariance: bool = False
+    ):
+        # Rewrites log10 S = sum_k c_k log10(nu)^k (nu in GHz) as sum_j d_j log10(nu / nu_0)^j.
+        # With y = log10(nu / nu_0) and L = log10(nu_0), (y + L)^k expands binomially, so
+        # d_j = sum_{k >= j} C(k, j) L^(k - j) c_k. The map is linear and exact, so the
+        # (independent) tabulated errors propagate through it without approximation.
+        if isinstance(nu_0, Quantity):
+            nu_0 = nu_0.to(un.GHz).value
+        coefficients = np.asarray(coefficients, dtype=np.float64)
+        n_terms = len(coefficients)
+        log_nu_0 = np.log10(nu_0)
+
+        transform = np.array(
+            [
+                [comb(k, j) * log_nu_0**(k - j) if k >= j else 0.0 for k in range(n_terms)]
+                for j in range(n_terms)
+            ]
+        )
+
+        reexpanded = transform @ coefficients
+        if coefficients_errors is None:
+            return reexpanded, None
+        coefficients_errors = np.asarray(coefficients_errors, dtype=np.float64)
+        covariance = (transform * coefficients_errors**2) @ transform.T
+        if return_covariance:
+            return reexpanded, covariance
+        return reexpanded, np.sqrt(np.diag(covariance))
 
     def get_known_source_information(
-        self, nu_0: Quantity = 0.0, standard: str = "Perley-Butler 2017", epoch: str = "2017"
+        self,
+        nu_0: Quantity = 0.0,
+        standard: str = "Perley-Butler 2017",
+        epoch: str = "2017",
+        analytic: bool = True
     ):
         self.get_coefficients_from_table(standard=standard, epoch=epoch)
+        if analytic:
+            # d_0 is log10 of the intensity at nu_0, d_1 alpha, d_2 beta and so on
+            coefficients, coefficients_errors = self.reexpand_coefficients(
+                self.spectral_idx_coefficients, self.spectral_idx_coefficients_errors, nu_0
+            )
+            intensity = 10.0**coefficients[0]
+            return intensity, coefficients[1:], coefficients_errors[1:]
+
         nu_fit = np.linspace(0.3275, 50.0, 40) * un.GHz
         spec_idx, spec_idx_err = self.fit_alpha_and_beta(nu_fit, nu_0=nu_0)
         intensity = self.get_flux_scalar(nu_0)
@@ -332,3 +310,95 @@ class PolarizedSource(metaclass=ABCMeta):
         )
         return pol_angle_coefficients, pol_angle_coefficients_errors, pol_fraction_coefficients, \
             pol_fraction_coefficients_errors
+
+    def get_stokes_model(
+        self,
+        nu_0: Quantity = 0.0,
+        standard: str = "Perley-Butler 2017",
+        epoch: str = "2017",
+        n_terms_angle: int = 3,
+        n_terms_frac: int = 3,
+        nu_min_frac=0.0,
+        nu_max_frac=np.inf,
+        nu_min_angle=0.0,
+        nu_max_angle=np.inf
+    ) -> StokesModel:
+        # The model set_known_model gives setjy, to evaluate it on every channel directly
+        intensity, spec_idx, _ = self.get_known_source_information(
+            nu_0=nu_0, standard=standard, epoch=epoch
+        )
+        pol_angle_coefficients, _, pol_fraction_coefficients, _ = \
+            self.get_source_polarization_information(
+                n_terms_angle=n_terms_angle,
+                n_terms_frac=n_terms_frac,
+                nu_0=nu_0,
+                nu_min_frac=nu_min_frac,
+                nu_max_frac=nu_max_frac,
+                nu_min_angle=nu_min_angle,
+                nu_max_angle=nu_max_angle
+            )
+        return StokesModel(
+            nu_0=nu_0,
+            intensity=intensity,
+            spectral_index=spec_idx,
+            pol_fraction=pol_fraction_coefficients,
+            pol_angle=pol_angle_coefficients
+        )
+
+    def get_model_uncertainty(
+        self,
+        nu: Union[np.ndarray, Quantity],
+        nu_0: Quantity = 0.0,
+        standard: str = "Perley-Butler 2017",
+        epoch: str = "2017",
+        n_terms_angle: int = 3,
+        n_terms_frac: int = 3,
+        nu_min_frac=0.0,
+        nu_max_frac=np.inf,
+        nu_min_angle=0.0,
+        nu_max_angle=np.inf,
+        n_draws: int = 4000,
+        percentiles: tuple = PERCENTILES,
+        seed: int = None
+    ) -> StokesUncertainty:
+        # Monte Carlo spread of the get_stokes_model model at nu. The spectral coefficients are
+        # drawn from the tabulated errors and the polarization ones from the covariance of their
+        # fits to the catalog values
+        self.get_coefficients_from_table(standard=standard, epoch=epoch)
+        log_flux, log_flux_covariance = self.reexpand_coefficients(
+            self.spectral_idx_coefficients,
+            self.spectral_idx_coefficients_errors,
+            nu_0,
+            return_covariance=True
+        )
+        pol_fraction, _, pol_fraction_covariance = self.get_pol_fraction_coefficients(
+            n_terms=n_terms_frac,
+            nu_0=nu_0,
+            nu_min=nu_min_frac,
+            nu_max=nu_max_frac,
+            return_covariance=True
+        )
+        pol_angle, _, pol_angle_covariance = self.get_pol_angle_coefficients(
+            n_terms=n_terms_angle,
+            nu_0=nu_0,
+            nu_min=nu_min_angle,
+            nu_max=nu_max_angle,
+            return_covariance=True
+        )
+        model = StokesModel(
+            nu_0=nu_0,
+            intensity=10.0**log_flux[0],
+            spectral_index=log_flux[1:],
+            pol_fraction=pol_fraction,
+            pol_angle=pol_angle
+        )
+        return monte_carlo_stokes(
+            model,
+            nu,
+            spectral_covariance=log_flux_covariance,
+            pol_fraction_covariance=pol_fraction_covariance,
+            pol_angle_covariance=pol_angle_covariance,
+            n_draws=n_draws,
+            percentiles=percentiles,
+            seed=seed
+        )
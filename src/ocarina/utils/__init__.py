@@ -1 +1,6 @@
+from .lazy import LazyObject
+from .tablepool import TablePool, table_pool
+from .querycache import QueryCache, QueryResult, query_cache
 from .utils import query_table
+from .msmetadata import MSMetadata
+from .tracing import Tracer, current_tracer, traced
@@ -0,0 +1,52 @@
+import importlib
+
+
+class LazyObject:
+    # Stands in for module_name.attribute and only imports the module the first time the
+    # object is called or one of its attributes is used. With instantiate=True the attribute
+    # is called once without arguments (e.g. casatools.table) and the instance is proxied.
+    # CASA modules take seconds to import, so ocarina keeps them behind these proxies.
+    # Only underscore names are defined here, so they never shadow proxied attributes
+    # (e.g. ctsys.resolve).
+
+    def __init__(self, module_name: str, attribute: str, instantiate: bool = False):
+        object.__setattr__(self, "_module_name", module_name)
+        object.__setattr__(self, "_attribute", attribute)
+        object.__setattr__(self, "_instantiate", instantiate)
+        object.__setattr__(self, "_target", None)
+
+    def _resolve(self):
+        if self._target is None:
+            target = getattr(importlib.import_module(self._module_name), self._attribute)
+            if self._instantiate:
+                target = target()
+            object.__setattr__(self, "_target", target)
+        return self._target
+
+    def _is_loaded(self) -> bool:
+        return self._target is not None
+
+    def __call__(self, *args, **kwargs):
+        # Imported here, since tracing reads tables through LazyObject proxies itself
+        from .tracing import TRACED_MODULES, current_tracer
+        tracer = current_tracer()
+        if tracer is None or self._module_name not in TRACED_MODULES:
+            return self._resolve()(*args, **kwargs)
+        return tracer.trace_call(self._attribute, self._resolve(), args, kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __reduce__(self):
+        # Pickles as a fresh proxy so it can be shipped to worker processes unresolved
+        return LazyObject, (self._module_name, self._attribute, self._instantiate)
+
+    def __repr__(self):
+        return "LazyObject({0}.{1}, loaded={2})".format(
+            self._module_name, self._attribute, self._is_loaded()
+        )
@@ -0,0 +1,169 @@
+import os
+import zipfile
+import numpy as np
+from dataclasses import dataclass, field, fields
+from .tablepool import table_pool, table_stamp
+
+# Subtables read by MSMetadata; their modification stamps validate a persisted snapshot
+METADATA_SUBTABLES = ("SPECTRAL_WINDOW", "FIELD", "ANTENNA", "POLARIZATION", "DATA_DESCRIPTION")
+
+
+def _read_subtable(vis_name: str, subtable: str, columns: list, var_columns: list = ()) -> dict:
+    with table_pool.open(os.path.join(vis_name, subtable)) as tb:
+        values = {column: tb.getcol(column) for column in columns}
+        for column in var_columns:
+            # Rows can have different shapes (e.g. spws with different channel counts)
+            var_column = tb.getvarcol(column)
+            values[column] = [
+                var_column[key][..., 0] for key in sorted(var_column, key=lambda k: int(k[1:]))
+            ]
+    # Subtables are read once per snapshot, so their handles are released for CASA tasks
+    table_pool.close(os.path.join(vis_name, subtable))
+    return values
+
+
+@dataclass(init=True, repr=True)
+class MSMetadata:
+    # Snapshot of the measurement set subtables needed during calibration, read once in bulk
+    # and kept as flat numpy arrays. Per-spw channel frequencies are concatenated, with
+    # chan_offsets[i]:chan_offsets[i + 1] selecting spw i; likewise for correlation types.
+    vis_name: str = ""
+    spw_names: np.ndarray = None
+    spw_num_chan: np.ndarray = None
+    spw_ref_frequency: np.ndarray = None
+    spw_flag_row: np.ndarray = None
+    chan_freq: np.ndarray = None
+    chan_offsets: np.ndarray = None
+    field_names: np.ndarray = None
+    antenna_names: np.ndarray = None
+    pol_num_corr: np.ndarray = None
+    corr_type: np.ndarray = None
+    corr_offsets: np.ndarray = None
+    dd_spw_ids: np.ndarray = None
+    dd_pol_ids: np.ndarray = None
+    stamps: np.ndarray = None
+    _field_index: dict = field(default=None, init=False, repr=False)
+    _antenna_index: dict = field(default=None, init=False, repr=False)
+
+    @staticmethod
+    def snapshot_file(vis_name: str) -> str:
+        return vis_name.rstrip("/") + ".ocarina_metadata.npz"
+
+    @staticmethod
+    def get_stamps(vis_name: str) -> np.ndarray:
+        return np.array(
+            [table_stamp(os.path.join(vis_name, subtable)) for subtable in METADATA_SUBTABLES],
+            dtype=np.int64
+        )
+
+    @classmethod
+    def read(cls, vis_name: str):
+        stamps = cls.get_stamps(vis_name)
+        spw = _read_subtable(
+            vis_name, "SPECTRAL_WINDOW", ["NAME", "NUM_CHAN", "REF_FREQUENCY", "FLAG_ROW"],
+            ["CHAN_FREQ"]
+        )
+        field_table = _read_subtable(vis_name, "FIELD", ["NAME"])
+        antenna = _read_subtable(vis_name, "ANTENNA", ["NAME"])
+        polarization = _read_subtable(vis_name, "POLARIZATION", ["NUM_CORR"], ["CORR_TYPE"])
+        data_description = _read_subtable(
+            vis_name, "DATA_DESCRIPTION", ["SPECTRAL_WINDOW_ID", "POLARIZATION_ID"]
+        )
+
+        chan_freq = spw["CHAN_FREQ"]
+        corr_type = polarization["CORR_TYPE"]
+        return cls(
+            vis_name=vis_name,
+            spw_names=np.asarray(spw["NAME"], dtype=str),
+            spw_num_chan=np.asarray(spw["NUM_CHAN"], dtype=np.int64),
+            spw_ref_frequency=np.asarray(spw["REF_FREQUENCY"], dtype=np.float64),
+            spw_flag_row=np.asarray(spw["FLAG_ROW"], dtype=bool),
+            chan_freq=np.concatenate(chan_freq).astype(np.float64),
+            chan_offsets=np.cumsum([0] + [len(freqs) for freqs in chan_freq]),
+            field_names=np.asarray(field_table["NAME"], dtype=str),
+            antenna_names=np.asarray(antenna["NAME"], dtype=str),
+            pol_num_corr=np.asarray(polarization["NUM_CORR"], dtype=np.int64),
+            corr_type=np.concatenate(corr_type).astype(np.int64),
+            corr_offsets=np.cumsum([0] + [len(types) for types in corr_type]),
+            dd_spw_ids=np.asarray(data_description["SPECTRAL_WINDOW_ID"], dtype=np.int64),
+            dd_pol_ids=np.asarray(data_description["POLARIZATION_ID"], dtype=np.int64),
+            stamps=stamps
+        )
+
+    @classmethod
+    def load(cls, vis_name: str):
+        # Returns the persisted snapshot, or None when it is missing, unreadable (e.g.
+        # truncated) or the subtables changed, so the subtables are read again
+        snapshot_file = cls.snapshot_file(vis_name)
+        if not os.path.exists(snapshot_file):
+            return None
+        try:
+            with np.load(snapshot_file) as snapshot:
+                if not np.array_equal(snapshot["stamps"], cls.get_stamps(vis_name)):
+                    return None
+                arrays = {
+                    item.name: snapshot[item.name]
+                    for item in fields(cls) if item.init and item.name != "vis_name"
+                }
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as error:
+            print("Ignoring the MS metadata snapshot {0}: {1}".format(snapshot_file, error))
+            return None
+        return cls(vis_name=vis_name, **arrays)
+
+    def save(self):
+        arrays = {item.name: getattr(self, item.name) for item in fields(self) if item.init}
+        del arrays["vis_name"]
+        snapshot_file = self.snapshot_file(self.vis_name)
+        temporary_file = snapshot_file + ".{0}.tmp.npz".format(os.getpid())
+        try:
+            np.savez(temporary_file, **arrays)
+            os.replace(temporary_file, snapshot_file)
+        except OSError:
+            # Read-only locations simply do not get a snapshot
+            print("Could not persist MS metadata next to " + self.vis_name)
+
+    @classmethod
+    def from_ms(cls, vis_name: str, persist: bool = False):
+        # With persist, the snapshot is kept in a <vis>.ocarina_metadata.npz file next to the MS
+        metadata = cls.load(vis_name) if persist else None
+        if metadata is None:
+            metadata = cls.read(vis_name)
+            if persist:
+                metadata.save()
+        return metadata
+
+    @property
+    def number_spectral_windows(self) -> int:
+        return len(self.spw_num_chan)
+
+    def channel_frequencies(self, spw_id: int) -> np.ndarray:
+        return self.chan_freq[self.chan_offsets[spw_id]:self.chan_offsets[spw_id + 1]]
+
+    def correlation_types(self, pol_id: int) -> np.ndarray:
+        return self.corr_type[self.corr_offsets[pol_id]:self.corr_offsets[pol_id + 1]]
+
+    def unflagged_spw_ids(self) -> np.ndarray:
+        return np.flatnonzero(~self.spw_flag_row)
+
+    def unflagged_channel_frequencies(self) -> np.ndarray:
+        spw_of_channel = np.repeat(np.arange(len(self.spw_num_chan)), np.diff(self.chan_offsets))
+        return self.chan_freq[~self.spw_flag_row[spw_of_channel]]
+
+    def field_id(self, field_name: str) -> int:
+        if self._field_index is None:
+            self._field_index = {}
+            # The first field with a given name wins, as in a TaQL name lookup
+            for field_id, name in enumerate(self.field_names):
+                self._field_index.setdefault(name, field_id)
+        if field_name not in self._field_index:
+            raise ValueError("The field you have entered does not exist in the measurement set")
+        return self._field_index[field_name]
+
+    def antenna_id(self, antenna_name: str) -> int:
+        if self._antenna_index is None:
+            self._antenna_index = {name: i for i, name in enumerate(self.antenna_names)}
+        if antenna_name not in self._antenna_index:
+            raise ValueError(
+                "The antenna " + antenna_name + " does not exist in the measurement set"
+            )
+        return self._antenna_index[antenna_name]
@@ -0,0 +1,231 @@
+import hashlib
+import io
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from .tablepool import table_stamp
+
+
+class QueryResult:
+    # Materialized TaQL result holding plain numpy columns. It answers the table tool calls
+    # ocarina makes on query results, so cached and live results can be used the same way.
+    # Columns whose cells change shape between rows are kept as getvarcol dictionaries.
+
+    def __init__(self, columns: dict, rownumbers: np.ndarray):
+        self.columns = columns
+        self._rownumbers = rownumbers
+
+    @classmethod
+    def from_table(cls, result):
+        columns = OrderedDict()
+        for column in result.colnames():
+            try:
+                columns[column] = np.asarray(result.getcol(column))
+            except RuntimeError:
+                columns[column] = dict(result.getvarcol(column))
+        return cls(columns, np.asarray(result.rownumbers()))
+
+    @property
+    def nbytes(self) -> int:
+        nbytes = self._rownumbers.nbytes
+        for values in self.columns.values():
+            if isinstance(values, dict):
+                nbytes += sum(np.asarray(cell).nbytes for cell in values.values())
+            else:
+                nbytes += values.nbytes
+        return nbytes
+
+    @property
+    def is_plain(self) -> bool:
+        # Object columns (e.g. records) cannot be stored without pickling
+        return all(
+            isinstance(values, dict) or values.dtype != object for values in self.columns.values()
+        )
+
+    def colnames(self) -> list:
+        return list(self.columns.keys())
+
+    def nrows(self) -> int:
+        return len(self._rownumbers)
+
+    def rownumbers(self) -> np.ndarray:
+        return self._rownumbers.copy()
+
+    def getcol(self, column: str) -> np.ndarray:
+        values = self.columns[column]
+        if isinstance(values, dict):
+            raise RuntimeError("Column " + column + " has cells of different shapes")
+        return values.copy()
+
+    def getvarcol(self, column: str) -> dict:
+        values = self.columns[column]
+        if isinstance(values, dict):
+            return {key: np.copy(cell) for key, cell in values.items()}
+        # Rows are the last axis, as in getcol
+        return {
+            "r{0}".format(row + 1): values[..., row:row + 1].copy()
+            for row in range(self.nrows())
+        }
+
+    def close(self):
+        pass
+
+    def to_bytes(self) -> bytes:
+        arrays = {"rownumbers": self._rownumbers, "colnames": np.array(self.colnames(), dtype=str)}
+        for column, values in self.columns.items():
+            if isinstance(values, dict):
+                cells = [
+                    np.asarray(values[key]) for key in sorted(values, key=lambda k: int(k[1:]))
+                ]
+                arrays["var_" + column] = np.concatenate([cell.ravel() for cell in cells]) \
+                    if cells else np.array([])
+                arrays["shape_" + column] = np.array([cell.shape for cell in cells], dtype=np.int64)
+            else:
+                arrays["col_" + column] = values
+        content = io.BytesIO()
+        np.savez(content, **arrays)
+        return content.getvalue()
+
+    @classmethod
+    def from_file(cls, file_name: str):
+        with np.load(file_name) as data:
+            columns = OrderedDict()
+            for column in data["colnames"]:
+                if "col_" + column in data.files:
+                    columns[column] = data["col_" + column]
+                    continue
+                flat = data["var_" + column]
+                cells = {}
+                start = 0
+                for row, shape in enumerate(data["shape_" + column]):
+                    size = int(np.prod(shape))
+                    cells["r{0}".format(row + 1)] = flat[start:start + size].reshape(shape)
+                    start += size
+                columns[column] = cells
+            return cls(columns, data["rownumbers"])
+
+
+def referenced_tables(table_name: str, query: str) -> list:
+    # The table the query is run against plus every table path named in the query text
+    tables = [os.path.abspath(table_name)]
+    for token in query.replace(",", " ").split():
+        token = token.strip("'\"()")
+        if os.path.exists(os.path.join(token, "table.dat")):
+            path = os.path.abspath(token)
+            if path not in tables:
+                tables.append(path)
+    return tables
+
+
+@dataclass(init=True, repr=True)
+class QueryCache:
+    # LRU over (table path, query text, table stamps), bounded by the size of the stored
+    # columns. The stamps are the table.dat modification times of every table the query
+    # touches, so a result is dropped as soon as one of them changes on disk. With a cache_dir
+    # results are also kept as .npz files and survive the process.
+    max_bytes: int = 64 * 1024**2
+    cache_dir: str = None
+    hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+    evictions: int = field(default=0, init=False)
+    current_bytes: int = field(default=0, init=False)
+    _entries: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    @staticmethod
+    def get_key(table_name: str, query: str) -> tuple:
+        tables = referenced_tables(table_name, query)
+        stamps = tuple(table_stamp(path) for path in tables)
+        return tables[0], query, stamps
+
+    def _disk_file(self, key: tuple) -> Path:
+        query_digest = hashlib.sha1((key[0] + "\n" + key[1]).encode()).hexdigest()
+        stamp_digest = hashlib.sha1(repr(key[2]).encode()).hexdigest()[:16]
+        return Path(self.cache_dir) / "{0}_{1}.npz".format(query_digest, stamp_digest)
+
+    def _read_disk(self, key: tuple) -> QueryResult:
+        if self.cache_dir is None:
+            return None
+        disk_file = self._disk_file(key)
+        if not disk_file.exists():
+            return None
+        return QueryResult.from_file(str(disk_file))
+
+    def _write_disk(self, key: tuple, result: QueryResult):
+        if self.cache_dir is None or not result.is_plain:
+            return
+        disk_file = self._disk_file(key)
+        disk_file.parent.mkdir(parents=True, exist_ok=True)
+        # Results for older versions of the same tables are stale; another process may have
+        # removed them already
+        for old_file in disk_file.parent.glob(disk_file.name.split("_")[0] + "_*.npz"):
+            old_file.unlink(missing_ok=True)
+        temporary_file = disk_file.with_name(disk_file.name + ".{0}.tmp".format(os.getpid()))
+        temporary_file.write_bytes(result.to_bytes())
+        os.replace(temporary_file, disk_file)
+
+    def _store(self, key: tuple, result: QueryResult):
+        nbytes = result.nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            # Also drops results for older stamps of the same query
+            for old_key in [old_key for old_key in self._entries if old_key[:2] == key[:2]]:
+                self.current_bytes -= self._entries.pop(old_key).nbytes
+            self._entries[key] = result
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def get(self, table_name: str, query: str, run_query) -> QueryResult:
+        # run_query() executes the query on a miss and returns the live casatools result
+        key = self.get_key(table_name, query)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if result is not None:
+            return result
+
+        result = self._read_disk(key)
+        if result is None:
+            live_result = run_query()
+            try:
+                result = QueryResult.from_table(live_result)
+            finally:
+                live_result.close()
+            self._write_disk(key, result)
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+        self._store(key, result)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes
+            }
+
+    def clear(self, disk: bool = False):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+        if disk and self.cache_dir is not None:
+            for cache_file in Path(self.cache_dir).glob("*.npz"):
+                cache_file.unlink()
+
+
+query_cache = QueryCache()
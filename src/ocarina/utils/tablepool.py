@@ -0,0 +1,130 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from .lazy import LazyObject
+
+table = LazyObject("casatools", "table")
+
+
+def table_stamp(table_name: str) -> int:
+    # Latest modification time of the table descriptor and the storage manager files
+    # (table.f*). Data written in place through a storage manager (e.g. putcol on an existing
+    # column) does not always rewrite table.dat.
+    if not os.path.exists(os.path.join(table_name, "table.dat")):
+        return -1
+    with os.scandir(table_name) as entries:
+        return max(
+            entry.stat().st_mtime_ns for entry in entries
+            if entry.name == "table.dat" or entry.name.startswith("table.f")
+        )
+
+
+class _ThreadHandles(OrderedDict):
+    # Handles of one thread, closed when the thread ends and its thread-local data goes away
+
+    def __del__(self):
+        for tb, _, _ in self.values():
+            tb.close()
+
+
+class TablePool:
+    # Bounded pool of casatools table handles. casatools tools must not be shared between
+    # threads, so every thread keeps its own handles, keyed by (path, readonly). Read-only
+    # handles stay open and are reused until the table changes on disk or they are evicted
+    # (least recently used first); writable handles are opened for a single use so no write
+    # lock is held in between.
+
+    def __init__(self, max_handles: int = 16):
+        self.max_handles = max_handles
+        self.hits = 0
+        self.opens = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _get_handles(self) -> OrderedDict:
+        handles = getattr(self._local, "handles", None)
+        if handles is None:
+            handles = _ThreadHandles()
+            self._local.handles = handles
+        return handles
+
+    def _open_handle(self, table_name: str, readonly: bool):
+        if not os.path.exists(table_name):
+            raise ValueError("Table name does not exist")
+        tb = table()
+        tb.open(table_name, nomodify=readonly)
+        with self._lock:
+            self.opens += 1
+        return tb
+
+    def _evict(self, handles: OrderedDict):
+        for key in list(handles.keys()):
+            if len(handles) <= self.max_handles:
+                break
+            tb, _, users = handles[key]
+            if users == 0:
+                tb.close()
+                del handles[key]
+
+    @contextmanager
+    def open(self, table_name: str, readonly: bool = True):
+        if not readonly:
+            tb = self._open_handle(table_name, readonly)
+            try:
+                yield tb
+            finally:
+                tb.flush()
+                tb.close()
+            return
+
+        handles = self._get_handles()
+        key = (os.path.abspath(table_name), readonly)
+        stamp = table_stamp(table_name)
+        entry = handles.get(key)
+        if entry is not None and entry[1] == stamp:
+            with self._lock:
+                self.hits += 1
+            handles.move_to_end(key)
+        else:
+            if entry is not None and entry[2] == 0:
+                entry[0].close()
+            entry = [self._open_handle(table_name, readonly), stamp, 0]
+            handles[key] = entry
+        entry[2] += 1
+        self._evict(handles)
+        try:
+            yield entry[0]
+        finally:
+            entry[2] -= 1
+            # A handle replaced while in use (the table changed) is closed by its last user
+            if entry[2] == 0 and handles.get(key) is not entry:
+                entry[0].close()
+
+    def close(self, table_name: str = None):
+        # Closes the calling thread's idle handles, or only those of table_name and its subtables
+        handles = self._get_handles()
+        prefix = None if table_name is None else os.path.abspath(table_name)
+        for key in list(handles.keys()):
+            if prefix is not None and key[0] != prefix and not key[0].startswith(prefix + os.sep):
+                continue
+            tb, _, users = handles[key]
+            if users == 0:
+                tb.close()
+                del handles[key]
+
+    def close_all(self):
+        # Closes all idle handles of the calling thread. Handles of other threads are never
+        # touched here; they are closed when their thread ends.
+        self.close()
+
+    def __getstate__(self):
+        raise TypeError("Table pools hold open handles and cannot be pickled")
+
+    def __repr__(self):
+        return "TablePool(max_handles={0}, opens={1}, hits={2})".format(
+            self.max_handles, self.opens, self.hits
+        )
+
+
+table_pool = TablePool()
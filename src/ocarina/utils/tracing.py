@@ -0,0 +1,240 @@
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+import numpy as np
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, List
+from .tablepool import table_pool
+
+# Modules whose LazyObject calls are traced: the CASA tasks, not the tools
+TRACED_MODULES = ("casatasks", "casaplotms")
+# Task arguments naming the tables or files a task writes
+OUTPUT_ARGUMENTS = ("caltable", "fluxtable", "outputvis", "plotfile")
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+_active = threading.local()
+
+
+def current_tracer():
+    return getattr(_active, "tracer", None)
+
+
+def disk_bytes(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, file_name)) for file_name in files)
+    return total
+
+
+def table_shape(table_name: str) -> dict:
+    # Rows of a MS or caltable and the spws and channels of its SPECTRAL_WINDOW subtable
+    shape = {"table": table_name, "bytes": disk_bytes(table_name)}
+    try:
+        with table_pool.open(table_name) as tb:
+            shape["rows"] = tb.nrows()
+        spectral_window = os.path.join(table_name, "SPECTRAL_WINDOW")
+        if os.path.isdir(spectral_window):
+            with table_pool.open(spectral_window) as tb:
+                num_chan = tb.getcol("NUM_CHAN")
+            shape["spws"] = len(num_chan)
+            shape["channels"] = int(np.sum(num_chan))
+    except (RuntimeError, ValueError):
+        pass
+    # Tasks write to these tables, so no handle is kept
+    table_pool.close(table_name)
+    return shape
+
+
+def _usage() -> tuple:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (
+        time.perf_counter(), time.process_time(), children.ru_utime + children.ru_stime,
+        own.ru_maxrss * RSS_UNIT
+    )
+
+
+@dataclass(init=True, repr=True)
+class Tracer:
+    # Records a span for every traced call: wall and CPU time (of this process and of the
+    # subprocesses it waited for), the peak RSS and how much the call raised it, and the size
+    # of the tables it read and wrote. Spans nest (calibrator step > CASA task) and are
+    # appended to trace_file as JSON lines when it is given. While a tracer is active in a
+    # thread, every CASA task called through a LazyObject and every traced function (the fits)
+    # is recorded; measure_tables=False skips the table sizes, which cost a table open.
+    # Spawned workers receive a copy that keeps appending to the same trace_file.
+    trace_file: str = ""
+    measure_tables: bool = True
+    records: List[dict] = field(default_factory=list, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    _stack: threading.local = field(default_factory=threading.local, init=False, repr=False)
+
+    @contextmanager
+    def activate(self):
+        previous = current_tracer()
+        _active.tracer = self
+        try:
+            yield self
+        finally:
+            _active.tracer = previous
+
+    def _parents(self) -> list:
+        if not hasattr(self._stack, "spans"):
+            self._stack.spans = []
+        return self._stack.spans
+
+    @contextmanager
+    def span(self, name: str, category: str = "step", **attributes):
+        # attributes can be updated by the caller while the span is open
+        parents = self._parents()
+        record = {
+            "name": name,
+            "category": category,
+            "span": uuid.uuid4().hex[:16],
+            "parent": parents[-1] if parents else None,
+            "depth": len(parents),
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            "start": time.time(),
+            "status": "ok",
+            "error": None,
+            "attributes": attributes
+        }
+        wall, cpu, children_cpu, peak_rss = _usage()
+        parents.append(record["span"])
+        try:
+            yield record
+        except BaseException as exception:
+            record["status"] = "error"
+            record["error"] = "{0}: {1}".format(type(exception).__name__, exception)
+            raise
+        finally:
+            parents.pop()
+            end_wall, end_cpu, end_children_cpu, end_peak_rss = _usage()
+            record["wall_s"] = end_wall - wall
+            record["cpu_s"] = end_cpu - cpu
+            record["children_cpu_s"] = end_children_cpu - children_cpu
+            record["peak_rss_bytes"] = end_peak_rss
+            record["peak_rss_growth_bytes"] = end_peak_rss - peak_rss
+            self._write(record)
+
+    def trace_call(self, name: str, function: Callable, args: tuple, kwargs: dict):
+        # A CASA task call; the tables are measured outside the span
+        inputs = {}
+        if self.measure_tables and isinstance(kwargs.get("vis"), str) and \
+                os.path.isdir(kwargs["vis"]):
+            inputs = table_shape(kwargs["vis"])
+        selection = {key: kwargs[key] for key in ("field", "spw") if key in kwargs}
+        with self.span(name, category="task", inputs=inputs, selection=selection) as record:
+            result = function(*args, **kwargs)
+        if self.measure_tables:
+            outputs = {}
+            for argument in OUTPUT_ARGUMENTS:
+                path = kwargs.get(argument)
+                if isinstance(path, str) and path and os.path.exists(path):
+                    outputs[argument] = table_shape(path) if os.path.isdir(path) else {
+                        "file": path,
+                        "bytes": disk_bytes(path)
+                    }
+            # The record was already written, so outputs go in a record of their own
+            self._write({"span": record["span"], "name": name, "outputs": outputs})
+        return result
+
+    def _write(self, record: dict):
+        with self._lock:
+            self.records.append(record)
+            if self.trace_file:
+                with open(self.trace_file, "a") as trace_output:
+                    trace_output.write(json.dumps(record, default=str) + "\n")
+
+    def summary(self) -> dict:
+        # Per name: calls, errors, total wall and CPU seconds, peak RSS and bytes written
+        summary = {}
+        outputs = {}
+        for record in self.records:
+            if "outputs" in record:
+                written = [output.get("bytes", 0) for output in record["outputs"].values()]
+                outputs[record["span"]] = sum(written)
+        for record in self.records:
+            if "outputs" in record:
+                continue
+            entry = summary.setdefault(
+                record["name"], {
+                    "category": record["category"],
+                    "calls": 0,
+                    "errors": 0,
+                    "wall_s": 0.0,
+                    "cpu_s": 0.0,
+                    "children_cpu_s": 0.0,
+                    "peak_rss_bytes": 0,
+                    "output_bytes": 0
+                }
+            )
+            entry["calls"] += 1
+            entry["errors"] += record["status"] != "ok"
+            entry["wall_s"] += record["wall_s"]
+            entry["cpu_s"] += record["cpu_s"]
+            entry["children_cpu_s"] += record["children_cpu_s"]
+            entry["peak_rss_bytes"] = max(entry["peak_rss_bytes"], record["peak_rss_bytes"])
+            entry["output_bytes"] += outputs.get(record["span"], 0)
+        return summary
+
+    def print_summary(self):
+        rows = sorted(self.summary().items(), key=lambda item: -item[1]["wall_s"])
+        print(
+            "{0:<32} {1:<5} {2:>5} {3:>10} {4:>10} {5:>10} {6:>10}".format(
+                "Name", "Kind", "Calls", "Wall (s)", "CPU (s)", "RSS (MB)", "Out (MB)"
+            )
+        )
+        for name, entry in rows:
+            print(
+                "{0:<32} {1:<5} {2:>5} {3:>10.2f} {4:>10.2f} {5:>10.1f} {6:>10.1f}".format(
+                    name[:32], entry["category"][:5], entry["calls"], entry["wall_s"],
+                    entry["cpu_s"] + entry["children_cpu_s"], entry["peak_rss_bytes"] / 1024**2,
+                    entry["output_bytes"] / 1024**2
+                )
+            )
+
+    def __getstate__(self):
+        # Copies sent to worker processes only append to the trace file
+        state = self.__dict__.copy()
+        state["records"] = []
+        del state["_lock"]
+        del state["_stack"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._stack = threading.local()
+
+
+def traced(category: str = "fit"):
+    # Records calls of the decorated function, with the shapes of its array arguments, in the
+    # active tracer
+    def decorator(function: Callable):
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            tracer = current_tracer()
+            if tracer is None:
+                return function(*args, **kwargs)
+            shapes = [
+                list(np.shape(value)) for value in list(args) + list(kwargs.values())
+                if isinstance(value, np.ndarray)
+            ]
+            with tracer.span(function.__qualname__, category=category, shapes=shapes):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
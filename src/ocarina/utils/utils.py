@@ -1,17 +1,17 @@
-import os
-from casatools import table
+from typing import Union
+from .querycache import QueryCache, query_cache
+from .tablepool import table_pool
 
-tb = table()
 
-
-def query_table(query: str = None, table_name: str = None):
+def query_table(query: str = None, table_name: str = None, cache: Union[bool, QueryCache] = False):
+    # With cache=True the shared query_cache is used; a QueryCache can also be passed. Cached
+    # results are materialized numpy columns answering getcol, getvarcol, rownumbers, ...
     if query is None and table_name is None:
         raise ValueError("Query or table cannot be None")
     else:
-        if os.path.exists(table_name):
-            tb.open(table_name)
-        else:
-            raise ValueError("Table name does not exist")
-        result = tb.taql(query)
-        tb.close()
-        return result
+        if cache is True:
+            cache = query_cache
+        if cache:
+            return cache.get(table_name, query, lambda: query_table(query, table_name))
+        with table_pool.open(table_name) as tb:
+            return tb.taql(query)
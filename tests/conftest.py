@@ -0,0 +1,45 @@
+# CASA is replaced by the numpy stand-in of the benchmarks: importing synthetic_ms puts it
+# first on sys.path, before any ocarina module imports casatools or casatasks
+import os
+import numpy as np
+import pytest
+from benchmarks.synthetic_ms import SyntheticMS
+from casatasks import _write_caltable
+
+POL_ANGLE_MODEL = {
+    "fluxdensity": [10.0, 0, 0, 0],
+    "spix": [-0.5],
+    "reffreq": "2.2GHz",
+    "polindex": [0.1],
+    "polangle": [0.5]
+}
+
+
+@pytest.fixture
+def synthetic_ms() -> SyntheticMS:
+    return SyntheticMS(n_antennas=5, n_spws=2, n_channels=8, n_times=4, noise=0.0)
+
+
+@pytest.fixture
+def ms(tmp_path, synthetic_ms) -> str:
+    return synthetic_ms.write(str(tmp_path / "synthetic.ms"), POL_ANGLE_MODEL)
+
+
+def write_caltable(caltable: str, vis: str, n_antennas: int, spw_ids=(0, ), n_channels: int = 8):
+    # A complex caltable with one solution per antenna and spw, param = antenna + spw i
+    solutions = [
+        (
+            0, spw, antenna, 0, np.full((2, n_channels), antenna + spw * 1j, dtype=np.complex64),
+            np.ones((2, n_channels)), np.zeros((2, n_channels), dtype=bool)
+        ) for spw in spw_ids for antenna in range(n_antennas)
+    ]
+    _write_caltable(caltable, vis, "D Jones", "CPARAM", solutions, 5.0e9)
+    return caltable
+
+
+@pytest.fixture
+def caltable(tmp_path, ms, synthetic_ms) -> str:
+    return write_caltable(
+        os.path.join(str(tmp_path), "synthetic.D0"), ms, synthetic_ms.n_antennas,
+        range(synthetic_ms.n_spws), synthetic_ms.n_channels
+    )
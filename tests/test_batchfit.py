@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from ocarina.functions import fit_flux_functions, fit_pol_functions
+
+NU = np.linspace(1.0e9, 2.0e9, 6)
+NU_0 = 1.5e9
+
+
+def curved_power_law(alpha, beta, flux_0=2.0):
+    log_nu_div = np.log10(NU / NU_0)
+    return flux_0 * 10.0**(alpha * log_nu_div + beta * log_nu_div**2)
+
+
+def test_flux_fit_recovers_coefficients():
+    data = np.stack([curved_power_law(-0.7, -0.1), curved_power_law(-0.5, 0.05)])
+    coefficients, errors = fit_flux_functions(NU, data, NU_0, 2.0)
+    np.testing.assert_allclose(coefficients, [[-0.7, -0.1], [-0.5, 0.05]], atol=1e-8)
+    assert np.all(np.isfinite(errors))
+
+
+@pytest.mark.parametrize("n_valid", [0, 1])
+def test_flux_fit_rows_without_enough_points_are_nan(n_valid):
+    data = np.stack([curved_power_law(-0.7, -0.1), curved_power_law(-0.5, 0.05)])
+    data[1, n_valid:] = np.nan
+    coefficients, errors, covariance = fit_flux_functions(
+        NU, data, NU_0, 2.0, return_covariance=True
+    )
+    assert np.all(np.isnan(coefficients[1])) and np.all(np.isnan(covariance[1]))
+    single, _ = fit_flux_functions(NU, data[0], NU_0, 2.0)
+    np.testing.assert_allclose(coefficients[0], single)
+    np.testing.assert_allclose(coefficients[0], [-0.7, -0.1], atol=1e-8)
+
+
+def test_flux_fit_mask_excludes_points():
+    data = curved_power_law(-0.7, -0.1)
+    corrupted = data.copy()
+    corrupted[2] = 100.0
+    mask = np.ones(len(NU), dtype=bool)
+    mask[2] = False
+    coefficients, _ = fit_flux_functions(NU, corrupted, NU_0, 2.0, mask=mask)
+    np.testing.assert_allclose(coefficients, [-0.7, -0.1], atol=1e-8)
+
+
+def test_pol_fit_matches_polyfit():
+    x = (NU - NU_0) / NU_0
+    data = np.stack([0.1 + 0.02 * x - 0.01 * x**2, 0.3 - 0.05 * x + 0.2 * x**2])
+    coefficients, errors = fit_pol_functions(NU, data, NU_0, n_terms=3)
+    expected = [np.polyfit(x, row, 2)[::-1] for row in data]
+    np.testing.assert_allclose(coefficients, expected, atol=1e-10)
+
+
+def test_pol_fit_rows_without_enough_points_are_nan():
+    data = np.stack([0.1 + 0.02 * (NU - NU_0) / NU_0, np.full(len(NU), np.nan)])
+    data[1, :2] = 0.1
+    coefficients, errors = fit_pol_functions(NU, data, NU_0, n_terms=3)
+    assert np.all(np.isfinite(coefficients[0])) and np.all(np.isnan(coefficients[1]))
@@ -0,0 +1,22 @@
+import numpy as np
+from ocarina.polarized_sources import PolarizedSource
+from ocarina.polarized_sources.calibratorcatalog import calibrator_catalog
+
+
+def test_entries_match_the_source_tables():
+    entry = calibrator_catalog["3C286_2019"]
+    assert entry.source == "3C286"
+    data = np.loadtxt(
+        str(calibrator_catalog.catalog_dir.parent / "sources_2019" / "3c286_2019.txt")
+    )
+    np.testing.assert_allclose(entry.nu.to_value("GHz"), data[:, 0])
+    np.testing.assert_allclose(entry.pol_fraction, data[:, 2])
+
+
+def test_sources_are_writeable_copies():
+    source = PolarizedSource(source="3C286")
+    source.pol_fraction *= 2.0
+    source.flux[0] = 1.0 * source.flux.unit
+    fresh = PolarizedSource(source="3C286")
+    np.testing.assert_allclose(source.pol_fraction, 2.0 * fresh.pol_fraction)
+    assert fresh.flux[0].value == 0.0
@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import casatools
+from benchmarks.synthetic_ms import SyntheticMS
+from ocarina.polarization_calibration.caltableplotter import (
+    CaltableColumns, caltable_plot_files, render_caltable_plots
+)
+from ocarina.polarization_calibration.plotqueue import PlotSpec
+from .conftest import POL_ANGLE_MODEL, write_caltable
+
+PAGED = dict(
+    xaxis="freq",
+    yaxis="amp",
+    iteraxis="antenna",
+    coloraxis="corr",
+    gridrows=2,
+    gridcols=2,
+    exprange="all"
+)
+
+
+def test_paged_plot_files(caltable):
+    plot = dict(PAGED, plotfile=caltable + ".ampvsfreq.png")
+    assert caltable_plot_files(caltable, [plot]) == [
+        caltable + ".ampvsfreq_Antennaea01,ea02,ea03,ea04.png",
+        caltable + ".ampvsfreq_Antennaea05_2.png"
+    ]
+    selected = dict(plot, antenna="ea02,ea03")
+    assert caltable_plot_files(caltable,
+                               [selected]) == [caltable + ".ampvsfreq_Antennaea02,ea03.png"]
+    single = dict(plot, exprange="")
+    assert caltable_plot_files(caltable, [single]) == [plot["plotfile"]]
+
+
+def test_spec_lists_the_files_rendered(caltable):
+    plots = [
+        dict(PAGED, plotfile=caltable + ".ampvsfreq.png"),
+        dict(xaxis="antenna1", yaxis="amp", plotfile=caltable + ".ampvsantenna.png")
+    ]
+    spec = PlotSpec(function=render_caltable_plots, kwargs=dict(vis=caltable, plots=plots))
+    rendered = spec.render()
+    assert rendered == spec.plot_files
+    assert len(rendered) == 3 and all(os.path.exists(plot_file) for plot_file in rendered)
+
+
+def test_plotms_spec_lists_paged_files(caltable):
+    spec = PlotSpec(kwargs=dict(vis=caltable, plotfile=caltable + ".png", **PAGED))
+    assert len(spec.plot_files) == 2
+    spec = PlotSpec(kwargs=dict(vis=caltable, plotfile=caltable + ".png", xaxis="freq"))
+    assert spec.plot_files == [caltable + ".png"]
+
+
+def test_frequencies_follow_the_spw_of_each_row(tmp_path, monkeypatch):
+    synthetic_ms = SyntheticMS(n_antennas=3, n_spws=12, n_channels=2, n_times=1)
+    vis = synthetic_ms.write(str(tmp_path / "spws.ms"), POL_ANGLE_MODEL)
+    caltable = write_caltable(str(tmp_path / "spws.D0"), vis, 3, range(12), 2)
+    getvarcol = casatools.table.getvarcol
+
+    def string_ordered(self, columnname, *args, **kwargs):
+        cells = getvarcol(self, columnname, *args, **kwargs)
+        return {key: cells[key] for key in sorted(cells)}
+
+    monkeypatch.setattr(casatools.table, "getvarcol", string_ordered)
+    columns = CaltableColumns.from_table(caltable)
+    frequencies = synthetic_ms.frequencies()
+    for spw in range(12):
+        np.testing.assert_array_equal(
+            np.unique(columns.frequency[columns.spw == spw]), frequencies[spw]
+        )
@@ -0,0 +1,105 @@
+import os
+import shutil
+import stat
+import time
+import pytest
+from ocarina.polarization_calibration import CaltableStore
+from ocarina.polarization_calibration.caltablestore import ms_content_digest, table_digest
+from ocarina.utils import table_pool
+from .conftest import write_caltable
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CaltableStore(store_dir=str(tmp_path / "store"))
+
+
+def is_read_only(table_name: str) -> bool:
+    for root, _, files in os.walk(table_name):
+        for file_name in files:
+            if os.stat(os.path.join(root, file_name)).st_mode & stat.S_IWUSR:
+                return False
+    return True
+
+
+def test_digest_ignores_key_order():
+    assert CaltableStore.get_digest({"a": 1, "b": [1, 2]}) == \
+        CaltableStore.get_digest({"b": [1, 2], "a": 1})
+    assert CaltableStore.get_digest({"a": 1}) != CaltableStore.get_digest({"a": 2})
+
+
+def test_put_and_get(tmp_path, store, caltable):
+    digest = store.get_digest({"step": "leakage"})
+    assert not store.get(digest, str(tmp_path / "missing.D0"))
+    stored = store.put(digest, caltable, inputs={"step": "leakage"})
+    assert store.has(digest) and is_read_only(stored)
+    assert table_digest(stored) == table_digest(caltable)
+    assert store.entries()[digest]["inputs"] == {"step": "leakage"}
+
+    restored = str(tmp_path / "restored.D0")
+    assert store.get(digest, restored)
+    assert table_digest(restored) == table_digest(caltable)
+    table_file = os.path.join(restored, "table.dat")
+    assert os.stat(table_file).st_ino == os.stat(os.path.join(stored, "table.dat")).st_ino
+
+
+def test_get_replaces_the_table_with_a_copy(tmp_path, store, ms, caltable):
+    digest = store.get_digest({"step": "leakage"})
+    store.put(digest, caltable)
+    other = str(tmp_path / "other.D0")
+    write_caltable(other, ms, n_antennas=3)
+    copying_store = CaltableStore(store_dir=store.store_dir, link=False)
+    assert copying_store.get(digest, other)
+    assert table_digest(other) == table_digest(caltable)
+    assert is_read_only(other)
+    stored_file = os.path.join(store.put(digest, caltable), "table.dat")
+    assert os.stat(os.path.join(other, "table.dat")).st_ino != os.stat(stored_file).st_ino
+
+
+def test_put_keeps_the_first_entry(tmp_path, store, ms, caltable):
+    digest = store.get_digest({"step": "leakage"})
+    store.put(digest, caltable)
+    other = str(tmp_path / "other.D0")
+    write_caltable(other, ms, n_antennas=3)
+    stored = store.put(digest, other)
+    assert table_digest(stored) == table_digest(caltable)
+
+
+def test_gc(tmp_path, store, caltable):
+    digests = [store.get_digest({"step": i}) for i in range(3)]
+    for digest in digests:
+        store.put(digest, caltable)
+    now = time.time()
+    for age_days, digest in zip([100.0, 2.0, 1.0], digests):
+        entry = store._read_entry(digest)
+        entry["last_used"] = now - age_days * 86400.
+        store._write_entry(store._entry_dir(digest), entry)
+
+    assert store.gc() == digests[:1]
+    size = store.entries()[digests[2]]["size"]
+    # The least recently used entries go first
+    assert store.gc(max_bytes=size) == digests[1:2]
+    assert list(store.entries()) == digests[2:]
+    assert store.size() == size
+
+
+def test_ms_digest_identifies_the_observation(tmp_path, ms):
+    digest = ms_content_digest(ms)
+    copy = str(tmp_path / "copy.ms")
+    shutil.copytree(ms, copy)
+    assert ms_content_digest(copy) == digest
+    # Windows smaller than a row give the same digest
+    assert ms_content_digest(ms, max_chunk_bytes=1) == digest
+
+    with table_pool.open(copy, readonly=False) as tb:
+        flags = tb.getcol("FLAG")
+        flags[0, 0, -1] = ~flags[0, 0, -1]
+        tb.putcol("FLAG", flags)
+    assert ms_content_digest(copy) != digest
+    with table_pool.open(copy, readonly=False) as tb:
+        flag_row = tb.getcol("FLAG_ROW")
+        flag_row[0] = ~flag_row[0]
+        flags[0, 0, -1] = ~flags[0, 0, -1]
+        tb.putcol("FLAG", flags)
+        tb.putcol("FLAG_ROW", flag_row)
+    assert ms_content_digest(copy) != digest
@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import pytest
+from pathlib import Path
+from benchmarks.standards import EPOCH
+from benchmarks.synthetic_ms import write_standards
+from casatools import DATA_DIR_VARIABLE
+from ocarina.polarized_sources import CoefficientCache
+from ocarina.utils import table_pool
+
+STANDARD = "Perley-Butler 2017"
+
+
+@pytest.fixture
+def standards_table(tmp_path, monkeypatch):
+    data_dir = str(tmp_path / "data")
+    monkeypatch.setenv(DATA_DIR_VARIABLE, data_dir)
+    return write_standards(data_dir, STANDARD)
+
+
+def make_cache(tmp_path, standards_table, **kwargs) -> CoefficientCache:
+    return CoefficientCache(
+        cache_dir=str(tmp_path / "cache"), standards_dir=os.path.dirname(standards_table), **kwargs
+    )
+
+
+def test_get_reads_the_table(tmp_path, standards_table):
+    cache = make_cache(tmp_path, standards_table)
+    coefficients, errors = cache.get("3C286", STANDARD, EPOCH)
+    with table_pool.open(standards_table) as tb:
+        np.testing.assert_array_equal(coefficients, tb.getcol("3C286_coeffs").flatten())
+        np.testing.assert_array_equal(errors, tb.getcol("3C286_coefferrs").flatten())
+    with pytest.raises(ValueError):
+        cache.get("not-a-source", STANDARD, EPOCH)
+
+
+def test_small_lru_keeps_a_whole_table(tmp_path, standards_table, monkeypatch):
+    cache = make_cache(tmp_path, standards_table, max_entries=2)
+    sources = cache.prefetch(STANDARD, EPOCH)
+    assert len(sources) > 2
+    # Every source is served from memory after the prefetch
+    monkeypatch.setattr(cache, "prefetch", None)
+    for source in sources:
+        cache.get(source, STANDARD, EPOCH)
+
+
+def test_disk_entries(tmp_path, standards_table, monkeypatch):
+    cache = make_cache(tmp_path, standards_table)
+    cache.prefetch(STANDARD, EPOCH)
+    stamp = cache.get_table_stamp(standards_table)
+    disk_file = cache._disk_file(STANDARD, EPOCH, stamp)
+    assert disk_file.exists()
+    columns = cache._read_disk(STANDARD, EPOCH, stamp)
+
+    # Another process writing the same entry replaces the file, it never removes it
+    removed = []
+    unlink = Path.unlink
+    monkeypatch.setattr(
+        Path, "unlink", lambda path, **kwargs: removed.append(path) or unlink(path, **kwargs)
+    )
+    other = make_cache(tmp_path, standards_table)
+    other._write_disk(STANDARD, EPOCH, stamp, columns)
+    assert disk_file.exists() and removed == []
+    # A newer version of the table replaces it
+    other._write_disk(STANDARD, EPOCH, stamp + 1, columns)
+    assert not disk_file.exists()
+    assert other._disk_file(STANDARD, EPOCH, stamp + 1).exists()
+
+    # A fresh cache is served from the disk entry without opening the table
+    fresh = make_cache(tmp_path, standards_table)
+    assert fresh._read_disk(STANDARD, EPOCH, stamp + 1).keys() == columns.keys()
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from ocarina.functions import FluxFunction, PolFunction, horner
+from ocarina.functions.function import _weighted_least_squares
+
+RNG = np.random.default_rng(3)
+NU = np.linspace(1.0e9, 2.0e9, 12)
+NU_0 = 1.5e9
+
+
+def test_horner_matches_polyval():
+    x = np.linspace(-1.0, 1.0, 7)
+    coefficients = np.array([0.5, -1.0, 2.0, 0.25])
+    np.testing.assert_allclose(horner(x, coefficients), np.polyval(coefficients[::-1], x))
+
+
+def test_horner_broadcasts_batches():
+    x = np.linspace(-1.0, 1.0, 7)
+    coefficients = RNG.normal(size=(3, 1, 4))
+    result = horner(x, coefficients)
+    assert result.shape == (3, 7)
+    for batch, row in zip(coefficients, result):
+        np.testing.assert_allclose(row, horner(x, batch[0]))
+
+
+def test_least_squares_matches_lstsq():
+    design = RNG.normal(size=(20, 3))
+    data = RNG.normal(size=20)
+    weights = RNG.uniform(0.5, 2.0, size=20)
+    coefficients, covariance = _weighted_least_squares(design, data, weights)
+    expected, residuals, _, _ = np.linalg.lstsq(
+        weights[:, np.newaxis] * design, weights * data, rcond=None
+    )
+    np.testing.assert_allclose(coefficients, expected)
+    weighted_design = weights[:, np.newaxis] * design
+    expected_covariance = np.linalg.inv(weighted_design.T @ weighted_design) * residuals[0] / 17
+    np.testing.assert_allclose(covariance, expected_covariance)
+
+
+def test_least_squares_stacks():
+    design = RNG.normal(size=(4, 10, 2))
+    data = RNG.normal(size=(4, 10))
+    coefficients, covariance = _weighted_least_squares(design, data)
+    assert coefficients.shape == (4, 2) and covariance.shape == (4, 2, 2)
+    for i in range(4):
+        single, single_covariance = _weighted_least_squares(design[i], data[i])
+        np.testing.assert_allclose(coefficients[i], single)
+        np.testing.assert_allclose(covariance[i], single_covariance)
+
+
+def test_least_squares_without_degrees_of_freedom():
+    design = np.vander(np.array([0.0, 1.0]), 2, increasing=True)
+    coefficients, covariance = _weighted_least_squares(design, np.array([1.0, 3.0]))
+    np.testing.assert_allclose(coefficients, [1.0, 2.0])
+    assert np.all(np.isinf(np.diag(covariance)))
+
+
+def test_pol_linear_fit_matches_curve_fit():
+    data = horner((NU - NU_0) / NU_0, [0.1, 0.05, -0.02]) + RNG.normal(0.0, 1e-3, NU.size)
+    sigma = np.full(NU.size, 1e-3)
+    linear = PolFunction(x_0=NU_0, n_terms=3).fit(NU, data, sigma=sigma)
+    iterative = PolFunction(x_0=NU_0, n_terms=3).fit(
+        NU, data, initial_coefficients=np.zeros(3), sigma=sigma, method="curve_fit"
+    )
+    np.testing.assert_allclose(linear[0], iterative[0], atol=1e-8)
+    np.testing.assert_allclose(linear[1], iterative[1], rtol=1e-5)
+
+
+def test_pol_linear_fit_stacked_spectra():
+    data = np.stack(
+        [horner((NU - NU_0) / NU_0, [0.1, 0.05]),
+         horner((NU - NU_0) / NU_0, [0.3, -0.1])]
+    )
+    coefficients, errors = PolFunction(x_0=NU_0, n_terms=2).fit(NU, data)
+    np.testing.assert_allclose(coefficients, [[0.1, 0.05], [0.3, -0.1]], atol=1e-12)
+    assert errors.shape == (2, 2)
+
+
+def test_pol_fit_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        PolFunction(x_0=NU_0, n_terms=2).fit(NU, np.ones(NU.size), method="newton")
+
+
+def test_flux_jacobian_matches_finite_differences():
+    function = FluxFunction(x_0=NU_0, flux_0=2.0)
+    coefficients = np.array([-0.7, -0.1])
+    jacobian = function.jacobian(NU, *coefficients)
+    step = 1e-7
+    for k in range(2):
+        shifted = coefficients.copy()
+        shifted[k] += step
+        numeric = (function.f(NU, *shifted) - function.f(NU, *coefficients)) / step
+        np.testing.assert_allclose(jacobian[:, k], numeric, rtol=1e-5)
+
+
+def test_flux_initial_guess_is_exact_without_noise():
+    function = FluxFunction(x_0=NU_0, flux_0=2.0)
+    data = function.f(NU, -0.7, -0.1)
+    np.testing.assert_allclose(function.initial_guess(NU, data), [-0.7, -0.1], atol=1e-12)
+    coefficients, _ = function.fit(NU, data)
+    np.testing.assert_allclose(coefficients, [-0.7, -0.1], atol=1e-8)
@@ -0,0 +1,37 @@
+import os
+import pickle
+import subprocess
+import sys
+from ocarina.utils import LazyObject
+
+
+def test_import_does_not_load_casa():
+    # Only src is on the path, so importing CASA would fail without the stand-in
+    source_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+    code = (
+        "import sys, ocarina.polarization_calibration, ocarina.polarized_sources; "
+        "print(sorted(m for m in sys.modules if m.startswith('casa')))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        env=dict(os.environ, PYTHONPATH=source_dir),
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    assert output.strip() == "[]"
+
+
+def test_lazy_object_resolves_on_use():
+    lazy_join = LazyObject("os.path", "join")
+    assert not lazy_join._is_loaded()
+    assert lazy_join("a", "b") == os.path.join("a", "b")
+    assert lazy_join._is_loaded()
+
+
+def test_lazy_object_pickles_unresolved():
+    lazy_join = LazyObject("os.path", "join")
+    lazy_join("a")
+    copy = pickle.loads(pickle.dumps(lazy_join))
+    assert not copy._is_loaded()
+    assert copy("a", "b") == os.path.join("a", "b")
@@ -0,0 +1,102 @@
+import shutil
+import numpy as np
+import pytest
+from casatasks import setjy
+from ocarina.functions import StokesModel
+from ocarina.polarization_calibration import ModelWriter
+from ocarina.polarization_calibration.modelwriter import stokes_to_correlations
+from ocarina.utils import table_pool
+from .conftest import POL_ANGLE_MODEL
+
+SENTINEL = 3.0 - 1.0j
+
+
+def read_model(vis_name: str) -> np.ndarray:
+    with table_pool.open(vis_name) as tb:
+        model = tb.getcol("MODEL_DATA")
+    table_pool.close(vis_name)
+    return model
+
+
+def fill_model(vis_name: str, value: complex):
+    with table_pool.open(vis_name, readonly=False) as tb:
+        model = tb.getcol("MODEL_DATA")
+        tb.putcol("MODEL_DATA", np.full(model.shape, value, dtype=model.dtype))
+
+
+@pytest.fixture
+def ms_pair(tmp_path, ms) -> tuple:
+    # The same MS for setjy and for the writer, with a model no field has
+    copy = str(tmp_path / "copy.ms")
+    shutil.copytree(ms, copy)
+    for vis_name in (ms, copy):
+        fill_model(vis_name, SENTINEL)
+    return ms, copy
+
+
+def test_stokes_to_correlations():
+    stokes = np.array([10.0, 1.0, 2.0, 0.5])
+    circular = stokes_to_correlations(stokes, np.array([5, 6, 7, 8]))
+    np.testing.assert_allclose(circular, [10.5, 1.0 + 2.0j, 1.0 - 2.0j, 9.5])
+    linear = stokes_to_correlations(stokes, np.array([9, 10, 11, 12]))
+    np.testing.assert_allclose(linear, [11.0, 2.0 + 0.5j, 2.0 - 0.5j, 9.0])
+    with pytest.raises(ValueError):
+        stokes_to_correlations(stokes, np.array([5, 13]))
+
+
+@pytest.mark.parametrize("max_chunk_bytes, max_workers", [(256 * 1024**2, 1), (1000, 1), (1000, 2)])
+def test_writer_matches_setjy(ms_pair, synthetic_ms, max_chunk_bytes, max_workers):
+    setjy_ms, writer_ms = ms_pair
+    field = synthetic_ms.pol_angle_field
+    expected_fluxes = setjy(
+        vis=setjy_ms,
+        field=field,
+        standard="manual",
+        scalebychan=True,
+        usescratch=True,
+        **POL_ANGLE_MODEL
+    )
+    writer = ModelWriter(
+        vis_name=writer_ms, max_chunk_bytes=max_chunk_bytes, max_workers=max_workers
+    )
+    fluxes = writer.write(StokesModel.from_setjy(**POL_ANGLE_MODEL), field)
+
+    expected, written = read_model(setjy_ms), read_model(writer_ms)
+    np.testing.assert_allclose(written, expected, rtol=1e-6)
+    # Rows of the other field keep their model
+    assert np.any(written == SENTINEL)
+    for field_id, spws in expected_fluxes.items():
+        if field_id == "format":
+            continue
+        for spw_id, flux in spws.items():
+            np.testing.assert_allclose(
+                fluxes[field_id][spw_id]["fluxd"][:3], flux["fluxd"][:3], rtol=1e-6
+            )
+
+
+def test_writer_only_writes_the_selected_spws(ms_pair, synthetic_ms):
+    _, writer_ms = ms_pair
+    writer = ModelWriter(vis_name=writer_ms)
+    fluxes = writer.write(
+        StokesModel.from_setjy(**POL_ANGLE_MODEL), synthetic_ms.pol_angle_field, spw_ids=[1]
+    )
+    field_id = str(writer.ms_metadata.field_id(synthetic_ms.pol_angle_field))
+    assert list(fluxes[field_id]) == ["1"]
+    with table_pool.open(writer_ms) as tb:
+        dd_ids = tb.getcol("DATA_DESC_ID")
+    written = read_model(writer_ms)
+    assert np.all(written[..., dd_ids == 0] == SENTINEL)
+    assert not np.all(written[..., dd_ids == 1] == SENTINEL)
+    models = writer.correlation_models(StokesModel.from_setjy(**POL_ANGLE_MODEL), [1])
+    assert list(models) == [1]
+
+
+def test_writer_needs_a_single_source(ms):
+    model = StokesModel.batch(
+        [StokesModel.from_setjy(**POL_ANGLE_MODEL),
+         StokesModel.from_setjy(**POL_ANGLE_MODEL)]
+    )
+    with pytest.raises(ValueError):
+        ModelWriter(vis_name=ms).correlation_models(model)
+    with pytest.raises(ValueError):
+        ModelWriter(vis_name=ms, max_chunk_bytes=0)
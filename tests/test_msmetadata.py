@@ -0,0 +1,38 @@
+import os
+import numpy as np
+from ocarina.utils import MSMetadata
+
+
+def test_read(ms, synthetic_ms):
+    metadata = MSMetadata.from_ms(ms)
+    assert metadata.number_spectral_windows == synthetic_ms.n_spws
+    np.testing.assert_array_equal(metadata.channel_frequencies(1), synthetic_ms.frequencies()[1])
+    assert list(metadata.field_names) == [synthetic_ms.pol_angle_field, synthetic_ms.leakage_field]
+    assert not os.path.exists(MSMetadata.snapshot_file(ms))
+
+
+def test_snapshot_round_trip(ms):
+    metadata = MSMetadata.from_ms(ms, persist=True)
+    assert os.path.exists(MSMetadata.snapshot_file(ms))
+    loaded = MSMetadata.load(ms)
+    np.testing.assert_array_equal(loaded.chan_freq, metadata.chan_freq)
+    np.testing.assert_array_equal(loaded.stamps, metadata.stamps)
+
+
+def test_corrupt_snapshot_is_read_again(ms):
+    metadata = MSMetadata.from_ms(ms, persist=True)
+    snapshot_file = MSMetadata.snapshot_file(ms)
+    with open(snapshot_file, "r+b") as snapshot:
+        snapshot.truncate(os.path.getsize(snapshot_file) // 2)
+    assert MSMetadata.load(ms) is None
+    reread = MSMetadata.from_ms(ms, persist=True)
+    np.testing.assert_array_equal(reread.chan_freq, metadata.chan_freq)
+    assert MSMetadata.load(ms) is not None
+
+
+def test_snapshot_of_another_version_is_ignored(ms):
+    MSMetadata.from_ms(ms, persist=True)
+    metadata = MSMetadata.load(ms)
+    metadata.stamps = metadata.stamps - 1
+    metadata.save()
+    assert MSMetadata.load(ms) is None
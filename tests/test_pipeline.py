@@ -0,0 +1,127 @@
+import os
+import shutil
+import pytest
+from ocarina.polarization_calibration import CaltableStore, CalibrationPipeline
+from ocarina.polarization_calibration.pipeline import MODEL_ATTRIBUTES, SELECTION_ATTRIBUTES
+from .conftest import write_caltable
+
+
+class FakeCalibrator:
+    # Records the calibrator methods the pipeline calls; solves write small caltables
+
+    def __init__(self, vis_name: str, n_antennas: int):
+        for attribute in SELECTION_ATTRIBUTES + MODEL_ATTRIBUTES:
+            setattr(self, attribute, None)
+        self.vis_name = vis_name
+        self.n_antennas = n_antennas
+        self.ms_metadata = None
+        self.calls = []
+        self.failing = ()
+
+    def _solve(self, method: str, attribute: str, suffix: str):
+        self.calls.append(method)
+        if method in self.failing:
+            raise RuntimeError(method + " failed")
+        table_name = self.vis_name[:-3] + suffix
+        shutil.rmtree(table_name, ignore_errors=True)
+        write_caltable(table_name, self.vis_name, self.n_antennas)
+        setattr(self, attribute, table_name)
+
+    def set_known_model(self, **kwargs):
+        self.calls.append("set_known_model")
+
+    def solve_cross_hands_delay(self, **kwargs):
+        self._solve("solve_cross_hands_delay", "k_cross_table", ".Kcross")
+
+    def calibrate_leakage(self, **kwargs):
+        self._solve("calibrate_leakage", "leakage_table", ".D0")
+
+    def calibrate_pol_angle(self, **kwargs):
+        self._solve("calibrate_pol_angle", "pol_angle_table", ".X0")
+
+    def apply_solutions(self, **kwargs):
+        self.calls.append("apply_solutions")
+
+
+def make_pipeline(vis_name: str, leakage: dict = None, **kwargs):
+    calibrator = FakeCalibrator(vis_name, n_antennas=5)
+    return CalibrationPipeline.polarization_chain(
+        calibrator=calibrator,
+        known_model={"standard": "Perley-Butler 2017"},
+        leakage=leakage,
+        **kwargs
+    )
+
+
+def test_unchanged_steps_are_skipped(ms):
+    statuses = make_pipeline(ms).run()
+    assert set(statuses.values()) == {"done"}
+    pipeline = make_pipeline(ms)
+    statuses = pipeline.run()
+    # The model is written again, but the solves using it are still up to date
+    assert pipeline.calibrator.calls == ["set_known_model"]
+    assert statuses == {
+        "known_model": "done",
+        "k_cross": "skipped",
+        "leakage": "skipped",
+        "pol_angle": "skipped",
+        "apply": "skipped"
+    }
+    assert pipeline.calibrator.leakage_table == ms[:-3] + ".D0"
+
+
+def test_changed_arguments_rerun_downstream_steps(ms):
+    make_pipeline(ms).run()
+    pipeline = make_pipeline(ms, leakage={"solint": "60s"})
+    statuses = pipeline.run()
+    assert statuses["k_cross"] == "skipped"
+    assert [statuses[name] for name in ("leakage", "pol_angle", "apply")] == ["done"] * 3
+
+
+def test_changed_output_reruns_its_consumers(ms):
+    make_pipeline(ms).run()
+    shutil.rmtree(ms[:-3] + ".D0")
+    statuses = make_pipeline(ms).run()
+    assert statuses["k_cross"] == "skipped"
+    assert [statuses[name] for name in ("leakage", "pol_angle", "apply")] == ["done"] * 3
+
+
+def test_forced_steps_run(ms):
+    make_pipeline(ms).run()
+    statuses = make_pipeline(ms).run(force=["pol_angle"])
+    assert statuses["leakage"] == "skipped"
+    assert statuses["pol_angle"] == "done" and statuses["apply"] == "done"
+
+
+def test_failures_block_downstream_steps(ms):
+    pipeline = make_pipeline(ms)
+    pipeline.calibrator.failing = ("calibrate_leakage", )
+    with pytest.raises(RuntimeError):
+        pipeline.run()
+    assert pipeline.state["leakage"]["status"] == "failed"
+    assert "pol_angle" not in pipeline.state and "apply" not in pipeline.state
+    # The failed step and its consumers run again on the next run
+    statuses = make_pipeline(ms).run()
+    assert statuses["k_cross"] == "skipped" and statuses["leakage"] == "done"
+
+
+def test_solves_are_restored_from_the_store(tmp_path, ms):
+    store = CaltableStore(store_dir=str(tmp_path / "store"))
+    make_pipeline(ms, caltable_store=store).run()
+    copy = str(tmp_path / "copy.ms")
+    shutil.copytree(ms, copy)
+    pipeline = make_pipeline(copy, caltable_store=store)
+    statuses = pipeline.run()
+    assert pipeline.calibrator.calls == ["set_known_model", "apply_solutions"]
+    assert [statuses[name] for name in ("k_cross", "leakage", "pol_angle")] == ["restored"] * 3
+    assert os.path.exists(os.path.join(copy[:-3] + ".D0", "table.dat"))
+
+
+def test_invalid_steps(ms):
+    pipeline = make_pipeline(ms)
+    with pytest.raises(ValueError):
+        pipeline.add_step("leakage", "calibrate_leakage")
+    with pytest.raises(ValueError):
+        pipeline.add_step("other", "not_a_method")
+    with pytest.raises(ValueError):
+        pipeline.add_step("other", "calibrate_leakage", depends_on=["unknown"])
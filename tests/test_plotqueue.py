@@ -0,0 +1,43 @@
+import pytest
+from ocarina.polarization_calibration.plotqueue import PlotQueue
+
+
+def write_plot(plotfile: str = ""):
+    with open(plotfile, "w") as plot:
+        plot.write("plot")
+
+
+def fail(plotfile: str = ""):
+    raise RuntimeError("cannot plot " + plotfile)
+
+
+def test_sync_renders_on_submit(tmp_path):
+    queue = PlotQueue(mode="sync")
+    spec = queue.submit(write_plot, plotfile=str(tmp_path / "a.png"))
+    assert (tmp_path / "a.png").exists() and spec.plot_files == [str(tmp_path / "a.png")]
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_deferred_plots(tmp_path, asynchronous):
+    queue = PlotQueue(mode="deferred", max_workers=1)
+    plot_files = [str(tmp_path / name) for name in ("a.png", "b.png")]
+    specs = [queue.submit(write_plot, plotfile=plot_file) for plot_file in plot_files]
+    assert not any((tmp_path / name).exists() for name in ("a.png", "b.png"))
+    assert queue.render_deferred(asynchronous=asynchronous) == specs
+    assert queue.specs == []
+    assert queue.wait() == []
+    assert all((tmp_path / name).exists() for name in ("a.png", "b.png"))
+    queue.shutdown()
+
+
+def test_async_failures_are_reported_by_wait(tmp_path):
+    queue = PlotQueue(mode="async", max_workers=1)
+    queue.submit(write_plot, plotfile=str(tmp_path / "a.png"))
+    failed = queue.submit(fail, plotfile=str(tmp_path / "b.png"))
+    assert queue.wait() == [failed]
+    queue.shutdown()
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        PlotQueue(mode="later")
@@ -0,0 +1,52 @@
+import astropy.units as un
+import numpy as np
+from ocarina.functions import horner
+from ocarina.polarized_sources import PolarizedSource
+
+COEFFICIENTS = np.array([1.2481, -0.4507, -0.1798, 0.0357])
+ERRORS = np.array([0.003, 0.001, 0.001, 0.001])
+NU = np.linspace(1.0, 8.0, 15) * un.GHz
+
+
+def test_reexpansion_describes_the_same_spectrum():
+    nu_0 = 3.0 * un.GHz
+    reexpanded, _ = PolarizedSource.reexpand_coefficients(COEFFICIENTS, nu_0=nu_0)
+    log_nu_div = np.log10((NU / nu_0).value)
+    np.testing.assert_allclose(
+        10.0**horner(log_nu_div, reexpanded),
+        PolarizedSource.flux_giving_coefficients(NU, COEFFICIENTS)
+    )
+    np.testing.assert_allclose(
+        10.0**reexpanded[0], PolarizedSource.flux_scalar_giving_coefficients(nu_0, COEFFICIENTS)
+    )
+
+
+def test_reexpansion_at_one_ghz_is_the_identity():
+    reexpanded, errors = PolarizedSource.reexpand_coefficients(COEFFICIENTS, ERRORS, nu_0=1.0)
+    np.testing.assert_allclose(reexpanded, COEFFICIENTS)
+    np.testing.assert_allclose(errors, ERRORS)
+
+
+def test_reexpansion_propagates_errors_linearly():
+    nu_0 = 3.0
+    _, covariance = PolarizedSource.reexpand_coefficients(
+        COEFFICIENTS, ERRORS, nu_0=nu_0, return_covariance=True
+    )
+    # The map is linear, so its columns are the images of the unit vectors
+    transform = np.stack(
+        [
+            PolarizedSource.reexpand_coefficients(unit, nu_0=nu_0)[0]
+            for unit in np.eye(len(COEFFICIENTS))
+        ],
+        axis=-1
+    )
+    np.testing.assert_allclose(covariance, transform @ np.diag(ERRORS**2) @ transform.T)
+    _, errors = PolarizedSource.reexpand_coefficients(COEFFICIENTS, ERRORS, nu_0=nu_0)
+    np.testing.assert_allclose(errors, np.sqrt(np.diag(covariance)))
+
+
+def test_catalog_source_is_loaded():
+    source = PolarizedSource(source="3c286")
+    assert source.source == "3C286"
+    assert source.nu.unit == un.Hz and source.pol_angle.unit == un.rad
+    assert len(source.nu) == len(source.pol_angle) == len(source.pol_fraction)
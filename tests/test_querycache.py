@@ -0,0 +1,108 @@
+import os
+import numpy as np
+import pytest
+from collections import OrderedDict
+from ocarina.utils import QueryCache, QueryResult, query_table
+
+QUERY = "select * from {0} where SPECTRAL_WINDOW_ID=0"
+
+
+def touch(table_name: str):
+    table_file = os.path.join(table_name, "table.dat")
+    stat = os.stat(table_file)
+    os.utime(table_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def counting_query(query: str, table_name: str, calls: list):
+
+    def run_query():
+        calls.append(query)
+        return query_table(query, table_name)
+
+    return run_query
+
+
+def test_results_match_the_live_query(caltable):
+    cache = QueryCache()
+    query = QUERY.format(caltable)
+    calls = []
+    first = cache.get(caltable, query, counting_query(query, caltable, calls))
+    second = cache.get(caltable, query, counting_query(query, caltable, calls))
+    assert second is first and len(calls) == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    live = query_table(query, caltable)
+    np.testing.assert_array_equal(first.rownumbers(), live.rownumbers())
+    np.testing.assert_array_equal(first.getcol("CPARAM"), live.getcol("CPARAM"))
+    np.testing.assert_array_equal(first.getvarcol("CPARAM")["r1"], live.getvarcol("CPARAM")["r1"])
+    live.close()
+
+
+def test_changed_table_runs_the_query_again(caltable):
+    cache = QueryCache()
+    query = QUERY.format(caltable)
+    calls = []
+    cache.get(caltable, query, counting_query(query, caltable, calls))
+    touch(caltable)
+    cache.get(caltable, query, counting_query(query, caltable, calls))
+    assert len(calls) == 2
+    # The result for the old stamp is dropped
+    assert cache.stats()["entries"] == 1
+
+
+def test_results_survive_on_disk(tmp_path, caltable):
+    query = QUERY.format(caltable)
+    cache_dir = str(tmp_path / "queries")
+    expected = QueryCache(cache_dir=cache_dir
+                          ).get(caltable, query, counting_query(query, caltable, []))
+
+    def fail():
+        raise AssertionError("the query should be read from disk")
+
+    result = QueryCache(cache_dir=cache_dir).get(caltable, query, fail)
+    np.testing.assert_array_equal(result.getcol("CPARAM"), expected.getcol("CPARAM"))
+
+    touch(caltable)
+    calls = []
+    QueryCache(cache_dir=cache_dir).get(caltable, query, counting_query(query, caltable, calls))
+    assert len(calls) == 1
+    assert len(list((tmp_path / "queries").glob("*.npz"))) == 1
+
+
+def test_variable_shape_columns_round_trip(tmp_path):
+    cells = OrderedDict(
+        [("r1", np.arange(6.0).reshape(2, 3, 1)), ("r2", np.arange(4.0).reshape(2, 2, 1))]
+    )
+    result = QueryResult(
+        OrderedDict([("DATA", cells), ("TIME", np.array([1.0, 2.0]))]), np.arange(2)
+    )
+    with pytest.raises(RuntimeError):
+        result.getcol("DATA")
+    cache_file = tmp_path / "result.npz"
+    cache_file.write_bytes(result.to_bytes())
+    loaded = QueryResult.from_file(str(cache_file))
+    assert loaded.colnames() == ["DATA", "TIME"]
+    for key, cell in cells.items():
+        np.testing.assert_array_equal(loaded.getvarcol("DATA")[key], cell)
+    np.testing.assert_array_equal(loaded.getcol("TIME"), [1.0, 2.0])
+
+
+def test_memory_is_bounded(caltable):
+    query = QUERY.format(caltable)
+    result = QueryCache().get(caltable, query, counting_query(query, caltable, []))
+    cache = QueryCache(max_bytes=result.nbytes)
+    cache.get(caltable, query, counting_query(query, caltable, []))
+    other_query = "select * from {0} where SPECTRAL_WINDOW_ID=1".format(caltable)
+    cache.get(caltable, other_query, counting_query(other_query, caltable, []))
+    stats = cache.stats()
+    assert stats["entries"] == 1 and stats["evictions"] == 1
+    assert stats["bytes"] <= cache.max_bytes
+
+
+def test_query_table_uses_the_cache(caltable):
+    cache = QueryCache()
+    query = QUERY.format(caltable)
+    first = query_table(query, caltable, cache=cache)
+    assert query_table(query, caltable, cache=cache) is first
+    with pytest.raises(ValueError):
+        query_table()
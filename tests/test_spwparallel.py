@@ -0,0 +1,86 @@
+import os
+import numpy as np
+import pytest
+from casatasks import polcal
+from ocarina.polarization_calibration.spwparallel import (
+    merge_caltables, solve_polcal_by_spw, spw_groups
+)
+from ocarina.utils import table_pool
+from .conftest import write_caltable
+
+
+def read_solutions(cal_table: str) -> dict:
+    with table_pool.open(cal_table) as tb:
+        solutions = {
+            column: tb.getcol(column)
+            for column in ("SPECTRAL_WINDOW_ID", "ANTENNA1", "CPARAM")
+        }
+    with table_pool.open(os.path.join(cal_table, "SPECTRAL_WINDOW")) as tb:
+        solutions["FLAG_ROW"] = tb.getcol("FLAG_ROW")
+    table_pool.close(cal_table)
+    return solutions
+
+
+def test_spw_groups():
+    assert spw_groups(np.arange(5), 2) == ["0~2", "3~4"]
+    assert spw_groups(np.array([0, 2, 3]), 2) == ["0,2", "3~3"]
+    assert spw_groups(np.arange(2), 4) == ["0~0", "1~1"]
+
+
+def test_merge_caltables(tmp_path, ms, synthetic_ms):
+    cal_table = str(tmp_path / "merged.D0")
+    partial_tables = [
+        write_caltable(cal_table + ".spw" + str(spw), ms, synthetic_ms.n_antennas, spw_ids=(spw, ))
+        for spw in range(synthetic_ms.n_spws)
+    ]
+    expected = write_caltable(
+        str(tmp_path / "expected.D0"), ms, synthetic_ms.n_antennas, range(synthetic_ms.n_spws)
+    )
+    # Each partial table marks the spws it did not solve as flagged
+    assert np.any(read_solutions(partial_tables[0])["FLAG_ROW"])
+
+    assert merge_caltables(partial_tables + [cal_table + ".missing"], cal_table) == cal_table
+    assert not any(os.path.exists(table) for table in partial_tables)
+    merged, expected = read_solutions(cal_table), read_solutions(expected)
+    for column in expected:
+        np.testing.assert_array_equal(merged[column], expected[column])
+    assert not np.any(merged["FLAG_ROW"])
+
+
+def test_merge_without_tables(tmp_path):
+    cal_table = str(tmp_path / "merged.D0")
+    assert merge_caltables([cal_table + ".spw0"], cal_table) == cal_table
+    assert not os.path.exists(cal_table)
+
+
+def test_solve_by_spw_matches_a_single_solve(tmp_path, ms, synthetic_ms):
+    polcal_kwargs = {
+        "vis": ms,
+        "field": synthetic_ms.leakage_field,
+        "refant": "0",
+        "poltype": "Df",
+        "caltable": str(tmp_path / "single.D0")
+    }
+    polcal(**polcal_kwargs)
+    polcal_kwargs["caltable"] = str(tmp_path / "parallel.D0")
+    solve_polcal_by_spw(polcal_kwargs, np.arange(synthetic_ms.n_spws), n_groups=2, max_workers=2)
+    single, parallel = read_solutions(str(tmp_path / "single.D0")), \
+        read_solutions(polcal_kwargs["caltable"])
+    for column in single:
+        np.testing.assert_allclose(parallel[column], single[column], rtol=1e-6)
+
+
+def test_failed_groups_leave_no_table(tmp_path, ms, synthetic_ms):
+    polcal_kwargs = {
+        "vis": ms,
+        "field": synthetic_ms.leakage_field,
+        "refant": "0",
+        "poltype": "G",
+        "caltable": str(tmp_path / "parallel.D0")
+    }
+    with pytest.raises(RuntimeError):
+        solve_polcal_by_spw(
+            polcal_kwargs, np.arange(synthetic_ms.n_spws), n_groups=2, max_workers=1
+        )
+    # A partial table would pass for a complete one
+    assert not any(name.startswith("parallel.D0") for name in os.listdir(str(tmp_path)))
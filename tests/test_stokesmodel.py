@@ -0,0 +1,49 @@
+import numpy as np
+from ocarina.functions import StokesModel
+
+NU = np.linspace(1.0e9, 2.0e9, 8)
+
+
+def test_single_source_matches_setjy_formula():
+    model = StokesModel.from_setjy(
+        fluxdensity=[2.0, 0, 0, 0],
+        spix=[-0.7, -0.1],
+        reffreq="1.5GHz",
+        polindex=[0.1, 0.02],
+        polangle=[0.5, 0.1]
+    )
+    stokes = model.evaluate(NU)
+    y = np.log10(NU / 1.5e9)
+    x = NU / 1.5e9 - 1.0
+    intensity = 2.0 * 10.0**(y * (-0.7 - 0.1 * y))
+    linear = (0.1 + 0.02 * x) * intensity
+    angle = 0.5 + 0.1 * x
+    np.testing.assert_allclose(stokes[0], intensity)
+    np.testing.assert_allclose(stokes[1], linear * np.cos(2.0 * angle))
+    np.testing.assert_allclose(stokes[2], linear * np.sin(2.0 * angle))
+    np.testing.assert_array_equal(stokes[3], 0.0)
+
+
+def test_batch_matches_single_sources():
+    models = [
+        StokesModel(nu_0=1.5e9, intensity=2.0, spectral_index=[-0.7], pol_fraction=[0.1]),
+        StokesModel(
+            nu_0=1.2e9,
+            intensity=1.0,
+            spectral_index=[-0.5, 0.1],
+            pol_fraction=[0.05, 0.01],
+            pol_angle=[0.3]
+        )
+    ]
+    stokes = StokesModel.batch(models).evaluate(NU)
+    for i, model in enumerate(models):
+        np.testing.assert_allclose(stokes[:, i], model.evaluate(NU))
+
+
+def test_batch_of_unpolarized_sources():
+    model = StokesModel(intensity=np.array([1.0, 2.0]), spectral_index=[[-0.7], [-0.5]])
+    assert model.pol_fraction.shape == (2, 0) and model.pol_angle.shape == (2, 0)
+    stokes = model.evaluate(NU)
+    assert stokes.shape == (4, 2, len(NU))
+    np.testing.assert_array_equal(stokes[1:], 0.0)
+    np.testing.assert_allclose(stokes[0, 1], 2.0 * (NU / 1.0e9)**-0.5)
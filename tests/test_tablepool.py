@@ -0,0 +1,74 @@
+import gc
+import os
+import threading
+import pytest
+from ocarina.utils import TablePool
+
+
+def test_handles_are_reused(caltable):
+    pool = TablePool()
+    with pool.open(caltable) as tb:
+        first = tb
+    with pool.open(caltable) as tb:
+        assert tb is first
+    assert (pool.opens, pool.hits) == (1, 1)
+
+
+def test_changed_table_is_reopened(caltable):
+    pool = TablePool()
+    with pool.open(caltable) as tb:
+        first = tb
+    table_file = os.path.join(caltable, "table.dat")
+    stat = os.stat(table_file)
+    os.utime(table_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    with pool.open(caltable) as tb:
+        assert tb is not first
+        assert tb.nrows() > 0
+    assert first.name() is None
+    assert pool.opens == 2
+
+
+def test_missing_table(tmp_path):
+    with pytest.raises(ValueError):
+        with TablePool().open(str(tmp_path / "missing.tb")):
+            pass
+
+
+def test_eviction_keeps_handles_in_use(ms, caltable):
+    pool = TablePool(max_handles=1)
+    with pool.open(caltable) as calibration:
+        with pool.open(ms) as data:
+            assert calibration.nrows() > 0
+            assert data.nrows() > 0
+    # The next open evicts the least recently used handle, which is idle by now
+    with pool.open(ms):
+        pass
+    assert calibration.name() is None
+    assert (pool.opens, pool.hits) == (2, 1)
+
+
+def test_close_all_leaves_other_threads(caltable):
+    pool = TablePool()
+    opened = threading.Event()
+    closed = threading.Event()
+    handles = []
+
+    def worker():
+        with pool.open(caltable) as tb:
+            handles.append(tb)
+        opened.set()
+        closed.wait()
+        handles.append(tb.name())
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    opened.wait()
+    with pool.open(caltable) as tb:
+        own = tb
+    pool.close_all()
+    closed.set()
+    thread.join()
+    assert own.name() is None
+    assert handles[1] == caltable
+    gc.collect()
+    assert handles[0].name() is None
@@ -0,0 +1,67 @@
+import json
+import pickle
+import numpy as np
+import pytest
+from ocarina.utils import LazyObject, Tracer, current_tracer, traced
+from .conftest import POL_ANGLE_MODEL
+
+
+@traced("fit")
+def fit(data: np.ndarray):
+    return data.sum()
+
+
+def test_traced_functions_only_record_while_active():
+    tracer = Tracer()
+    fit(np.ones(3))
+    assert tracer.records == []
+    with tracer.activate():
+        assert current_tracer() is tracer
+        fit(np.ones((2, 3)))
+    assert current_tracer() is None
+    record, = tracer.records
+    assert record["name"] == "fit" and record["category"] == "fit"
+    assert record["attributes"]["shapes"] == [[2, 3]]
+    assert record["wall_s"] >= 0.0 and record["status"] == "ok"
+
+
+def test_spans_nest_and_record_errors(tmp_path):
+    trace_file = str(tmp_path / "trace.jsonl")
+    tracer = Tracer(trace_file=trace_file)
+    with tracer.activate():
+        with tracer.span("step") as step:
+            with pytest.raises(ValueError):
+                with tracer.span("inner"):
+                    raise ValueError("bad input")
+    inner, outer = tracer.records
+    assert inner["parent"] == step["span"] and inner["depth"] == 1
+    assert inner["status"] == "error" and inner["error"] == "ValueError: bad input"
+    assert outer["status"] == "ok"
+    with open(trace_file) as trace_input:
+        assert [json.loads(line)["name"] for line in trace_input] == ["inner", "step"]
+    summary = tracer.summary()
+    assert summary["inner"]["errors"] == 1 and summary["step"]["calls"] == 1
+
+
+def test_casa_tasks_are_traced(ms, synthetic_ms):
+    tracer = Tracer()
+    setjy = LazyObject("casatasks", "setjy")
+    with tracer.activate():
+        setjy(vis=ms, field=synthetic_ms.pol_angle_field, standard="manual", **POL_ANGLE_MODEL)
+    task, outputs = tracer.records
+    assert task["name"] == "setjy" and task["category"] == "task"
+    assert task["attributes"]["inputs"]["rows"] == synthetic_ms.n_rows
+    assert task["attributes"]["selection"] == {"field": synthetic_ms.pol_angle_field}
+    assert outputs["span"] == task["span"]
+
+
+def test_copies_for_workers_keep_the_trace_file(tmp_path):
+    tracer = Tracer(trace_file=str(tmp_path / "trace.jsonl"))
+    with tracer.activate():
+        fit(np.ones(3))
+    copy = pickle.loads(pickle.dumps(tracer))
+    assert copy.trace_file == tracer.trace_file and copy.records == []
+    with copy.activate():
+        fit(np.ones(3))
+    with open(tracer.trace_file) as trace_input:
+        assert len(trace_input.readlines()) == 2
@@ -0,0 +1,47 @@
+import numpy as np
+from ocarina.functions import StokesModel, draw_coefficients, monte_carlo_stokes
+
+NU = np.linspace(1.0e9, 2.0e9, 5)
+POLARIZED = StokesModel(
+    nu_0=1.5e9, intensity=2.0, spectral_index=[-0.7], pol_fraction=[0.1], pol_angle=[0.5]
+)
+
+
+def test_draws_follow_the_covariance():
+    covariance = np.array([[0.04, 0.01], [0.01, 0.09]])
+    draws = draw_coefficients([1.0, -0.5], covariance, n_draws=200000, rng=np.random.default_rng(1))
+    np.testing.assert_allclose(np.mean(draws, axis=0), [1.0, -0.5], atol=5e-3)
+    np.testing.assert_allclose(np.cov(draws.T), covariance, atol=2e-3)
+
+
+def test_unpolarized_model():
+    model = StokesModel(nu_0=1.5e9, intensity=2.0, spectral_index=[-0.7])
+    uncertainty = monte_carlo_stokes(
+        model, NU, spectral_covariance=np.diag([0.01**2, 0.05**2]), n_draws=500, seed=3
+    )
+    assert uncertainty.std.shape == (4, len(NU))
+    assert np.all(uncertainty.std[0] > 0.0)
+    np.testing.assert_array_equal(uncertainty.std[1:], 0.0)
+    np.testing.assert_array_equal(uncertainty.covariance[1:], 0.0)
+
+
+def test_without_covariances_the_model_is_fixed():
+    uncertainty = monte_carlo_stokes(POLARIZED, NU, n_draws=50, seed=0)
+    np.testing.assert_allclose(uncertainty.mean, POLARIZED.evaluate(NU))
+    np.testing.assert_allclose(uncertainty.std, 0.0, atol=1e-12)
+
+
+def test_seed_reproducibility():
+    kwargs = dict(
+        spectral_covariance=np.diag([0.01**2, 0.05**2]),
+        pol_fraction_covariance=np.array([[1e-4]]),
+        pol_angle_covariance=np.array([[1e-3]]),
+        n_draws=300
+    )
+    first = monte_carlo_stokes(POLARIZED, NU, seed=7, **kwargs)
+    second = monte_carlo_stokes(POLARIZED, NU, seed=7, **kwargs)
+    other = monte_carlo_stokes(POLARIZED, NU, seed=8, **kwargs)
+    np.testing.assert_array_equal(first.bands, second.bands)
+    np.testing.assert_array_equal(first.covariance, second.covariance)
+    assert not np.array_equal(first.bands, other.bands)
+    np.testing.assert_array_equal(first.band(50.0), first.bands[2])